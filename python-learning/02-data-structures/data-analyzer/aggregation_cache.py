@@ -0,0 +1,117 @@
+"""
+Aggregation Cache
+Groupby results computed once per dataset and shared by every analysis
+"""
+
+import weakref
+
+
+class AggregationCache:
+    """Memoized groupby aggregations, keyed by dataset and grouping spec.
+
+    A dataset is identified by the DataFrame object itself plus a version
+    counter, so every analysis of the same loaded frame shares results,
+    while a newly loaded frame starts fresh. Entries of a frame are
+    dropped as soon as the frame is garbage collected. Pandas cannot
+    report in-place edits, so code that modifies a frame must call
+    invalidate(df) afterwards.
+
+    Each (keys, value column) spec is grouped once, computing sum, mean
+    and count together; consumers select the statistic they need. The
+    returned frames are shared, so treat them as read-only.
+    """
+
+    def __init__(self):
+        """Create an empty cache."""
+        self.entries = {}  # {(dataset id, version, spec): result}
+        self.versions = {}  # {dataset id: version} for frames still alive
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def dataset_key(self, df):
+        """Identify the current version of a frame, tracking new ones."""
+        dataset_id = id(df)
+        if dataset_id not in self.versions:
+            self.versions[dataset_id] = 0
+            # Ids are reused after collection, so forget the frame with it
+            weakref.finalize(df, self.forget, dataset_id)
+        return dataset_id, self.versions[dataset_id]
+
+    def lookup(self, df, spec, compute):
+        """Get a cached result, computing and storing it on a miss."""
+        key = (*self.dataset_key(df), spec)
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        result = compute()
+        self.entries[key] = result
+        return result
+
+    def aggregate(self, df, keys, value_column='Sales'):
+        """Sum, mean and count of a column per group.
+
+        Args:
+            df: DataFrame to aggregate
+            keys: Column name or list of names to group by
+            value_column: Column to aggregate
+
+        Returns:
+            DataFrame with "sum", "mean" and "count" columns, one row per
+            group that occurs in df
+        """
+        keys = (keys,) if isinstance(keys, str) else tuple(keys)
+
+        def compute():
+            by = keys[0] if len(keys) == 1 else list(keys)
+            return df.groupby(by, observed=True)[value_column].agg(['sum', 'mean', 'count'])
+
+        return self.lookup(df, ('aggregate', keys, value_column), compute)
+
+    def pivot(self, df, index, columns, value_column='Sales'):
+        """Totals of a column as an index x columns table (0 where empty).
+
+        Built from the cached two-key aggregation, so it costs no extra
+        pass over df once the (index, columns) grouping exists.
+        """
+        def compute():
+            totals = self.aggregate(df, [index, columns], value_column)['sum']
+            return totals.unstack(columns, fill_value=0)
+
+        return self.lookup(df, ('pivot', index, columns, value_column), compute)
+
+    def invalidate(self, df):
+        """Discard a frame's results after it was modified in place."""
+        dataset_id = id(df)
+        if dataset_id in self.versions:
+            self.versions[dataset_id] += 1
+            self.drop(dataset_id)
+            self.invalidations += 1
+
+    def forget(self, dataset_id):
+        """Drop everything about a frame that no longer exists."""
+        self.versions.pop(dataset_id, None)
+        self.drop(dataset_id)
+
+    def drop(self, dataset_id):
+        """Remove the entries computed from one frame."""
+        for key in [key for key in self.entries if key[0] == dataset_id]:
+            del self.entries[key]
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        self.entries.clear()
+        self.hits = self.misses = self.invalidations = 0
+
+    def stats(self):
+        """Get counters for inspecting how much work was shared."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "datasets": len(self.versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,158 @@
+"""
+Chart Rendering
+Headless matplotlib charts, drawn in parallel worker processes
+"""
+
+import multiprocessing
+import os
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Charts are only ever saved to files (pandas plotting goes through
+# pyplot), so never open a GUI backend
+matplotlib.use("Agg")
+
+TIME_SERIES_FIGSIZE = (12, 6)
+MARKER_LIMIT = 100  # above this many points markers only blur the line
+
+
+def available_cpus():
+    """Count the CPUs this process may run on (respects affinity/cgroups)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def supported_formats():
+    """File formats the Agg canvas can write (png, svg, pdf, ...)."""
+    return sorted(FigureCanvasAgg(Figure()).get_supported_filetypes())
+
+
+def new_figure(figsize):
+    """Create a figure on an Agg canvas, without touching pyplot state."""
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def draw_sales_by_product(product_sales):
+    """Bar chart of total sales per product (sorted Series)."""
+    figure = new_figure((10, 6))
+    ax = figure.add_subplot()
+    product_sales.plot(kind='bar', color='steelblue', ax=ax)
+    ax.set_title('Total Sales by Product', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Product', fontsize=12)
+    ax.set_ylabel('Total Sales ($)', fontsize=12)
+    ax.tick_params(axis='x', rotation=45)
+    ax.grid(axis='y', alpha=0.3)
+    figure.tight_layout()
+    return figure
+
+
+def draw_sales_by_region(region_sales):
+    """Pie chart of each region's share of sales (Series)."""
+    figure = new_figure((8, 8))
+    ax = figure.add_subplot()
+    ax.pie(region_sales, labels=region_sales.index, autopct='%1.1f%%',
+           startangle=90, colors=['#ff9999', '#66b3ff', '#99ff99', '#ffcc99'])
+    ax.set_title('Sales Distribution by Region', fontsize=16, fontweight='bold')
+    figure.tight_layout()
+    return figure
+
+
+def draw_sales_over_time(series):
+    """Line chart of sales over time ((dates, sales) arrays in date order)."""
+    dates, sales = series
+    figure = new_figure(TIME_SERIES_FIGSIZE)
+    ax = figure.add_subplot()
+    marker = 'o' if len(dates) <= MARKER_LIMIT else None
+    ax.plot(dates, sales, marker=marker, linewidth=2 if marker else 1, markersize=8)
+    ax.set_title('Sales Over Time', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Sales ($)', fontsize=12)
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', rotation=45)
+    figure.tight_layout()
+    return figure
+
+
+def draw_sales_comparison(pivot_data):
+    """Grouped bar chart of product totals per region (Product x Region table)."""
+    figure = new_figure((12, 6))
+    ax = figure.add_subplot()
+    pivot_data.plot(kind='bar', width=0.8, ax=ax)
+    ax.set_title('Sales Comparison: Products by Region', fontsize=16, fontweight='bold')
+    ax.set_xlabel('Product', fontsize=12)
+    ax.set_ylabel('Sales ($)', fontsize=12)
+    ax.legend(title='Region', bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.tick_params(axis='x', rotation=45)
+    ax.grid(axis='y', alpha=0.3)
+    figure.tight_layout()
+    return figure
+
+
+CHARTS = {
+    'sales_by_product': draw_sales_by_product,
+    'sales_by_region': draw_sales_by_region,
+    'sales_over_time': draw_sales_over_time,
+    'sales_comparison': draw_sales_comparison,
+}
+
+
+def save_figure(figure, path, fmt, dpi):
+    """Save a figure so readers never see a half-written file.
+
+    The image is written next to its final name and then renamed over it.
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        figure.savefig(temp_path, format=fmt, dpi=dpi)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def render_chart(task):
+    """Draw and save one chart (runs in a worker or inline).
+
+    Args:
+        task: (chart name, chart data, output directory, format, dpi)
+
+    Returns:
+        Path of the written file
+    """
+    name, data, output_dir, fmt, dpi = task
+    path = os.path.join(output_dir, f"{name}.{fmt}")
+    save_figure(CHARTS[name](data), path, fmt, dpi)
+    return path
+
+
+def render_charts(chart_data, output_dir=".", fmt="png", dpi=100, workers=None):
+    """Render several charts at once, one process per chart.
+
+    Only the small, already aggregated inputs are sent to the workers,
+    so the cost of starting them is paid back by drawing in parallel.
+
+    Args:
+        chart_data: {chart name: data for its draw function}
+        output_dir: Folder for the files (created if missing)
+        fmt: Image format, e.g. "png", "svg" or "pdf"
+        dpi: Resolution of raster formats
+        workers: Processes (default: CPUs available, at most one per chart)
+
+    Returns:
+        List of written paths, in the order of chart_data
+    """
+    if fmt not in supported_formats():
+        raise ValueError(f"Unsupported format: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(name, data, output_dir, fmt, dpi) for name, data in chart_data.items()]
+    workers = min(workers or available_cpus(), len(tasks))
+
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            return pool.map(render_chart, tasks)
+    return [render_chart(task) for task in tasks]
@@ -0,0 +1,84 @@
+"""
+Columnar Cache
+Parquet copies of CSV files, reused until the CSV changes
+"""
+
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # the cache is optional; load_data falls back to the CSV
+    pa = pq = None
+
+CACHE_DIR = ".cache"
+SOURCE_SIZE_KEY = b"data_analyzer.source_size"
+SOURCE_MTIME_KEY = b"data_analyzer.source_mtime_ns"
+# Small enough that min/max statistics let filtered reads skip row groups
+ROW_GROUP_SIZE = 100_000
+
+
+def cache_available():
+    """Check whether pyarrow is installed so caching can work."""
+    return pq is not None
+
+
+def cache_path(filename):
+    """Path of the Parquet copy of a CSV (in a .cache folder beside it)."""
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIR, f"{name}.parquet")
+
+
+def source_signature(filename):
+    """Size and modification time that identify a version of the CSV."""
+    info = os.stat(filename)
+    return str(info.st_size).encode(), str(info.st_mtime_ns).encode()
+
+
+def is_fresh(filename):
+    """Check whether a cache exists and was written from the current CSV."""
+    if pq is None:
+        return False
+    path = cache_path(filename)
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    size, mtime = source_signature(filename)
+    return metadata.get(SOURCE_SIZE_KEY) == size and metadata.get(SOURCE_MTIME_KEY) == mtime
+
+
+def read_cache(filename, columns=None):
+    """Read the cached copy, only loading the requested columns.
+
+    Args:
+        filename: The original CSV file
+        columns: Column names to load (None for all)
+
+    Returns:
+        DataFrame with the dtypes it had when cached
+    """
+    return pq.read_table(cache_path(filename), columns=columns).to_pandas()
+
+
+def write_cache(filename, df):
+    """Write a DataFrame as the cached copy of a CSV.
+
+    The CSV's size and mtime are stored in the file's metadata, so any
+    later change to the CSV makes the copy stale. The file is written
+    next to its final name and renamed, so readers never see half of it.
+    """
+    path = cache_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size, mtime = source_signature(filename)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}), SOURCE_SIZE_KEY: size, SOURCE_MTIME_KEY: mtime,
+    })
+    temp_path = f"{path}.tmp"
+    try:
+        pq.write_table(table, temp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -1,5 +1,20 @@
+import argparse
+import logging
+import sys
+
 import pandas as pd
-import matplotlib.pyplot as plt
+
+import columnar_cache
+from aggregation_cache import AggregationCache
+from chart_rendering import TIME_SERIES_FIGSIZE, render_chart, render_charts, supported_formats
+from downsampling import MODES as TIME_MODES
+from downsampling import RESAMPLE_RULES, downsample
+from sales_dataset import SalesDataset, SalesFilter
+from sales_schema import NUMERIC_COLUMNS, optimize_dtypes
+from streaming_stats import GroupAccumulator, PeriodTotals, RunningStats
+
+# Groupby results shared by every analysis and chart of a loaded frame
+aggregations = AggregationCache()
 
 def create_sample_data():
     """Create a sample CSV file with sales data."""
@@ -20,17 +35,63 @@ def create_sample_data():
     return df
 
 
-def load_data(filename):
+def memory_report(before, after):
+    """Display memory used per column before and after a conversion."""
+    mb = 1024 * 1024
+    usage = pd.DataFrame({
+        'Before (MB)': before.memory_usage(deep=True, index=False) / mb,
+        'After (MB)': after.memory_usage(deep=True, index=False) / mb,
+        'Before dtype': before.dtypes.astype(str),
+        'After dtype': after.dtypes.astype(str),
+    })
+    total_before = usage['Before (MB)'].sum()
+    total_after = usage['After (MB)'].sum()
+    print("\n=== MEMORY USAGE ===")
+    print(usage.round(3))
+    saving = total_before / total_after if total_after else 0
+    print(f"Total: {total_before:.3f} MB -> {total_after:.3f} MB ({saving:.1f}x smaller)")
+
+
+def load_data(filename, columns=None, use_cache=True, optimize=True):
     """Load data from CSV file.
     
+    By default columns get compact dtypes (see optimize_dtypes) and a
+    memory report is shown when the CSV is parsed. The first load also
+    writes a Parquet copy with those dtypes (see columnar_cache), and
+    later loads read that instead of parsing the text again, until the
+    CSV's size or modification time changes. Without pyarrow the CSV is
+    always parsed.
+    
     Args:
         filename: Name of the CSV file to load
+        columns: Only load these columns (None for all)
+        use_cache: Read and write the columnar cache
+        optimize: Convert dtypes; False returns the raw parse (uncached)
     
     Returns:
         DataFrame with the loaded data
     """
     try:
-        df = pd.read_csv(filename)
+        use_cache = use_cache and optimize and columnar_cache.cache_available()
+        if use_cache and columnar_cache.is_fresh(filename):
+            df = columnar_cache.read_cache(filename, columns)
+            print(f"✓ Loaded {len(df)} rows from {filename} (cached)")
+            return df
+        
+        # Cache every column so later projections can be served too
+        df = pd.read_csv(filename, usecols=None if use_cache else columns)
+        if optimize:
+            raw, df = df, optimize_dtypes(df)
+            memory_report(raw, df)
+            del raw
+        if use_cache:
+            # The cache is optional: a failed write only costs the next load
+            try:
+                columnar_cache.write_cache(filename, df)
+            except OSError as e:
+                print(f"Warning: could not cache {filename}: {e}")
+            if columns is not None:
+                df = df[columns]
         print(f"✓ Loaded {len(df)} rows from {filename}")
         return df
     except FileNotFoundError:
@@ -53,166 +114,318 @@ def display_basic_info(df):
     print(df.head())
 
 
-def calculate_statistics(df):
-    """Calculate and display statistics for numeric columns."""
+def compute_statistics(df):
+    """Compute mean, median, min, max and total of the numeric columns.
+    
+    Returns:
+        Dictionary of {column: {"mean", "median", "min", "max", "total"}}
+    """
+    return {
+        column: {
+            "mean": df[column].mean(),
+            "median": df[column].median(),
+            "min": df[column].min(),
+            "max": df[column].max(),
+            "total": df[column].sum(),
+        }
+        for column in NUMERIC_COLUMNS
+    }
+
+
+def print_statistics(stats):
+    """Display statistics from compute_statistics or stream_analysis."""
     print("\n=== SALES STATISTICS ===")
     
     # Statistics for Sales column
+    sales = stats['Sales']
     print(f"\nSales:")
-    print(f"  Mean: ${df['Sales'].mean():.2f}")
-    print(f"  Median: ${df['Sales'].median():.2f}")
-    print(f"  Min: ${df['Sales'].min():.2f}")
-    print(f"  Max: ${df['Sales'].max():.2f}")
-    print(f"  Total: ${df['Sales'].sum():.2f}")
+    print(f"  Mean: ${sales['mean']:.2f}")
+    print(f"  Median: ${sales['median']:.2f}")
+    print(f"  Min: ${sales['min']:.2f}")
+    print(f"  Max: ${sales['max']:.2f}")
+    print(f"  Total: ${sales['total']:.2f}")
     
     # Statistics for Quantity column
+    quantity = stats['Quantity']
     print(f"\nQuantity:")
-    print(f"  Mean: {df['Quantity'].mean():.2f}")
-    print(f"  Median: {df['Quantity'].median():.2f}")
-    print(f"  Min: {df['Quantity'].min()}")
-    print(f"  Max: {df['Quantity'].max()}")
-    print(f"  Total: {df['Quantity'].sum()}")
-
-def filter_data(df):
-    """Demonstrate data filtering."""
+    print(f"  Mean: {quantity['mean']:.2f}")
+    print(f"  Median: {quantity['median']:.2f}")
+    print(f"  Min: {quantity['min']}")
+    print(f"  Max: {quantity['max']}")
+    print(f"  Total: {quantity['total']}")
+
+
+def calculate_statistics(df):
+    """Calculate and display statistics for numeric columns."""
+    print_statistics(compute_statistics(df))
+
+def select(source, row_filter, columns=None):
+    """Get the rows of a DataFrame or SalesDataset that pass a filter.
+    
+    A dataset pushes the filter down, so only files and row groups that
+    can match are read, and only the requested columns.
+    
+    Args:
+        source: DataFrame or SalesDataset
+        row_filter: SalesFilter
+        columns: Columns to return (None for all)
+    
+    Returns:
+        DataFrame of the matching rows
+    """
+    if isinstance(source, SalesDataset):
+        df = source.read(row_filter, columns)
+        scan = source.last_scan
+        print(f"✓ Read {scan['rows']} rows from {scan['files_read']} of {scan['files']} files "
+              f"({scan['row_groups_read']} of {scan['row_groups']} cached row groups)")
+        return df
+    mask = row_filter.mask(source)
+    return source.loc[mask] if columns is None else source.loc[mask, columns]
+
+
+def filter_data(source):
+    """Demonstrate data filtering (on a DataFrame or SalesDataset)."""
     print("\n=== DATA FILTERING ===")
     
     # Filter: Sales greater than 100
-    high_sales = df[df['Sales'] > 100]
+    high_sales = select(source, SalesFilter(min_sales=100), ['Product', 'Sales', 'Region'])
     print(f"\nHigh value sales (>$100): {len(high_sales)} transactions")
-    print(high_sales[['Product', 'Sales', 'Region']])
+    print(high_sales)
     
     # Filter: Specific product
-    laptop_sales = df[df['Product'] == 'Laptop']
+    laptop_sales = select(source, SalesFilter(product='Laptop'), ['Sales'])
     print(f"\nLaptop sales: {len(laptop_sales)} transactions")
     print(f"Total laptop revenue: ${laptop_sales['Sales'].sum():.2f}")
     
     # Filter: Multiple conditions
-    north_laptops = df[(df['Product'] == 'Laptop') & (df['Region'] == 'North')]
+    north_laptops = select(source, SalesFilter(product='Laptop', region='North'), ['Date', 'Sales', 'Quantity'])
     print(f"\nLaptops sold in North region: {len(north_laptops)} transactions")
-    print(north_laptops[['Date', 'Sales', 'Quantity']])
+    print(north_laptops)
 
 
-def group_data(df):
-    """Demonstrate data grouping and aggregation."""
-    print("\n=== DATA GROUPING ===")
+def compute_groups(df):
+    """Aggregate Sales by product, by region and by both.
     
+    Returns:
+        Dictionary with "by_product", "by_region" and "by_product_region"
+    """
     # Group by Product
-    print("\nSales by Product:")
-    product_sales = df.groupby('Product')['Sales'].agg(['sum', 'mean', 'count'])
-    product_sales.columns = ['Total Sales', 'Average Sale', 'Number of Sales']
-    print(product_sales)
+    product_sales = aggregations.aggregate(df, 'Product').set_axis(
+        ['Total Sales', 'Average Sale', 'Number of Sales'], axis=1)
     
     # Group by Region
-    print("\nSales by Region:")
-    region_sales = df.groupby('Region')['Sales'].agg(['sum', 'mean'])
-    region_sales.columns = ['Total Sales', 'Average Sale']
-    print(region_sales)
+    region_sales = aggregations.aggregate(df, 'Region')[['sum', 'mean']].set_axis(
+        ['Total Sales', 'Average Sale'], axis=1)
     
     # Group by multiple columns
+    product_region = aggregations.aggregate(df, ['Product', 'Region'])['sum'].rename('Sales')
+    
+    return {"by_product": product_sales, "by_region": region_sales,
+            "by_product_region": product_region}
+
+
+def print_groups(groups):
+    """Display aggregations from compute_groups or stream_analysis."""
+    print("\n=== DATA GROUPING ===")
+    print("\nSales by Product:")
+    print(groups["by_product"])
+    print("\nSales by Region:")
+    print(groups["by_region"])
     print("\nSales by Product and Region:")
-    product_region = df.groupby(['Product', 'Region'])['Sales'].sum()
-    print(product_region)
+    print(groups["by_product_region"])
+
+
+def group_data(df):
+    """Demonstrate data grouping and aggregation."""
+    print_groups(compute_groups(df))
+
+
+def stream_analysis(filename, chunksize=100_000, max_exact=100_000, relative_accuracy=0.001):
+    """Compute the statistics and groupings of a CSV file in one pass.
+    
+    The file is read chunksize rows at a time, so memory stays bounded
+    however large the file is. Totals, min, max and the groupings are
+    exact; the median is exact until a column has more than max_exact
+    distinct values, then it is estimated within relative_accuracy.
+    
+    Args:
+        filename: CSV file with Product, Region, Sales and Quantity columns
+        chunksize: Rows read per chunk
+        max_exact: Distinct values per column kept for an exact median
+        relative_accuracy: Median error bound after that
+    
+    Returns:
+        (rows, statistics like compute_statistics, groups like compute_groups)
+    """
+    stats = {column: RunningStats(max_exact, relative_accuracy) for column in NUMERIC_COLUMNS}
+    by_product = GroupAccumulator('Product', 'Sales')
+    by_region = GroupAccumulator('Region', 'Sales')
+    by_product_region = GroupAccumulator(['Product', 'Region'], 'Sales')
+    
+    rows = 0
+    columns = ['Product', 'Region'] + NUMERIC_COLUMNS
+    for chunk in pd.read_csv(filename, chunksize=chunksize, usecols=columns):
+        rows += len(chunk)
+        for column in NUMERIC_COLUMNS:
+            stats[column].update(chunk[column])
+        for accumulator in (by_product, by_region, by_product_region):
+            accumulator.update(chunk)
+    
+    product_sales = by_product.result()
+    product_sales.columns = ['Total Sales', 'Average Sale', 'Number of Sales']
+    region_sales = by_region.result()[['sum', 'mean']]
+    region_sales.columns = ['Total Sales', 'Average Sale']
+    product_region = by_product_region.result()['sum'].rename('Sales')
+    
+    groups = {"by_product": product_sales, "by_region": region_sales,
+              "by_product_region": product_region}
+    return rows, {column: stats[column].summary() for column in NUMERIC_COLUMNS}, groups
+
+
+def print_cache_stats():
+    """Display how many aggregations were computed and how many reused."""
+    stats = aggregations.stats()
+    print(f"\nAggregation cache: {stats['misses']} computed, {stats['hits']} reused "
+          f"({stats['hit_rate']:.0%} hit rate), {stats['size']} cached")
 
 
 def find_top_products(df, n=3):
     """Find top N products by total sales."""
     print(f"\n=== TOP {n} PRODUCTS ===")
     
-    top_products = df.groupby('Product')['Sales'].sum().sort_values(ascending=False).head(n)
+    top_products = aggregations.aggregate(df, 'Product')['sum'].sort_values(ascending=False).head(n)
     
     for i, (product, sales) in enumerate(top_products.items(), 1):
         print(f"{i}. {product}: ${sales:.2f}")
 
-def create_sales_chart(df):
-    """Create a bar chart of total sales by product."""
-    print("\n=== CREATING SALES CHART ===")
+def time_series_points(dpi):
+    """Points the time series chart can show: one per pixel of its width."""
+    return int(TIME_SERIES_FIGSIZE[0] * dpi)
+
+
+def sales_over_time(df, mode='lttb', max_points=1200):
+    """Dates and sales in date order, downsampled for plotting.
     
-    # Calculate total sales by product
-    product_sales = df.groupby('Product')['Sales'].sum().sort_values(ascending=False)
+    The result is memoized with the other aggregations, so redrawing the
+    chart does not sort and reduce the rows again.
     
-    # Create the bar chart
-    plt.figure(figsize=(10, 6))
-    product_sales.plot(kind='bar', color='steelblue')
-    plt.title('Total Sales by Product', fontsize=16, fontweight='bold')
-    plt.xlabel('Product', fontsize=12)
-    plt.ylabel('Total Sales ($)', fontsize=12)
-    plt.xticks(rotation=45)
-    plt.grid(axis='y', alpha=0.3)
-    plt.tight_layout()
+    Args:
+        df: DataFrame with Date and Sales columns
+        mode: Downsampling mode (see downsampling.downsample)
+        max_points: Points allowed by the lttb and minmax modes
     
-    # Save the chart
-    plt.savefig('sales_by_product.png')
-    print("✓ Chart saved: sales_by_product.png")
-    plt.close()
+    Returns:
+        (dates, sales) arrays
+    """
+    def compute():
+        # load_data already parsed the dates; only raw frames need parsing here
+        series = df[['Date', 'Sales']]
+        if not pd.api.types.is_datetime64_any_dtype(series['Date']):
+            series = series.assign(Date=pd.to_datetime(series['Date']))
+        series = series.sort_values('Date')
+        return downsample(series['Date'].to_numpy(), series['Sales'].to_numpy(), mode, max_points)
+    
+    return aggregations.lookup(df, ('sales_over_time', mode, max_points), compute)
 
 
-def create_region_chart(df):
-    """Create a pie chart of sales by region."""
-    print("\n=== CREATING REGION CHART ===")
+def chart_data(df, charts=None, dpi=100, time_mode='lttb'):
+    """Compute the small inputs of each chart (see chart_rendering.CHARTS).
     
-    # Calculate total sales by region
-    region_sales = df.groupby('Region')['Sales'].sum()
+    Args:
+        df: Sales DataFrame
+        charts: Chart names to prepare (None for all)
+        dpi: Resolution the charts will be drawn at
+        time_mode: Downsampling mode of the time series
+    
+    Returns:
+        Dictionary of {chart name: data for its draw function}
+    """
+    inputs = {
+        'sales_by_product': lambda: aggregations.aggregate(df, 'Product')['sum'].sort_values(ascending=False),
+        'sales_by_region': lambda: aggregations.aggregate(df, 'Region')['sum'],
+        'sales_over_time': lambda: sales_over_time(df, time_mode, time_series_points(dpi)),
+        'sales_comparison': lambda: aggregations.pivot(df, 'Product', 'Region'),
+    }
+    return {name: inputs[name]() for name in (charts or inputs)}
+
+
+def create_chart(df, name):
+    """Draw one chart in this process and save it as PNG."""
+    path = render_chart((name, chart_data(df, [name])[name], '.', 'png', 100))
+    print(f"✓ Chart saved: {path}")
+
+
+def stream_time_series(filename, mode='daily', chunksize=100_000, output_dir='.', fmt='png', dpi=100):
+    """Draw the time series chart of a CSV file in one bounded-memory pass.
     
-    # Create the pie chart
-    plt.figure(figsize=(8, 8))
-    plt.pie(region_sales, labels=region_sales.index, autopct='%1.1f%%', 
-            startangle=90, colors=['#ff9999', '#66b3ff', '#99ff99', '#ffcc99'])
-    plt.title('Sales Distribution by Region', fontsize=16, fontweight='bold')
-    plt.tight_layout()
+    Only the Date and Sales columns are read, chunksize rows at a time,
+    and summed per period, so the cost of drawing depends on the number
+    of periods rather than the number of rows.
+    
+    Args:
+        filename: CSV file with Date and Sales columns
+        mode: "daily", "weekly" or "monthly"
+        chunksize: Rows read per chunk
+        output_dir: Folder for the chart file
+        fmt: Image format
+        dpi: Resolution of raster formats
     
-    # Save the chart
-    plt.savefig('sales_by_region.png')
-    print("✓ Chart saved: sales_by_region.png")
-    plt.close()
+    Returns:
+        Path of the written file
+    """
+    if mode not in RESAMPLE_RULES:
+        raise ValueError(f"Streaming needs a resampling mode ({', '.join(RESAMPLE_RULES)}), not {mode}")
+    totals = PeriodTotals(RESAMPLE_RULES[mode])
+    for chunk in pd.read_csv(filename, chunksize=chunksize, usecols=['Date', 'Sales']):
+        totals.update(chunk)
+    return render_charts({'sales_over_time': totals.result()}, output_dir, fmt, dpi, workers=1)[0]
+
+
+def create_sales_chart(df):
+    """Create a bar chart of total sales by product."""
+    print("\n=== CREATING SALES CHART ===")
+    create_chart(df, 'sales_by_product')
+
+
+def create_region_chart(df):
+    """Create a pie chart of sales by region."""
+    print("\n=== CREATING REGION CHART ===")
+    create_chart(df, 'sales_by_region')
 
 
 def create_time_series(df):
     """Create a line chart showing sales over time."""
     print("\n=== CREATING TIME SERIES CHART ===")
-    
-    # Convert Date to datetime and set as index
-    df_copy = df.copy()
-    df_copy['Date'] = pd.to_datetime(df_copy['Date'])
-    df_copy = df_copy.sort_values('Date')
-    
-    # Create the line chart
-    plt.figure(figsize=(12, 6))
-    plt.plot(df_copy['Date'], df_copy['Sales'], marker='o', linewidth=2, markersize=8)
-    plt.title('Sales Over Time', fontsize=16, fontweight='bold')
-    plt.xlabel('Date', fontsize=12)
-    plt.ylabel('Sales ($)', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    # Save the chart
-    plt.savefig('sales_over_time.png')
-    print("✓ Chart saved: sales_over_time.png")
-    plt.close()
+    create_chart(df, 'sales_over_time')
 
 
 def create_comparison_chart(df):
     """Create a grouped bar chart comparing products across regions."""
     print("\n=== CREATING COMPARISON CHART ===")
+    create_chart(df, 'sales_comparison')
+
+
+def create_all_charts(df, output_dir='.', fmt='png', dpi=100, workers=None, time_mode='lttb'):
+    """Create every chart, rendering them in parallel processes.
     
-    # Pivot data for comparison
-    pivot_data = df.pivot_table(values='Sales', index='Product', columns='Region', aggfunc='sum', fill_value=0)
+    The aggregates are computed here first, then each chart is drawn and
+    saved by its own worker with the headless Agg backend.
     
-    # Create the grouped bar chart
-    pivot_data.plot(kind='bar', figsize=(12, 6), width=0.8)
-    plt.title('Sales Comparison: Products by Region', fontsize=16, fontweight='bold')
-    plt.xlabel('Product', fontsize=12)
-    plt.ylabel('Sales ($)', fontsize=12)
-    plt.legend(title='Region', bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.xticks(rotation=45)
-    plt.grid(axis='y', alpha=0.3)
-    plt.tight_layout()
+    Args:
+        df: Sales DataFrame
+        output_dir: Folder for the chart files
+        fmt: Image format, e.g. "png", "svg" or "pdf"
+        dpi: Resolution of raster formats
+        workers: Processes (default: CPUs available)
+        time_mode: Downsampling mode of the time series (see downsampling)
     
-    # Save the chart
-    plt.savefig('sales_comparison.png')
-    print("✓ Chart saved: sales_comparison.png")
-    plt.close()
+    Returns:
+        List of written paths
+    """
+    paths = render_charts(chart_data(df, dpi=dpi, time_mode=time_mode), output_dir, fmt, dpi, workers)
+    for path in paths:
+        print(f"✓ Chart saved: {path}")
+    return paths
 
 def display_menu():
     """Display the main menu."""
@@ -233,8 +446,8 @@ def display_menu():
     print("12. Exit")
     print("="*50)
 
-def export_filtered_data(df):
-    """Allow user to filter and export data."""
+def export_filtered_data(source):
+    """Allow user to filter and export data (from a DataFrame or SalesDataset)."""
     print("\n=== EXPORT FILTERED DATA ===")
     print("1. Export high-value sales (>$100)")
     print("2. Export specific product")
@@ -244,29 +457,89 @@ def export_filtered_data(df):
     choice = input("\nEnter your choice (1-4): ").strip()
     
     if choice == "1":
-        filtered = df[df['Sales'] > 100]
+        row_filter = SalesFilter(min_sales=100)
         filename = 'high_value_sales.csv'
     elif choice == "2":
         product = input("Enter product name: ").strip()
-        filtered = df[df['Product'] == product]
+        row_filter = SalesFilter(product=product)
         filename = f'{product.lower()}_sales.csv'
     elif choice == "3":
         region = input("Enter region name: ").strip()
-        filtered = df[df['Region'] == region]
+        row_filter = SalesFilter(region=region)
         filename = f'{region.lower()}_sales.csv'
     elif choice == "4":
-        filtered = df
+        row_filter = SalesFilter()
         filename = 'all_sales_export.csv'
     else:
         print("Invalid choice!")
         return
     
+    filtered = select(source, row_filter)
     filtered.to_csv(filename, index=False)
     print(f"✓ Exported {len(filtered)} rows to {filename}")
 
 
 def main():
     """Main function to run the data analyzer."""
+    parser = argparse.ArgumentParser(description="Analyze sales data")
+    parser.add_argument("--stream", metavar="CSV",
+                        help="Print statistics and groupings of a large CSV in one bounded-memory pass")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--charts", metavar="CSV",
+                        help="Render every chart of a CSV without the menu")
+    parser.add_argument("--output-dir", default=".", help="Folder for chart files")
+    parser.add_argument("--format", choices=supported_formats(), default="png")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Chart rendering processes and dataset reading threads")
+    parser.add_argument("--time-mode", choices=TIME_MODES, default=None,
+                        help="Time series downsampling (default: lttb, or daily with --stream)")
+    parser.add_argument("--time-chart", action="store_true",
+                        help="With --stream, also draw the time series from per-period totals")
+    parser.add_argument("--dataset", metavar="PATH",
+                        help="Analyze a directory or glob of CSV/Parquet files (key=value folders are partitions)")
+    parser.add_argument("--export", metavar="CSV",
+                        help="Write the rows of --dataset (default sales_data.csv) that pass the filters below")
+    parser.add_argument("--product")
+    parser.add_argument("--region")
+    parser.add_argument("--start", help="First date, e.g. 2024-01-01")
+    parser.add_argument("--end", help="Last date")
+    parser.add_argument("--min-sales", type=float, help="Keep sales above this amount")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    
+    if args.stream and args.time_chart and args.time_mode not in (None, *RESAMPLE_RULES):
+        parser.error(f"--stream --time-chart needs --time-mode {', '.join(RESAMPLE_RULES)}")
+    
+    if args.stream:
+        rows, stats, groups = stream_analysis(args.stream, chunksize=args.chunksize)
+        print(f"✓ Streamed {rows} rows from {args.stream}")
+        print_statistics(stats)
+        print_groups(groups)
+        if args.time_chart:
+            path = stream_time_series(args.stream, args.time_mode or 'daily', args.chunksize,
+                                      args.output_dir, args.format, args.dpi)
+            print(f"✓ Chart saved: {path}")
+        return
+    
+    if args.charts:
+        # The charts only need these columns, which the cache can serve alone
+        df = load_data(args.charts, columns=['Date', 'Product', 'Region', 'Sales'])
+        if df is None:
+            print("Failed to load data. Exiting.")
+            return
+        create_all_charts(df, args.output_dir, args.format, args.dpi, args.workers,
+                          args.time_mode or 'lttb')
+        return
+    
+    if args.export:
+        dataset = SalesDataset(args.dataset or 'sales_data.csv', args.workers)
+        row_filter = SalesFilter(args.product, args.region, args.start, args.end, args.min_sales)
+        filtered = select(dataset, row_filter)
+        filtered.to_csv(args.export, index=False)
+        print(f"✓ Exported {len(filtered)} rows to {args.export}")
+        return
+    
     print("=== DATA ANALYZER ===\n")
     
     # Create sample data if it doesn't exist
@@ -275,9 +548,14 @@ def main():
         print("Creating sample data...")
         create_sample_data()
     
-    # Load the data
+    # Load the data (filters on a dataset go back to its files)
     print("Loading data...")
-    df = load_data('sales_data.csv')
+    if args.dataset:
+        source = SalesDataset(args.dataset, args.workers)
+        df = source.read()
+        print(f"✓ Loaded {len(df)} rows from {len(source.files)} files")
+    else:
+        df = source = load_data('sales_data.csv')
     
     if df is None:
         print("Failed to load data. Exiting.")
@@ -297,7 +575,7 @@ def main():
             calculate_statistics(df)
         
         elif choice == "3":
-            filter_data(df)
+            filter_data(source)
         
         elif choice == "4":
             group_data(df)
@@ -312,11 +590,9 @@ def main():
         
         elif choice == "6":
             print("\nCreating all visualizations...")
-            create_sales_chart(df)
-            create_region_chart(df)
-            create_time_series(df)
-            create_comparison_chart(df)
+            create_all_charts(df)
             print("\n✓ All visualizations created!")
+            print_cache_stats()
         
         elif choice == "7":
             create_sales_chart(df)
@@ -331,7 +607,7 @@ def main():
             create_comparison_chart(df)
         
         elif choice == "11":
-            export_filtered_data(df)
+            export_filtered_data(source)
         
         elif choice == "12":
             print("\nThank you for using Data Analyzer!")
@@ -0,0 +1,128 @@
+"""
+Downsampling
+Reduce long time series to about as many points as a chart has pixels
+"""
+
+import numpy as np
+import pandas as pd
+
+# Weeks start on Monday; resample_period labels every bucket by its start
+RESAMPLE_RULES = {'daily': 'D', 'weekly': 'W-MON', 'monthly': 'MS'}
+MODES = ['lttb', 'minmax', *RESAMPLE_RULES, 'raw']
+
+
+def as_float(values):
+    """Numbers for geometry (datetimes become nanoseconds)."""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype('datetime64[ns]').astype(np.int64)
+    return values.astype(float)
+
+
+def resample_period(series, rule):
+    """Resampler whose buckets include and are labelled by their start date.
+
+    Weekly rules otherwise close on, and are labelled by, the end of the
+    week, unlike the daily and month-start buckets.
+    """
+    return series.resample(rule, closed='left', label='left')
+
+
+def resample_totals(dates, values, rule):
+    """Sum values per calendar period (empty periods become 0).
+
+    Args:
+        dates: Datetime array
+        values: Numbers to sum, one per date
+        rule: pandas offset alias such as "D", "W-MON" or "MS"
+
+    Returns:
+        (period start dates, totals) arrays
+    """
+    series = resample_period(pd.Series(values, index=pd.DatetimeIndex(dates)), rule).sum()
+    return series.index.to_numpy(), series.to_numpy()
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of n_out - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    point kept before it and the average of the next bucket. Peaks and
+    dips survive, so the line looks like the full series.
+
+    Args:
+        x: Sorted positions (numbers or datetimes)
+        y: Values
+        n_out: Points to keep (at least 3)
+
+    Returns:
+        (x, y) of the kept points, unchanged if there are no more than n_out
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(x)
+    if n <= n_out:
+        return x, y
+    if n_out < 3:
+        raise ValueError("lttb needs at least 3 output points")
+
+    xf, yf = as_float(x), as_float(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket is represented by its average (the last point at the end)
+        next_start, next_end = (edges[bucket + 1], edges[bucket + 2]) if bucket < n_out - 3 else (n - 1, n)
+        next_x, next_y = xf[next_start:next_end].mean(), yf[next_start:next_end].mean()
+        areas = np.abs((xf[previous] - next_x) * (yf[start:end] - yf[previous])
+                       - (xf[previous] - xf[start:end]) * (next_y - yf[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+
+def min_max_buckets(x, y, n_buckets):
+    """Keep the lowest and highest point of each of n_buckets equal buckets.
+
+    Every spike is kept, so nothing the eye could see at that width is
+    lost. The points stay in x order.
+
+    Returns:
+        (x, y) of at most 2 * n_buckets points
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(x)
+    if n <= 2 * n_buckets:
+        return x, y
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        low = start + int(np.argmin(y[start:end]))
+        high = start + int(np.argmax(y[start:end]))
+        selected.extend(sorted({low, high}))
+    return x[selected], y[selected]
+
+
+def downsample(dates, values, mode='lttb', max_points=1200):
+    """Reduce a sorted time series for plotting.
+
+    Args:
+        dates: Sorted datetime array
+        values: Values, one per date
+        mode: "lttb", "minmax", "daily", "weekly", "monthly" or "raw"
+        max_points: Points allowed, e.g. the chart width in pixels
+
+    Returns:
+        (dates, values) arrays to plot
+    """
+    if mode == 'lttb':
+        return lttb(dates, values, max(max_points, 3))
+    if mode == 'minmax':
+        return min_max_buckets(dates, values, max(max_points // 2, 1))
+    if mode in RESAMPLE_RULES:
+        return resample_totals(dates, values, RESAMPLE_RULES[mode])
+    if mode == 'raw':
+        return np.asarray(dates), np.asarray(values)
+    raise ValueError(f"Unknown downsampling mode: {mode}")
@@ -0,0 +1,260 @@
+"""
+Sales Dataset
+Many sales files read as one table, skipping whatever a filter rules out
+"""
+
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import columnar_cache
+from sales_schema import CATEGORY_COLUMNS, empty_frame, optimize_dtypes
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow every file is parsed and filtered in memory
+    pq = None
+
+# Quiet unless the application configures logging (main() does)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FILE_EXTENSIONS = ('.csv', '.parquet')
+# Hive-style folder keys (date=2024-01-05/region=North) and their columns
+PARTITION_COLUMNS = {'date': 'Date', 'region': 'Region', 'product': 'Product'}
+
+
+class SalesFilter:
+    """Row conditions that can also be checked against file summaries.
+
+    Every condition is optional and a row must meet all that are set:
+    Product and Region equal a value, start <= Date <= end and
+    Sales > min_sales. Besides filtering rows, may_match tells whether
+    anything in a value range (a partition folder, or the min/max of a
+    Parquet row group) could pass, so that data is never read.
+    """
+
+    def __init__(self, product=None, region=None, start=None, end=None, min_sales=None):
+        """Create a filter (None leaves a condition out)."""
+        self.product = product
+        self.region = region
+        self.start = None if start is None else pd.Timestamp(start)
+        self.end = None if end is None else pd.Timestamp(end)
+        self.min_sales = min_sales
+
+    def columns(self):
+        """Columns the conditions read."""
+        columns = []
+        if self.product is not None:
+            columns.append('Product')
+        if self.region is not None:
+            columns.append('Region')
+        if self.start is not None or self.end is not None:
+            columns.append('Date')
+        if self.min_sales is not None:
+            columns.append('Sales')
+        return columns
+
+    def may_match(self, column, low, high):
+        """Check whether a value between low and high could pass."""
+        if column == 'Product' and self.product is not None:
+            return low <= self.product <= high
+        if column == 'Region' and self.region is not None:
+            return low <= self.region <= high
+        if column == 'Date':
+            if self.start is not None and pd.Timestamp(high) < self.start:
+                return False
+            if self.end is not None and pd.Timestamp(low) > self.end:
+                return False
+        if column == 'Sales' and self.min_sales is not None:
+            return high > self.min_sales
+        return True
+
+    def mask(self, df):
+        """Boolean Series marking the rows of df that pass."""
+        mask = pd.Series(True, index=df.index)
+        if self.product is not None:
+            mask &= df['Product'] == self.product
+        if self.region is not None:
+            mask &= df['Region'] == self.region
+        if self.start is not None:
+            mask &= df['Date'] >= self.start
+        if self.end is not None:
+            mask &= df['Date'] <= self.end
+        if self.min_sales is not None:
+            mask &= df['Sales'] > self.min_sales
+        return mask
+
+
+def partition_values(path, root):
+    """Read key=value folder names between root and a file.
+
+    Returns:
+        Dictionary of {column: value as text}
+    """
+    values = {}
+    relative = os.path.relpath(os.path.dirname(path) or '.', root)
+    for part in relative.split(os.sep):
+        key, separator, value = part.partition('=')
+        if separator:
+            values[PARTITION_COLUMNS.get(key.lower(), key)] = value
+    return values
+
+
+def find_files(source):
+    """List the data files of a directory, glob pattern or single file.
+
+    Directories are searched recursively; hidden folders such as the
+    columnar cache are skipped.
+
+    Returns:
+        (root folder for partition names, sorted list of file paths)
+    """
+    source = os.fspath(source)
+    if os.path.isfile(source):
+        return os.path.dirname(source) or '.', [source]
+    if os.path.isdir(source):
+        root, pattern = source, os.path.join(source, '**', '*')
+    else:
+        # Partition folders start after the last folder without wildcards
+        parts = source.split(os.sep)
+        fixed = next((i for i, part in enumerate(parts) if glob.has_magic(part)), len(parts) - 1)
+        root, pattern = os.sep.join(parts[:fixed]) or '.', source
+    files = [path for path in glob.glob(pattern, recursive=True)
+             if path.endswith(FILE_EXTENSIONS) and os.path.isfile(path)]
+    return root, sorted(files)
+
+
+class SalesDataset:
+    """A directory or glob of sales files, read as one DataFrame.
+
+    Files are read in parallel by a thread pool (the CSV and Parquet
+    readers release the GIL, and no data has to be pickled). A filter
+    is pushed down as far as it goes:
+      1. files in partition folders that cannot match are never opened
+      2. Parquet files (including the columnar cache of a CSV) only read
+         the row groups whose min/max statistics could match, and only
+         the columns the query needs
+      3. the remaining rows are filtered in memory
+    A CSV without a fresh cache is parsed once in full and cached, so
+    later queries get the Parquet path.
+    """
+
+    def __init__(self, source, workers=None, use_cache=True):
+        """Find the files of a dataset.
+
+        Args:
+            source: Directory, glob pattern (e.g. "sales/*.csv") or file
+            workers: Threads reading files (default: the pool's default)
+            use_cache: Read and write Parquet copies of CSV files
+        """
+        self.source = source
+        self.workers = workers
+        self.use_cache = use_cache and columnar_cache.cache_available()
+        self.root, paths = find_files(source)
+        self.files = [(path, partition_values(path, self.root)) for path in paths]
+        self.last_scan = None
+
+    def read_parquet(self, path, row_filter, columns):
+        """Read the row groups of a Parquet file that may match.
+
+        Returns:
+            (DataFrame or None if every row group was skipped, row groups, row groups read)
+        """
+        parquet = pq.ParquetFile(path)
+        metadata = parquet.metadata
+        kept = []
+        for index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(index)
+            chunks = [row_group.column(i) for i in range(row_group.num_columns)]
+            if all(row_filter.may_match(chunk.path_in_schema, chunk.statistics.min, chunk.statistics.max)
+                   for chunk in chunks
+                   if chunk.statistics is not None and chunk.statistics.has_min_max):
+                kept.append(index)
+        if not kept:
+            return None, metadata.num_row_groups, 0
+        if columns is not None:
+            columns = [column for column in columns if column in parquet.schema_arrow.names]
+        # Parquet written by other tools may hold dates as text and wide integers
+        df = optimize_dtypes(parquet.read_row_groups(kept, columns=columns).to_pandas())
+        return df, metadata.num_row_groups, len(kept)
+
+    def read_csv(self, path, columns):
+        """Parse a CSV file, caching all of it as Parquet when possible."""
+        if self.use_cache:
+            df = optimize_dtypes(pd.read_csv(path))
+            # The cache only speeds up later queries; this one has its rows
+            try:
+                columnar_cache.write_cache(path, df)
+            except OSError as e:
+                logger.warning("Warning: could not cache %s: %s", path, e)
+            return df if columns is None else df[[column for column in columns if column in df]]
+        return optimize_dtypes(pd.read_csv(path, usecols=lambda column: columns is None or column in columns))
+
+    def read_file(self, path, partitions, row_filter, columns):
+        """Read the matching rows of one file (runs in a worker thread).
+
+        Returns:
+            (DataFrame or None, whether the file was opened, row groups, row groups read)
+        """
+        # Partition folders answer the filter without opening the file
+        if not all(row_filter.may_match(column, value, value) for column, value in partitions.items()):
+            return None, False, 0, 0
+
+        row_groups = read_groups = 0
+        parquet_path = None
+        if path.endswith('.parquet'):
+            parquet_path = path
+        elif self.use_cache and columnar_cache.is_fresh(path):
+            parquet_path = columnar_cache.cache_path(path)
+        if parquet_path is not None and pq is not None:
+            df, row_groups, read_groups = self.read_parquet(parquet_path, row_filter, columns)
+            if df is None:
+                return None, False, row_groups, 0
+        else:
+            df = self.read_csv(path, columns)
+
+        # Columns only recorded in folder names become constant columns
+        for column, value in partitions.items():
+            if column not in df and (columns is None or column in columns):
+                df[column] = pd.Timestamp(value) if column == 'Date' else value
+        df = df[row_filter.mask(df)]
+        return df, True, row_groups, read_groups
+
+    def read(self, row_filter=None, columns=None):
+        """Read the rows that pass a filter from every file.
+
+        What was skipped is recorded in last_scan.
+
+        Args:
+            row_filter: SalesFilter (None for every row)
+            columns: Columns to return (None for all)
+
+        Returns:
+            DataFrame with compact dtypes (see sales_schema)
+        """
+        row_filter = row_filter or SalesFilter()
+        needed = None if columns is None else list(dict.fromkeys([*columns, *row_filter.columns()]))
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = list(pool.map(lambda file: self.read_file(*file, row_filter, needed), self.files))
+
+        frames = [df for df, _, _, _ in results if df is not None]
+        self.last_scan = {
+            "files": len(self.files),
+            "files_read": sum(opened for _, opened, _, _ in results),
+            "row_groups": sum(row_groups for _, _, row_groups, _ in results),
+            "row_groups_read": sum(read_groups for _, _, _, read_groups in results),
+            "rows": sum(len(df) for df in frames),
+        }
+        if not frames:
+            return empty_frame(columns)
+
+        df = pd.concat(frames, ignore_index=True)
+        # Files with different category sets concatenate to plain strings
+        for column in CATEGORY_COLUMNS:
+            if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype('category')
+        return df if columns is None else df[columns]
@@ -0,0 +1,55 @@
+"""
+Sales Schema
+Column roles of the sales data and their compact dtypes
+"""
+
+import pandas as pd
+
+NUMERIC_COLUMNS = ['Sales', 'Quantity']
+CATEGORY_COLUMNS = ['Product', 'Region']
+DATE_COLUMNS = ['Date']
+
+
+def optimize_dtypes(df):
+    """Convert sales columns to compact, analysis-ready dtypes.
+
+    Product and Region become categoricals (each name stored once), Date
+    is parsed into datetime64 once, and integer Sales/Quantity columns
+    are downcast to the smallest integer type that holds them. Float
+    columns stay float64 so money totals keep their precision. Columns
+    missing from df (e.g. after a projection) are skipped.
+
+    Args:
+        df: DataFrame as parsed from the CSV
+
+    Returns:
+        New DataFrame with converted columns
+    """
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    for column in DATE_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column])
+    for column in NUMERIC_COLUMNS:
+        if column in df and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def empty_frame(columns=None):
+    """An empty sales table that still has every column and its dtype.
+
+    Args:
+        columns: Only these columns (None for all)
+
+    Returns:
+        DataFrame with no rows
+    """
+    dtypes = {column: 'int64' for column in NUMERIC_COLUMNS}
+    dtypes.update({column: 'category' for column in CATEGORY_COLUMNS})
+    dtypes.update({column: 'datetime64[ns]' for column in DATE_COLUMNS})
+    if columns is not None:
+        dtypes = {column: dtypes.get(column, 'object') for column in columns}
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
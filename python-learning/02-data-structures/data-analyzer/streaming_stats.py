@@ -0,0 +1,227 @@
+"""
+Streaming Statistics
+One-pass, bounded-memory summaries for data read in chunks
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from downsampling import resample_period
+
+
+class QuantileSketch:
+    """Quantiles of a stream, exact while the values fit in memory.
+
+    Values are counted exactly (one entry per distinct value) until more
+    than max_exact distinct values have been seen. The counts are then
+    folded into logarithmic buckets, where every bucket spans a relative
+    width of 2 * relative_accuracy, so any quantile is off by at most
+    that relative error and memory only grows with the log of the value
+    range.
+    """
+
+    def __init__(self, max_exact=100_000, relative_accuracy=0.001):
+        """Create an empty sketch.
+
+        Args:
+            max_exact: Distinct values kept exactly before switching to buckets
+            relative_accuracy: Relative error bound once bucketed
+        """
+        self.max_exact = max_exact
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.exact = Counter()  # {value: count} while exact
+        self.buckets = None  # {(sign, bucket): count} once bucketed
+        self.count = 0
+
+    @property
+    def is_exact(self):
+        """Whether quantiles are still computed from the exact values."""
+        return self.buckets is None
+
+    def bucket_keys(self, values):
+        """Map values to (sign, bucket index) keys; 0 gets its own key."""
+        signs = np.sign(values).astype(np.int8)
+        magnitudes = np.abs(values)
+        indexes = np.zeros(len(values), dtype=np.int64)
+        nonzero = magnitudes > 0
+        indexes[nonzero] = np.ceil(np.log(magnitudes[nonzero]) / self.log_gamma)
+        return zip(signs.tolist(), indexes.tolist())
+
+    def update(self, values):
+        """Add an array of values (NaNs must already be dropped)."""
+        values = np.asarray(values)
+        if not len(values):
+            return
+        self.count += len(values)
+        if self.buckets is None:
+            uniques, counts = np.unique(values, return_counts=True)
+            self.exact.update(dict(zip(uniques.tolist(), counts.tolist())))
+            if len(self.exact) > self.max_exact:
+                self.switch_to_buckets()
+            return
+        uniques, counts = np.unique(values, return_counts=True)
+        for key, count in zip(self.bucket_keys(uniques.astype(float)), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def switch_to_buckets(self):
+        """Fold the exact counts into logarithmic buckets."""
+        self.buckets = {}
+        values = np.fromiter(self.exact.keys(), dtype=float, count=len(self.exact))
+        for key, count in zip(self.bucket_keys(values), self.exact.values()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.exact = Counter()
+
+    def sorted_items(self):
+        """(representative value, count) pairs in ascending value order."""
+        if self.buckets is None:
+            return sorted(self.exact.items())
+        items = []
+        for (sign, index), count in self.buckets.items():
+            # The bucket's midpoint is within the relative error of its values
+            value = 0.0 if sign == 0 else sign * 2 * self.gamma ** index / (self.gamma + 1)
+            items.append((value, count))
+        return sorted(items)
+
+    def quantile(self, q):
+        """Estimate a quantile with linear interpolation, like pandas.
+
+        Args:
+            q: Fraction between 0 and 1 (0.5 for the median)
+
+        Returns:
+            The quantile, or NaN for an empty sketch
+        """
+        if not self.count:
+            return float("nan")
+        position = (self.count - 1) * q
+        lower_rank = math.floor(position)
+        fraction = position - lower_rank
+        # Ranks seen - count .. seen - 1 all hold the current value
+        lower = upper = None
+        seen = 0
+        for value, count in self.sorted_items():
+            seen += count
+            if lower is None and seen > lower_rank:
+                lower = value
+                if fraction == 0:
+                    return lower
+            if seen > lower_rank + 1:
+                upper = value
+                break
+        return lower + (upper - lower) * fraction
+
+    def median(self):
+        """Estimate the median."""
+        return self.quantile(0.5)
+
+
+class RunningStats:
+    """Count, total, min, max and quantiles of a numeric column, chunk by chunk."""
+
+    def __init__(self, max_exact=100_000, relative_accuracy=0.001):
+        """Create empty statistics (see QuantileSketch for the arguments)."""
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(max_exact, relative_accuracy)
+
+    def update(self, series):
+        """Add one chunk of a column."""
+        series = series.dropna()
+        if series.empty:
+            return
+        self.count += len(series)
+        self.total += series.sum()
+        chunk_min, chunk_max = series.min(), series.max()
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+        self.sketch.update(series.to_numpy())
+
+    def summary(self):
+        """Get the statistics as a dict (mean/median are NaN when empty)."""
+        return {
+            "mean": self.total / self.count if self.count else float("nan"),
+            "median": self.sketch.median(),
+            "min": self.min,
+            "max": self.max,
+            "total": self.total,
+        }
+
+
+class GroupAccumulator:
+    """Running groupby sum/count of a value column across chunks.
+
+    Memory is bounded by the number of groups, not the number of rows.
+    """
+
+    def __init__(self, keys, value_column):
+        """Create an empty accumulator.
+
+        Args:
+            keys: Column name or list of names to group by
+            value_column: Column to sum and count
+        """
+        self.keys = keys
+        self.value_column = value_column
+        self.totals = None  # DataFrame of sum and count per group
+
+    def update(self, chunk):
+        """Fold one chunk into the running totals."""
+        part = chunk.groupby(self.keys)[self.value_column].agg(["sum", "count"])
+        if self.totals is None:
+            self.totals = part
+        else:
+            # Concatenating keeps integer sums integer (unlike add with fill)
+            combined = pd.concat([self.totals, part])
+            self.totals = combined.groupby(level=list(range(combined.index.nlevels))).sum()
+
+    def result(self):
+        """Get sum, mean and count per group, sorted by group like groupby."""
+        totals = self.totals
+        if totals is None:
+            totals = pd.DataFrame({"sum": [], "count": []})
+        result = totals.copy()
+        result["mean"] = result["sum"] / result["count"]
+        return result[["sum", "mean", "count"]]
+
+
+class PeriodTotals:
+    """Running totals of a column per calendar period (day, week, ...).
+
+    Memory is bounded by the number of periods, not the number of rows.
+    """
+
+    def __init__(self, rule, date_column='Date', value_column='Sales'):
+        """Create empty totals.
+
+        Args:
+            rule: pandas offset alias such as "D", "W-MON" or "MS"
+            date_column: Column with the dates (parsed if still text)
+            value_column: Column to sum
+        """
+        self.rule = rule
+        self.date_column = date_column
+        self.value_column = value_column
+        self.totals = None  # Series of totals indexed by period start
+
+    def update(self, chunk):
+        """Fold one chunk into the running totals."""
+        dates = pd.to_datetime(chunk[self.date_column])
+        part = resample_period(chunk[self.value_column].set_axis(pd.DatetimeIndex(dates)), self.rule).sum()
+        if self.totals is None:
+            self.totals = part
+        else:
+            # Chunks can share a period at their boundary, so add by period
+            self.totals = pd.concat([self.totals, part]).groupby(level=0).sum()
+
+    def result(self):
+        """Get (period start dates, totals) arrays with empty periods as 0."""
+        if self.totals is None:
+            return np.array([], dtype='datetime64[ns]'), np.array([])
+        totals = resample_period(self.totals, self.rule).sum()
+        return totals.index.to_numpy(), totals.to_numpy()
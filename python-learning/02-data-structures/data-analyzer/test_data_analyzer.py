@@ -0,0 +1,327 @@
+"""
+Unit tests for data_analyzer.py
+
+Run tests with: pytest test_data_analyzer.py
+or just: pytest
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from data_analyzer import compute_groups, compute_statistics, stream_analysis
+
+
+def make_sales(n_rows=5000, seed=0):
+    """Build a random sales table shaped like sales_data.csv."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Date': pd.date_range('2024-01-01', periods=n_rows, freq='h').strftime('%Y-%m-%d %H:%M'),
+        'Product': rng.choice(['Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Webcam'], n_rows),
+        'Sales': rng.integers(10, 2000, n_rows),
+        'Quantity': rng.integers(1, 10, n_rows),
+        'Region': rng.choice(['North', 'South', 'East', 'West'], n_rows),
+    })
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    df = make_sales()
+    filename = tmp_path / "sales.csv"
+    df.to_csv(filename, index=False)
+    return df, filename
+
+
+# Test streaming analysis
+def test_stream_analysis_matches_in_memory(sales_csv):
+    """Test that chunked statistics and groups equal the pandas results."""
+    df, filename = sales_csv
+    rows, stats, groups = stream_analysis(filename, chunksize=777)
+
+    assert rows == len(df)
+    expected = compute_statistics(df)
+    for column in ('Sales', 'Quantity'):
+        for name, value in expected[column].items():
+            assert stats[column][name] == pytest.approx(value), (column, name)
+
+    expected_groups = compute_groups(df)
+    pd.testing.assert_frame_equal(groups["by_product"], expected_groups["by_product"])
+    pd.testing.assert_frame_equal(groups["by_region"], expected_groups["by_region"])
+    pd.testing.assert_series_equal(groups["by_product_region"], expected_groups["by_product_region"])
+
+
+def test_stream_median_sketch_is_within_accuracy(tmp_path):
+    """Test that the bucketed median stays within the relative error."""
+    rng = np.random.default_rng(1)
+    df = make_sales(20_000)
+    df['Sales'] = rng.lognormal(5, 1.5, len(df))
+    filename = tmp_path / "sales.csv"
+    df.to_csv(filename, index=False)
+
+    _, stats, _ = stream_analysis(filename, chunksize=3000, max_exact=500, relative_accuracy=0.01)
+    assert stats['Sales']['median'] == pytest.approx(df['Sales'].median(), rel=0.01)
+    assert stats['Quantity']['median'] == df['Quantity'].median()
+
+
+# Test the columnar cache
+def test_load_data_uses_and_invalidates_cache(sales_csv, capsys):
+    """Test that the Parquet cache is reused, projected and refreshed."""
+    pytest.importorskip("pyarrow")
+    from data_analyzer import load_data
+
+    df, filename = sales_csv
+    first = load_data(filename)
+    second = load_data(filename)
+    loaded = [line for line in capsys.readouterr().out.splitlines() if line.startswith("✓ Loaded")]
+    assert "(cached)" not in loaded[0] and "(cached)" in loaded[1]
+    pd.testing.assert_frame_equal(first, second)
+
+    projected = load_data(filename, columns=['Product', 'Sales'])
+    assert list(projected.columns) == ['Product', 'Sales']
+    pd.testing.assert_frame_equal(projected, first[['Product', 'Sales']])
+
+    # Rewriting the CSV (new size and mtime) must not serve the old copy
+    df.head(10).to_csv(filename, index=False)
+    info = os.stat(filename)
+    os.utime(filename, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+    assert len(load_data(filename)) == 10
+
+
+def test_load_data_survives_unwritable_cache(sales_csv, capsys):
+    """Test that a failed cache write still returns the parsed frame."""
+    pytest.importorskip("pyarrow")
+    from data_analyzer import load_data
+
+    df, filename = sales_csv
+    # A file where the cache folder should be makes every write fail
+    (filename.parent / ".cache").write_text("")
+    loaded = load_data(filename)
+    assert loaded is not None and len(loaded) == len(df)
+    assert "Warning: could not cache" in capsys.readouterr().out
+
+    # A failure after the temp file was written must not leave it behind
+    import columnar_cache
+    (filename.parent / ".cache").unlink()
+    blocked = columnar_cache.cache_path(filename)
+    os.makedirs(os.path.join(blocked, "occupied"))
+    assert load_data(filename) is not None
+    assert not os.path.exists(f"{blocked}.tmp")
+
+
+# Test the memory-optimized schema
+def test_optimized_load_is_smaller_and_equivalent(sales_csv, capsys):
+    """Test that compact dtypes shrink memory without changing results."""
+    from data_analyzer import load_data
+
+    _, filename = sales_csv
+    raw = load_data(filename, use_cache=False, optimize=False)
+    df = load_data(filename, use_cache=False)
+    assert "=== MEMORY USAGE ===" in capsys.readouterr().out
+
+    assert isinstance(df['Product'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df['Date'])
+    assert df['Quantity'].dtype == np.int8 and df['Sales'].dtype == np.int16
+    assert df.memory_usage(deep=True).sum() < raw.memory_usage(deep=True).sum() / 3
+
+    expected, actual = compute_groups(raw), compute_groups(df)
+    for name in ("by_product", "by_region"):
+        frame = actual[name].set_axis(actual[name].index.astype(str))
+        pd.testing.assert_frame_equal(frame, expected[name], check_dtype=False, check_index_type=False)
+    assert compute_statistics(df)['Sales']['total'] == raw['Sales'].sum()
+
+
+# Test the shared aggregation cache
+def test_aggregations_are_computed_once_per_dataset():
+    """Test that consumers share groupbys and new frames start fresh."""
+    import gc
+    from aggregation_cache import AggregationCache
+
+    cache = AggregationCache()
+    df = make_sales(500)
+    by_product = cache.aggregate(df, 'Product')
+    assert cache.aggregate(df, ['Product']) is by_product
+    pd.testing.assert_series_equal(by_product['sum'], df.groupby('Product')['Sales'].sum(),
+                                   check_names=False)
+
+    expected = df.pivot_table(values='Sales', index='Product', columns='Region', aggfunc='sum', fill_value=0)
+    pd.testing.assert_frame_equal(cache.pivot(df, 'Product', 'Region'), expected)
+    cache.aggregate(df, ['Product', 'Region'])
+    assert cache.stats()["misses"] == 3 and cache.stats()["hits"] == 2
+
+    # In-place edits need an explicit invalidation
+    df.loc[0, 'Sales'] += 1
+    cache.invalidate(df)
+    assert cache.aggregate(df, 'Product')['sum'].sum() == df['Sales'].sum()
+
+    # A collected frame's results go with it
+    del df, by_product
+    gc.collect()
+    assert cache.stats()["size"] == 0 and cache.stats()["datasets"] == 0
+
+
+# Test parallel chart rendering
+def test_create_all_charts_writes_every_chart(tmp_path, capsys):
+    """Test that pooled rendering writes each chart atomically."""
+    from data_analyzer import create_all_charts, optimize_dtypes
+
+    df = optimize_dtypes(make_sales(300))
+    paths = create_all_charts(df, tmp_path / "charts", fmt="svg", dpi=72, workers=2)
+
+    names = sorted(path.name for path in (tmp_path / "charts").iterdir())
+    assert names == ['sales_by_product.svg', 'sales_by_region.svg',
+                     'sales_comparison.svg', 'sales_over_time.svg']
+    assert len(paths) == 4 and all(os.path.getsize(path) > 0 for path in paths)
+    assert capsys.readouterr().out.count("✓ Chart saved") == 4
+
+    with pytest.raises(ValueError):
+        create_all_charts(df, tmp_path, fmt="doc")
+
+
+# Test time series downsampling
+def test_downsampling_caps_points_and_keeps_spikes():
+    """Test that lttb and minmax reduce long series without losing peaks."""
+    from downsampling import downsample
+
+    rng = np.random.default_rng(2)
+    dates = pd.date_range('2024-01-01', periods=50_000, freq='min').to_numpy()
+    sales = rng.integers(10, 100, len(dates))
+    sales[12_345] = 10_000
+
+    for mode in ('lttb', 'minmax'):
+        x, y = downsample(dates, sales, mode, max_points=500)
+        assert len(x) <= 500 and 10_000 in y, mode
+        assert (np.diff(x.astype(np.int64)) > 0).all(), mode
+    x, _ = downsample(dates, sales, 'lttb', max_points=500)
+    assert x[0] == dates[0] and x[-1] == dates[-1]
+
+    x, y = downsample(dates, sales, 'daily')
+    expected = pd.Series(sales, index=dates).resample('D').sum()
+    assert list(y) == list(expected) and len(x) == len(expected)
+    x, y = downsample(dates[:10], sales[:10], 'lttb')
+    assert list(y) == list(sales[:10])
+
+
+def test_streamed_period_totals_match_resample(sales_csv, tmp_path):
+    """Test that chunked period totals equal a resample of the whole file."""
+    from data_analyzer import stream_time_series
+    from downsampling import RESAMPLE_RULES, resample_totals
+    from streaming_stats import PeriodTotals
+
+    df, filename = sales_csv
+    totals = PeriodTotals(RESAMPLE_RULES['weekly'])
+    for chunk in pd.read_csv(filename, chunksize=333, usecols=['Date', 'Sales']):
+        totals.update(chunk)
+    dates, sales = totals.result()
+    df_dates = pd.to_datetime(df['Date'])
+    week_starts = df_dates.dt.normalize() - pd.to_timedelta(df_dates.dt.dayofweek, unit='D')
+    expected = df.groupby(week_starts)['Sales'].sum()
+    assert list(dates) == list(expected.index.to_numpy()) and list(sales) == list(expected)
+    # Weekly points are labelled by their Monday, like monthly ones by the 1st
+    assert all(pd.DatetimeIndex(dates).dayofweek == 0)
+    month_dates, _ = resample_totals(df_dates, df['Sales'], RESAMPLE_RULES['monthly'])
+    assert all(pd.DatetimeIndex(month_dates).day == 1)
+
+    path = stream_time_series(filename, 'weekly', chunksize=333, output_dir=tmp_path)
+    assert os.path.getsize(path) > 0
+    with pytest.raises(ValueError):
+        stream_time_series(filename, 'lttb')
+
+
+# Test the partitioned dataset reader
+def test_dataset_pushdown_matches_in_memory_filter(tmp_path):
+    """Test that pruned, parallel reads return exactly the filtered rows."""
+    pytest.importorskip("pyarrow")
+    from sales_dataset import SalesDataset, SalesFilter
+
+    df = make_sales(2400)
+    df['Date'] = df['Date'].str[:10]
+    for (day, region), part in df.groupby(['Date', 'Region']):
+        folder = tmp_path / f"date={day}" / f"region={region}"
+        folder.mkdir(parents=True)
+        part.drop(columns='Region').to_csv(folder / "sales.csv", index=False)
+
+    dataset = SalesDataset(tmp_path, workers=4)
+    everything = dataset.read()
+    assert len(everything) == len(df) and dataset.last_scan["files_read"] == len(dataset.files)
+    assert isinstance(everything['Region'].dtype, pd.CategoricalDtype)
+
+    row_filter = SalesFilter(product='Laptop', region='North', start='2024-01-10', end='2024-01-20',
+                             min_sales=500)
+    selected = dataset.read(row_filter, columns=['Date', 'Sales'])
+    scan = dataset.last_scan
+    assert list(selected.columns) == ['Date', 'Sales']
+    assert scan["files_read"] < scan["files"] / 10
+    assert scan["row_groups_read"] <= scan["row_groups"]
+
+    expected = df[(df['Product'] == 'Laptop') & (df['Region'] == 'North') & (df['Sales'] > 500)
+                  & (df['Date'] >= '2024-01-10') & (df['Date'] <= '2024-01-20')]
+    assert sorted(selected['Sales']) == sorted(expected['Sales'])
+
+    # A threshold above every cached maximum skips whole files unopened
+    assert dataset.read(SalesFilter(min_sales=5000)).empty
+    assert dataset.last_scan["files_read"] == 0
+
+
+def test_dataset_parses_raw_parquet_files(tmp_path):
+    """Test that Parquet written by other tools gets compact dtypes before filtering."""
+    pytest.importorskip("pyarrow")
+    from sales_dataset import SalesDataset, SalesFilter
+
+    df = make_sales(300)
+    df.to_parquet(tmp_path / "sales.parquet")
+    selected = SalesDataset(tmp_path).read(SalesFilter(start='2024-01-03'))
+    assert pd.api.types.is_datetime64_any_dtype(selected['Date'])
+    assert isinstance(selected['Product'].dtype, pd.CategoricalDtype)
+    assert len(selected) == (pd.to_datetime(df['Date']) >= '2024-01-03').sum()
+
+
+def test_dataset_read_survives_unwritable_cache(tmp_path, caplog):
+    """Test that one file whose cache cannot be written still gets read."""
+    pytest.importorskip("pyarrow")
+    from sales_dataset import SalesDataset
+
+    df = make_sales(200)
+    for region in ('North', 'South'):
+        folder = tmp_path / f"region={region}"
+        folder.mkdir()
+        df[df['Region'] == region].to_csv(folder / "sales.csv", index=False)
+    (tmp_path / "region=North" / ".cache").write_text("")
+
+    assert len(SalesDataset(tmp_path).read()) == len(df[df['Region'].isin(['North', 'South'])])
+    assert "could not cache" in caplog.text
+
+
+def test_export_with_no_matches_keeps_the_header(sales_csv, tmp_path, monkeypatch):
+    """Test that an empty result still has the columns and dtypes."""
+    import sys
+    import data_analyzer
+    from sales_dataset import SalesDataset, SalesFilter
+
+    _, filename = sales_csv
+    empty = SalesDataset(filename).read(SalesFilter(product='Nothing'))
+    assert empty.empty and empty['Sales'].sum() == 0
+    assert isinstance(empty['Region'].dtype, pd.CategoricalDtype)
+    assert list(SalesDataset(filename).read(SalesFilter(product='Nothing'), ['Date', 'Sales']).columns) == \
+        ['Date', 'Sales']
+
+    output = tmp_path / "out.csv"
+    monkeypatch.setattr(sys, "argv", ["data_analyzer.py", "--dataset", str(filename),
+                                      "--export", str(output), "--product", "Nothing"])
+    data_analyzer.main()
+    header = pd.read_csv(output)
+    assert header.empty and set(header.columns) == {'Date', 'Product', 'Sales', 'Quantity', 'Region'}
+
+
+def test_stream_time_chart_rejects_in_memory_modes(sales_csv, monkeypatch, capsys):
+    """Test that --stream --time-chart only accepts resampling modes."""
+    import sys
+    import data_analyzer
+
+    _, filename = sales_csv
+    monkeypatch.setattr(sys, "argv", ["data_analyzer.py", "--stream", str(filename),
+                                      "--time-chart", "--time-mode", "lttb"])
+    with pytest.raises(SystemExit) as error:
+        data_analyzer.main()
+    assert error.value.code == 2
+    assert "--time-mode daily, weekly, monthly" in capsys.readouterr().err
@@ -0,0 +1,202 @@
+"""
+Batch Recommendations
+Precompute recommendations for many users across a process pool
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from recommendation_system import RecommendationSystem, load_system
+from snapshot import MappedSnapshot, attach_snapshot, write_snapshot
+
+# The system the workers recommend from: built in the parent and inherited
+# by forked workers, or built once per worker where fork is unavailable
+worker_system = None
+
+
+def load_worker_system(snapshot_filename, backend, mode):
+    """Map the shared snapshot and build what the search mode needs.
+
+    The snapshot is mapped read-only, so the operating system shares its
+    pages between processes instead of each one unpickling its own copy
+    of the purchase data. The similarity backend and, for approximate
+    search, the LSH index are built here rather than on first use.
+    """
+    rec_sys = RecommendationSystem(backend=backend)
+    attach_snapshot(rec_sys, MappedSnapshot(snapshot_filename))
+    if rec_sys.backend is not None:
+        rec_sys.backend.ensure_built()
+    if mode == "approximate":
+        rec_sys.build_lsh_index()
+    return rec_sys
+
+
+def init_worker(snapshot_filename, backend, mode):
+    """Load the system in a worker process (start methods other than fork)."""
+    global worker_system
+    worker_system = load_worker_system(snapshot_filename, backend, mode)
+
+
+def start_pool(snapshot_filename, backend, mode, workers):
+    """Start the worker pool, building the indexes only once if possible.
+
+    With fork the parent builds the matrix and LSH index before the
+    workers start and they inherit them copy-on-write, so N workers do
+    not build (and hold) N copies.
+    """
+    global worker_system
+    if "fork" in multiprocessing.get_all_start_methods():
+        worker_system = load_worker_system(snapshot_filename, backend, mode)
+        return multiprocessing.get_context("fork").Pool(workers)
+    return multiprocessing.Pool(workers, initializer=init_worker, initargs=(snapshot_filename, backend, mode))
+
+
+def recommend_shard(task):
+    """Recommend for one shard of users inside a worker.
+
+    Args:
+        task: (user_ids, top_n, mode) tuple
+
+    Returns:
+        List of (user_id, recommendations or None if the user is unknown)
+    """
+    user_ids, top_n, mode = task
+    results = []
+    for user_id in user_ids:
+        if user_id in worker_system.users:
+            results.append((user_id, worker_system.recommend_products(user_id, top_n=top_n, mode=mode)))
+        else:
+            results.append((user_id, None))
+    return results
+
+
+def available_cpus():
+    """Count the CPUs this process may run on (respects affinity/cgroups)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def shard(items, size):
+    """Split a list into consecutive chunks of at most size items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def batch_recommend(snapshot_filename, user_ids, output, top_n=3, workers=None,
+                    shard_size=500, mode="exact", backend=None, output_format=None):
+    """Recommend for a list of users in parallel and stream results to a file.
+
+    Args:
+        snapshot_filename: Binary snapshot holding the purchase data
+        user_ids: List of user IDs, or "all" for every user in the snapshot
+        output: Destination .jsonl or .csv file
+        top_n: Recommendations per user
+        workers: Worker processes (default: CPUs available to this process)
+        shard_size: Users per task sent to a worker
+        mode: Neighbour search mode, "exact" or "approximate"
+        backend: Similarity backend, built once before the workers fork (None, "sparse", "bitset")
+        output_format: "jsonl" or "csv" (default: from the file extension)
+
+    Returns:
+        Dictionary with users processed, unknown users, seconds and users/second
+    """
+    global worker_system
+    if user_ids == "all":
+        snapshot = MappedSnapshot(snapshot_filename)
+        user_ids = list(snapshot.user_ids.ids)
+        snapshot.close()
+    output_format = output_format or ("csv" if str(output).endswith(".csv") else "jsonl")
+    workers = workers or available_cpus()
+
+    summary = {"users": 0, "unknown": 0}
+    start = time.perf_counter()
+    tasks = ((chunk, top_n, mode) for chunk in shard(user_ids, shard_size))
+
+    try:
+        with open(output, "w", newline="") as f, start_pool(snapshot_filename, backend, mode, workers) as pool:
+            writer = csv.writer(f) if output_format == "csv" else None
+            if writer is not None:
+                writer.writerow(["user_id", "rank", "product_id"])
+
+            # imap keeps input order while shards finish in parallel
+            for results in pool.imap(recommend_shard, tasks):
+                for user_id, recommendations in results:
+                    summary["users"] += 1
+                    if recommendations is None:
+                        summary["unknown"] += 1
+                        continue
+                    if writer is not None:
+                        for rank, product_id in enumerate(recommendations, 1):
+                            writer.writerow([user_id, rank, product_id])
+                    else:
+                        f.write(json.dumps({"user_id": user_id, "recommendations": recommendations}) + "\n")
+    finally:
+        # Forked workers hold their own reference; the parent no longer needs one
+        worker_system = None
+
+    summary["seconds"] = time.perf_counter() - start
+    summary["users_per_second"] = summary["users"] / summary["seconds"] if summary["seconds"] else 0.0
+    return summary
+
+
+def read_user_list(value):
+    """Parse the --users option: "all", "@file" (one ID per line) or "a,b,c"."""
+    if value == "all":
+        return "all"
+    if value.startswith("@"):
+        with open(value[1:]) as f:
+            return [line.strip() for line in f if line.strip()]
+    return [user_id.strip() for user_id in value.split(",") if user_id.strip()]
+
+
+def main():
+    """Command-line entry point for nightly batch jobs."""
+    parser = argparse.ArgumentParser(description="Precompute recommendations in parallel")
+    parser.add_argument("data", help="Binary snapshot, or a JSON data file to snapshot first")
+    parser.add_argument("--users", default="all", help='"all", "@users.txt" or "u1,u2,..."')
+    parser.add_argument("--output", default="recommendations.jsonl", help=".jsonl or .csv file")
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=500)
+    parser.add_argument("--mode", choices=["exact", "approximate"], default="exact")
+    parser.add_argument("--backend", choices=["sparse", "bitset"], default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    snapshot_filename = args.data
+    temp_dir = None
+    if args.data.endswith(".json"):
+        # Workers share a mapped snapshot, so convert JSON data once up front
+        temp_dir = tempfile.TemporaryDirectory()
+        rec_sys = RecommendationSystem()
+        load_system(rec_sys, args.data)
+        snapshot_filename = os.path.join(temp_dir.name, "data.snap")
+        write_snapshot(rec_sys, snapshot_filename)
+        del rec_sys
+
+    try:
+        summary = batch_recommend(
+            snapshot_filename, read_user_list(args.users), args.output,
+            top_n=args.top_n, workers=args.workers, shard_size=args.shard_size,
+            mode=args.mode, backend=args.backend,
+        )
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print(f"✓ Wrote recommendations for {summary['users'] - summary['unknown']} users to {args.output}")
+    if summary["unknown"]:
+        print(f"  Skipped {summary['unknown']} unknown users")
+    print(f"  {summary['seconds']:.1f}s ({summary['users_per_second']:.0f} users/s)")
+
+
+if __name__ == "__main__":
+    main()
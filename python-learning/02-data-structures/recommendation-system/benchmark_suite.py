@@ -0,0 +1,255 @@
+"""
+Benchmark Suite
+Time and memory-profile the recommendation system on synthetic data
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from instrumentation import percentile
+from recommendation_system import RecommendationSystem, load_system, save_system
+from synthetic_data import generate_purchases, parse_size, write_purchases
+
+QUERY_OPERATIONS = ("find_similar_users", "recommend_products", "get_products_bought_together")
+
+
+def measure_memory(function):
+    """Run function under tracemalloc.
+
+    Returns:
+        (result, peak MB, retained MB) where retained is what was still
+        allocated when the function returned
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    mb = 1024 * 1024
+    return result, (peak - before) / mb, (current - before) / mb
+
+
+def result_row(size, operation, timings, peak_mb=None, retained_mb=None, **extra):
+    """Summarise per-call timings (seconds) into one result record."""
+    timings = sorted(timings)
+    total = sum(timings)
+    row = {
+        "size": size,
+        "operation": operation,
+        "calls": len(timings),
+        "seconds": total,
+        "mean_ms": total * 1000 / len(timings) if timings else 0.0,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_mb": peak_mb,
+        "retained_mb": retained_mb,
+    }
+    row.update(extra)
+    return row
+
+
+def new_system(backend, storage):
+    """Create an empty system for one run."""
+    return RecommendationSystem(backend=backend, storage=storage)
+
+
+def benchmark_size(size, workdir, queries=200, backend=None, storage="sets",
+                   memory=True, seed=0):
+    """Benchmark every operation on one generated dataset.
+
+    Ingestion reads the generated CSV through bulk_add_purchases, so file
+    parsing is part of it. Timings always come from untraced runs; when
+    memory is on, a second traced run measures allocations, because
+    tracemalloc itself slows code down several times.
+
+    Args:
+        size: Number of purchase rows to generate
+        workdir: Directory for the generated CSV and saved JSON
+        queries: Timed calls per query operation
+        backend: Similarity backend (None, "sparse" or "bitset")
+        storage: Purchase storage ("sets" or "compact")
+        memory: Also measure memory with tracemalloc
+        seed: Seed for the data and the query sample
+
+    Returns:
+        List of result records
+    """
+    csv_filename = os.path.join(workdir, f"purchases_{size}.csv")
+    json_filename = os.path.join(workdir, f"system_{size}.json")
+    write_purchases(csv_filename, generate_purchases(size, seed=seed))
+    results = []
+
+    # Ingestion
+    rec_sys = new_system(backend, storage)
+    summary = rec_sys.bulk_add_purchases(csv_filename)
+    peak_mb = retained_mb = None
+    if memory:
+        _, peak_mb, retained_mb = measure_memory(
+            lambda: new_system(backend, storage).bulk_add_purchases(csv_filename))
+    results.append(result_row(
+        size, "ingest", [summary["seconds"]], peak_mb, retained_mb,
+        users=len(rec_sys.users), products=len(rec_sys.products), purchases=summary["added"],
+        rows_per_second=summary["rows"] / summary["seconds"] if summary["seconds"] else 0.0,
+    ))
+
+    # Persistence
+    def save():
+        save_system(rec_sys, json_filename)
+
+    def load():
+        loaded = new_system(backend, storage)
+        load_system(loaded, json_filename)
+        return loaded
+
+    for operation, function in (("save_system", save), ("load_system", load)):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        peak_mb = retained_mb = None
+        if memory:
+            _, peak_mb, retained_mb = measure_memory(function)
+        results.append(result_row(size, operation, [seconds], peak_mb, retained_mb,
+                                  file_mb=os.path.getsize(json_filename) / (1024 * 1024)))
+
+    # Queries on a fixed random sample; a backend builds its matrix lazily,
+    # so warm it up first instead of charging the build to one query
+    rng = random.Random(seed)
+    user_ids = rng.sample(list(rec_sys.users), min(queries, len(rec_sys.users)))
+    product_ids = rng.sample(list(rec_sys.products), min(queries, len(rec_sys.products)))
+    if rec_sys.backend is not None:
+        rec_sys.backend.ensure_built()
+
+    calls = {
+        "find_similar_users": (rec_sys.find_similar_users, user_ids, 5),
+        "recommend_products": (rec_sys.recommend_products, user_ids, 3),
+        "get_products_bought_together": (rec_sys.get_products_bought_together, product_ids, 3),
+    }
+    for operation in QUERY_OPERATIONS:
+        method, ids, top_n = calls[operation]
+        timings = []
+        for item_id in ids:
+            start = time.perf_counter()
+            method(item_id, top_n)
+            timings.append(time.perf_counter() - start)
+        peak_mb = retained_mb = None
+        if memory:
+            sample = ids[:20]
+            _, peak_mb, retained_mb = measure_memory(
+                lambda: [method(item_id, top_n) for item_id in sample])
+        results.append(result_row(size, operation, timings, peak_mb, retained_mb))
+
+    os.remove(csv_filename)
+    os.remove(json_filename)
+    return results
+
+
+def run_benchmarks(sizes, output=None, queries=200, backend=None, storage="sets",
+                   memory=True, seed=0):
+    """Benchmark each dataset size and optionally write a JSON report.
+
+    Args:
+        sizes: Purchase counts to benchmark, smallest first
+        output: JSON file for the report (None to skip writing)
+        queries, backend, storage, memory, seed: See benchmark_size
+
+    Returns:
+        Report dictionary with environment, configuration and results
+    """
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"backend": backend, "storage": storage, "queries": queries,
+                   "memory": memory, "seed": seed},
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            report["results"].extend(benchmark_size(
+                size, workdir, queries=queries, backend=backend, storage=storage,
+                memory=memory, seed=seed))
+
+    if output is not None:
+        temp_filename = f"{output}.tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(temp_filename, output)
+    return report
+
+
+def compare_reports(baseline, current, tolerance=0.25, metrics=("mean_ms", "peak_mb")):
+    """Find operations that got slower or hungrier than a baseline report.
+
+    Args:
+        baseline: Report dictionary from an earlier run
+        current: Report dictionary from this run
+        tolerance: Allowed relative increase (0.25 means 25%)
+        metrics: Result fields to compare
+
+    Returns:
+        List of (size, operation, metric, baseline value, current value)
+    """
+    previous = {(row["size"], row["operation"]): row for row in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        old = previous.get((row["size"], row["operation"]))
+        if old is None:
+            continue
+        for metric in metrics:
+            old_value, new_value = old.get(metric), row.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            if new_value > old_value * (1 + tolerance):
+                regressions.append((row["size"], row["operation"], metric, old_value, new_value))
+    return regressions
+
+
+def main():
+    """Run the suite from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation system")
+    parser.add_argument("--sizes", default="1k,10k,100k",
+                        help='Comma-separated purchase counts, e.g. "1k,1m,100m"')
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backend", choices=["sparse", "bitset"], default=None)
+    parser.add_argument("--storage", choices=["sets", "compact"], default="sets")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the traced runs (much faster on large sizes)")
+    parser.add_argument("--compare", help="Baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    report = run_benchmarks(sizes, args.output, queries=args.queries, backend=args.backend,
+                            storage=args.storage, memory=not args.no_memory, seed=args.seed)
+
+    print(f"{'size':>12} {'operation':<30} {'mean ms':>10} {'p99 ms':>10} {'peak MB':>9}")
+    for row in report["results"]:
+        peak = f"{row['peak_mb']:9.1f}" if row["peak_mb"] is not None else f"{'-':>9}"
+        print(f"{row['size']:>12,} {row['operation']:<30} {row['mean_ms']:10.3f} {row['p99_ms']:10.3f} {peak}")
+    print(f"✓ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        for size, operation, metric, old_value, new_value in regressions:
+            print(f"  REGRESSION {operation} @ {size:,}: {metric} {old_value:.3f} -> {new_value:.3f}")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Compact Purchase Store
+Interned integer IDs with sorted array postings instead of sets of strings
+"""
+
+import random
+import sys
+import tracemalloc
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import MutableMapping, MutableSet
+
+
+class IdInterner:
+    """Two-way mapping between external IDs and dense integers.
+
+    IDs are numbered 0, 1, 2, ... in the order they are first seen, so
+    the integer doubles as the insertion position.
+    """
+
+    __slots__ = ("ids", "index")
+
+    def __init__(self, ids=()):
+        self.ids = []  # [external_id], position is the integer ID
+        self.index = {}  # {external_id: integer ID}
+        for external_id in ids:
+            self.intern(external_id)
+
+    def intern(self, external_id):
+        """Get the integer for an ID, assigning the next one if it is new."""
+        number = self.index.get(external_id)
+        if number is None:
+            number = len(self.ids)
+            self.index[external_id] = number
+            self.ids.append(external_id)
+        return number
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, external_id):
+        return external_id in self.index
+
+
+class PostingSet(MutableSet):
+    """Set view over a sorted integer posting list.
+
+    Members are translated to and from external IDs on the fly, so the
+    view behaves like the set of strings it replaces. Any sorted integer
+    sequence works as postings (array, memoryview, NumPy array); read-only
+    ones simply cannot be added to.
+    """
+
+    __slots__ = ("postings", "interner")
+
+    def __init__(self, postings, interner):
+        self.postings = postings
+        self.interner = interner
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Results of &, |, - are ordinary sets
+        return set(iterable)
+
+    def __contains__(self, external_id):
+        number = self.interner.index.get(external_id)
+        if number is None:
+            return False
+        i = bisect_left(self.postings, number)
+        return i < len(self.postings) and self.postings[i] == number
+
+    def __iter__(self):
+        ids = self.interner.ids
+        for number in self.postings:
+            yield ids[number]
+
+    def __len__(self):
+        return len(self.postings)
+
+    def __repr__(self):
+        return f"PostingSet({set(self)!r})"
+
+    def add(self, external_id):
+        number = self.interner.intern(external_id)
+        i = bisect_left(self.postings, number)
+        if i == len(self.postings) or self.postings[i] != number:
+            self.postings.insert(i, number)
+
+    def discard(self, external_id):
+        number = self.interner.index.get(external_id)
+        if number is not None:
+            i = bisect_left(self.postings, number)
+            if i < len(self.postings) and self.postings[i] == number:
+                del self.postings[i]
+
+    def intersection(self, other):
+        return set(self) & set(other)
+
+    def union(self, other):
+        return set(self) | set(other)
+
+
+class CompactPostings(MutableMapping):
+    """{external_id: PostingSet} mapping backed by interned, array postings.
+
+    Keys and members are interned in two IdInterners, which are shared with
+    the reverse mapping so both directions use the same integers. Each key
+    costs one list slot plus an array('I') of 4-byte member IDs, and the
+    PostingSet views are only created when a key is looked up.
+    """
+
+    def __init__(self, keys, members, create_missing=False):
+        """Create an empty mapping.
+
+        Args:
+            keys: IdInterner for the mapping keys
+            members: IdInterner for the members of each posting set
+            create_missing: Behave like defaultdict(set) on unknown keys
+        """
+        self.keys_interner = keys
+        self.members_interner = members
+        self.create_missing = create_missing
+        self.postings = []  # [array('I') or None], indexed by key integer
+        self.count = 0
+
+    def postings_for(self, key, create):
+        """Get the postings of a key, optionally creating an empty list."""
+        if create:
+            number = self.keys_interner.intern(key)
+            if number >= len(self.postings):
+                self.postings.extend([None] * (number + 1 - len(self.postings)))
+        else:
+            number = self.keys_interner.index.get(key)
+            if number is None or number >= len(self.postings):
+                return None
+
+        postings = self.postings[number]
+        if postings is None and create:
+            postings = self.postings[number] = array("I")
+            self.count += 1
+        return postings
+
+    def __getitem__(self, key):
+        postings = self.postings_for(key, create=self.create_missing)
+        if postings is None:
+            raise KeyError(key)
+        return PostingSet(postings, self.members_interner)
+
+    def get(self, key, default=None):
+        # Unlike [], get() never creates a missing key
+        postings = self.postings_for(key, create=False)
+        if postings is None:
+            return default
+        return PostingSet(postings, self.members_interner)
+
+    def __setitem__(self, key, members):
+        self.postings_for(key, create=True)
+        intern = self.members_interner.intern
+        self.postings[self.keys_interner.index[key]] = array(
+            "I", sorted({intern(member) for member in members})
+        )
+
+    def __delitem__(self, key):
+        if self.postings_for(key, create=False) is None:
+            raise KeyError(key)
+        self.postings[self.keys_interner.index[key]] = None
+        self.count -= 1
+
+    def __contains__(self, key):
+        return self.postings_for(key, create=False) is not None
+
+    def __iter__(self):
+        ids = self.keys_interner.ids
+        for number, postings in enumerate(self.postings):
+            if postings is not None:
+                yield ids[number]
+
+    def __len__(self):
+        return self.count
+
+
+def memory_report(n_purchases=1_000_000, n_users=None, n_products=None, seed=0):
+    """Measure memory used by the set-based and compact representations.
+
+    Both are filled with the same random power-law purchases and measured
+    with tracemalloc, then scaled to MB per million purchases.
+
+    Args:
+        n_purchases: Number of purchases to generate
+        n_users: Number of users (default: one per 10 purchases)
+        n_products: Number of products (default: one per 50 purchases)
+        seed: Seed for the generated data
+
+    Returns:
+        Dictionary of {representation: MB per million purchases}
+    """
+    n_users = n_users or max(n_purchases // 10, 1)
+    n_products = n_products or max(n_purchases // 50, 1)
+    rng = random.Random(seed)
+    user_names = [f"user{u:08d}" for u in range(n_users)]
+    product_names = [f"product{p:07d}" for p in range(n_products)]
+    purchases = [
+        (user_names[rng.randrange(n_users)],
+         product_names[min(int(rng.paretovariate(1.0)) - 1, n_products - 1)])
+        for _ in range(n_purchases)
+    ]
+
+    # The ID strings themselves are shared by both layouts, so leave them out
+    report = {}
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = {}
+    product_users = defaultdict(set)
+    for user_id, product_id in purchases:
+        users.setdefault(user_id, set()).add(product_id)
+        product_users[product_id].add(user_id)
+    report["sets"] = tracemalloc.get_traced_memory()[0] - before
+    del users, product_users
+
+    before = tracemalloc.get_traced_memory()[0]
+    user_ids = IdInterner()
+    product_ids = IdInterner()
+    users = CompactPostings(user_ids, product_ids)
+    product_users = CompactPostings(product_ids, user_ids, create_missing=True)
+    for user_id, product_id in purchases:
+        if user_id not in users:
+            users[user_id] = ()
+        users[user_id].add(product_id)
+        product_users[product_id].add(user_id)
+    report["compact"] = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    scale = 1_000_000 / n_purchases / (1024 * 1024)
+    return {name: size * scale for name, size in report.items()}
+
+
+def main():
+    """Print memory per million purchases for both representations."""
+    n_purchases = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Generating {n_purchases:,} purchases...")
+    report = memory_report(n_purchases)
+    for name, mb in report.items():
+        print(f"  {name:>8}: {mb:8.1f} MB per million purchases")
+    print(f"  Saving: {report['sets'] / report['compact']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Offline Evaluation
+Holdout splits, precision/recall/coverage and cost per algorithm variant
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+from batch_recommend import available_cpus, shard
+from instrumentation import percentile
+from recommendation_system import RecommendationSystem, read_purchases
+
+DEFAULT_VARIANTS = [
+    {"name": "jaccard-5", "neighbours": 5},
+    {"name": "jaccard-20", "neighbours": 20},
+    {"name": "jaccard-5+popularity", "neighbours": 5, "popularity": True},
+    {"name": "popularity-only", "popularity": True, "min_basket": float("inf")},
+]
+
+# Set in the parent before forking, so workers share it copy-on-write
+evaluation_state = None
+
+
+def leave_one_out(rows):
+    """Hold out each user's most recent product.
+
+    Users with fewer than two distinct products have nothing left to
+    learn from and are kept entirely in training.
+
+    Args:
+        rows: List of (user_id, product_id) pairs in the order they happened
+
+    Returns:
+        (training rows, {user_id: set of held-out product IDs})
+    """
+    baskets = defaultdict(dict)
+    for user_id, product_id in rows:
+        baskets[user_id][product_id] = None
+    held_out = {}
+    for user_id, products in baskets.items():
+        if len(products) >= 2:
+            held_out[user_id] = next(reversed(products))
+    train = [(user_id, product_id) for user_id, product_id in rows
+             if held_out.get(user_id) != product_id]
+    return train, {user_id: {product_id} for user_id, product_id in held_out.items()}
+
+
+def time_split(rows, test_fraction=0.2):
+    """Train on the earliest rows and test on what users bought next.
+
+    Rows are taken to be in time order (ingestion order). Only users seen
+    in training are tested, and only on products new to them.
+
+    Args:
+        rows: List of (user_id, product_id) pairs in the order they happened
+        test_fraction: Share of the latest rows held out
+
+    Returns:
+        (training rows, {user_id: set of held-out product IDs})
+    """
+    cut = int(len(rows) * (1 - test_fraction))
+    train = rows[:cut]
+    baskets = defaultdict(set)
+    for user_id, product_id in train:
+        baskets[user_id].add(product_id)
+    test = defaultdict(set)
+    for user_id, product_id in rows[cut:]:
+        if user_id in baskets and product_id not in baskets[user_id]:
+            test[user_id].add(product_id)
+    return train, dict(test)
+
+
+def traced(function):
+    """Run function under tracemalloc; returns (result, MB still allocated)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return result, retained / (1024 * 1024)
+
+
+def build_base(train, backend):
+    """Build a system from training rows.
+
+    Returns:
+        (RecommendationSystem, seconds)
+    """
+    start = time.perf_counter()
+    rec_sys = RecommendationSystem(backend=backend)
+    rec_sys.bulk_add_purchases(train)
+    return rec_sys, time.perf_counter() - start
+
+
+def measure_variant_memory(train, backend, variants):
+    """Trace the memory of the build and of each variant in a separate pass.
+
+    tracemalloc slows allocation-heavy code down several times, so the
+    timed pass runs without it and this pass only reports sizes.
+
+    Returns:
+        (MB retained by the build, list of extra MB per variant)
+    """
+    rec_sys, base_memory_mb = traced(lambda: build_base(train, backend)[0])
+    extra_memory_mb = [traced(lambda: prepare_variant(rec_sys, variant))[1] for variant in variants]
+    return base_memory_mb, extra_memory_mb
+
+
+def prepare_variant(rec_sys, variant):
+    """Attach the extra structures a variant needs and warm them up."""
+    rec_sys.popularity = None
+    if variant.get("popularity"):
+        rec_sys.build_popularity_index(min_basket=variant.get("min_basket", 1))
+    if rec_sys.backend is not None:
+        rec_sys.backend.ensure_built()
+    if variant.get("mode") == "approximate" and rec_sys.lsh_index is None:
+        rec_sys.build_lsh_index()
+
+
+def evaluate_users(user_ids):
+    """Score one chunk of test users (runs in a worker or inline).
+
+    Returns:
+        (users, {k: precision sum}, {k: recall sum}, {k: recommended
+        products}, list of seconds per user, whether those are chunk means)
+    """
+    rec_sys, test, variant, ks = evaluation_state
+    max_k = max(ks)
+    neighbours = variant.get("neighbours", 5)
+    mode = variant.get("mode", "exact")
+
+    # Exact search on a matrix backend scores the whole chunk as one block,
+    # so only the chunk's mean time per user is known
+    timings = []
+    if mode == "exact" and rec_sys.backend is not None:
+        start = time.perf_counter()
+        recommendations = rec_sys.recommend_products_batch(user_ids, top_n=max_k, neighbours=neighbours)
+        timings = [(time.perf_counter() - start) / len(user_ids)] * len(user_ids)
+    else:
+        recommendations = {}
+        for user_id in user_ids:
+            start = time.perf_counter()
+            recommendations[user_id] = rec_sys.recommend_products(
+                user_id, top_n=max_k, mode=mode, neighbours=neighbours)
+            timings.append(time.perf_counter() - start)
+
+    precision = dict.fromkeys(ks, 0.0)
+    recall = dict.fromkeys(ks, 0.0)
+    recommended = {k: set() for k in ks}
+    for user_id in user_ids:
+        held_out = test[user_id]
+        products = recommendations[user_id]
+        for k in ks:
+            top = products[:k]
+            hits = len(held_out.intersection(top))
+            precision[k] += hits / k
+            recall[k] += hits / len(held_out)
+            recommended[k].update(top)
+    return len(user_ids), precision, recall, recommended, timings, mode == "exact" and rec_sys.backend is not None
+
+
+def run_variant(rec_sys, test, user_ids, variant, ks, workers, chunk_size):
+    """Evaluate one variant over every test user, in parallel when possible."""
+    global evaluation_state
+    evaluation_state = (rec_sys, test, variant, ks)
+    chunks = list(shard(user_ids, chunk_size))
+
+    # Forked workers inherit the built system without pickling it
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            partials = pool.map(evaluate_users, chunks)
+    else:
+        partials = [evaluate_users(chunk) for chunk in chunks]
+    evaluation_state = None
+
+    users = 0
+    precision = dict.fromkeys(ks, 0.0)
+    recall = dict.fromkeys(ks, 0.0)
+    recommended = {k: set() for k in ks}
+    timings = []
+    chunk_means = False
+    for chunk_users, chunk_precision, chunk_recall, chunk_recommended, chunk_timings, chunk_batched in partials:
+        users += chunk_users
+        for k in ks:
+            precision[k] += chunk_precision[k]
+            recall[k] += chunk_recall[k]
+            recommended[k].update(chunk_recommended[k])
+        timings.extend(chunk_timings)
+        chunk_means = chunk_means or chunk_batched
+    return users, precision, recall, recommended, sorted(timings), chunk_means
+
+
+def evaluate(rows, variants=None, ks=(5, 10), split="leave_one_out", test_fraction=0.2,
+             backend=None, max_users=None, workers=None, chunk_size=256,
+             measure_memory=True, seed=0):
+    """Compare recommendation quality and cost across algorithm variants.
+
+    Variants are dicts with a "name" and optional "neighbours" (users
+    merged per recommendation), "mode" ("exact" or "approximate"),
+    "popularity" (use the popularity fallback) and "min_basket". Each
+    variant is evaluated on the same holdout and the same test users, so
+    the numbers are directly comparable.
+
+    Args:
+        rows: List of (user_id, product_id) pairs in the order they happened
+        variants: List of variant dicts (default: DEFAULT_VARIANTS)
+        ks: Cut-offs for precision@k / recall@k / coverage
+        split: "leave_one_out" or "time"
+        test_fraction: Share of rows held out by the time split
+        backend: Similarity backend for every variant (None, "sparse", "bitset")
+        max_users: Evaluate a random sample of this many test users
+        workers: Processes (default: CPUs available to this process)
+        chunk_size: Users per task (and per vectorized block)
+        measure_memory: Trace allocations in an extra, untimed pass (slower)
+        seed: Seed for sampling test users
+
+    Returns:
+        List of result dicts, one per variant and k. Exact search on a
+        matrix backend scores users in batched chunks; "latency" is then
+        "chunk_mean" and p99_ms is a percentile of chunk means, not of
+        single users.
+    """
+    variants = variants or DEFAULT_VARIANTS
+    ks = sorted(ks)
+    if split == "leave_one_out":
+        train, test = leave_one_out(rows)
+    elif split == "time":
+        train, test = time_split(rows, test_fraction)
+    else:
+        raise ValueError(f"Unknown split: {split}")
+
+    user_ids = sorted(test)
+    if max_users is not None and max_users < len(user_ids):
+        user_ids = sorted(random.Random(seed).sample(user_ids, max_users))
+    workers = workers or available_cpus()
+
+    base_memory_mb = None
+    extra_memory_mb = [None] * len(variants)
+    if measure_memory:
+        base_memory_mb, extra_memory_mb = measure_variant_memory(train, backend, variants)
+
+    rec_sys, build_seconds = build_base(train, backend)
+    catalog = len(rec_sys.products)
+    results = []
+    for variant, variant_memory_mb in zip(variants, extra_memory_mb):
+        start = time.perf_counter()
+        prepare_variant(rec_sys, variant)
+        prepare_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        users, precision, recall, recommended, timings, chunk_means = run_variant(
+            rec_sys, test, user_ids, variant, ks, workers, chunk_size)
+        seconds = time.perf_counter() - start
+
+        for k in ks:
+            results.append({
+                "variant": variant["name"],
+                "k": k,
+                "split": split,
+                "users": users,
+                "precision": precision[k] / users if users else 0.0,
+                "recall": recall[k] / users if users else 0.0,
+                "coverage": len(recommended[k]) / catalog if catalog else 0.0,
+                "ms_per_user": sum(timings) * 1000 / len(timings) if timings else 0.0,
+                "p99_ms": percentile(timings, 0.99) * 1000,
+                "latency": "chunk_mean" if chunk_means else "per_user",
+                "users_per_second": users / seconds if seconds else 0.0,
+                "build_seconds": build_seconds + prepare_seconds,
+                "memory_mb": (base_memory_mb + variant_memory_mb) if measure_memory else None,
+            })
+    return results
+
+
+def main():
+    """Evaluate variants from the command line."""
+    parser = argparse.ArgumentParser(description="Offline evaluation of recommendation variants")
+    parser.add_argument("data", nargs="?", help="CSV/JSONL purchases in time order")
+    parser.add_argument("--synthetic", help='Generate this many rows instead, e.g. "1m"')
+    parser.add_argument("--split", choices=["leave_one_out", "time"], default="leave_one_out")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--k", default="5,10", help="Comma-separated cut-offs")
+    parser.add_argument("--neighbours", default=None,
+                        help="Comma-separated neighbour counts to compare (replaces the default variants)")
+    parser.add_argument("--backend", choices=["sparse", "bitset"], default=None)
+    parser.add_argument("--max-users", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-memory", action="store_true", help="Skip allocation tracing")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from synthetic_data import generate_purchases, parse_size
+        rows = list(generate_purchases(parse_size(args.synthetic), seed=args.seed))
+    elif args.data:
+        rows = list(read_purchases(args.data))
+    else:
+        parser.error("give a data file or --synthetic")
+
+    variants = None
+    if args.neighbours:
+        variants = [{"name": f"jaccard-{n}", "neighbours": int(n)} for n in args.neighbours.split(",")]
+
+    results = evaluate(
+        rows, variants, ks=[int(k) for k in args.k.split(",")], split=args.split,
+        test_fraction=args.test_fraction, backend=args.backend, max_users=args.max_users,
+        workers=args.workers, measure_memory=not args.no_memory, seed=args.seed,
+    )
+
+    print(f"{'variant':<22} {'k':>3} {'precision':>9} {'recall':>7} {'coverage':>8} "
+          f"{'ms/user':>8} {'MB':>7}")
+    for row in results:
+        memory = f"{row['memory_mb']:7.1f}" if row["memory_mb"] is not None else f"{'-':>7}"
+        print(f"{row['variant']:<22} {row['k']:>3} {row['precision']:>9.4f} {row['recall']:>7.4f} "
+              f"{row['coverage']:>8.2%} {row['ms_per_user']:>8.3f} {memory}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Instrumentation
+Call counters, latency histograms and candidate-set sizes for the hot paths
+"""
+
+import functools
+import math
+import time
+from collections import Counter
+
+# Bucket i of a histogram covers values up to BUCKET_RATIO ** (i + 1), so
+# percentiles read from it are within about 19% of the true value
+BUCKET_RATIO = 2 ** 0.25
+LOG_RATIO = math.log(BUCKET_RATIO)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Histogram:
+    """Fixed-size log-scale histogram of non-negative values.
+
+    Recording a value is a log and a counter increment, and memory stays
+    constant no matter how many values are recorded, so it can run on
+    every query of a long-lived service.
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        """Create an empty histogram."""
+        self.buckets = Counter()  # {bucket index: values recorded}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """Add one value."""
+        self.buckets[math.floor(math.log(value) / LOG_RATIO) if value > 0 else None] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Estimate a percentile (upper bound of the bucket it falls in)."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for index in sorted(key for key in self.buckets if key is not None):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(BUCKET_RATIO ** (index + 1), self.max)
+        return self.max
+
+    def summary(self, scale=1.0):
+        """Summarise as a dict, multiplying values by scale (e.g. 1000 for ms)."""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count * scale if self.count else 0.0,
+            "p50": self.percentile(0.50) * scale,
+            "p90": self.percentile(0.90) * scale,
+            "p99": self.percentile(0.99) * scale,
+            "max": self.max * scale,
+        }
+
+
+class Metrics:
+    """Counters and histograms collected by an instrumented system.
+
+    Attach with RecommendationSystem.enable_metrics(); while the system's
+    metrics attribute is None, instrumented methods skip all of this.
+    """
+
+    def __init__(self):
+        """Start with nothing recorded."""
+        self.counters = Counter()  # {name: count}
+        self.latencies = {}  # {operation: Histogram of seconds}
+        self.sizes = {}  # {name: Histogram of set sizes}
+
+    def count(self, name, amount=1):
+        """Increment a counter."""
+        self.counters[name] += amount
+
+    def observe_latency(self, operation, seconds):
+        """Record one call's duration and count the call."""
+        self.counters[operation] += 1
+        histogram = self.latencies.get(operation)
+        if histogram is None:
+            histogram = self.latencies[operation] = Histogram()
+        histogram.record(seconds)
+
+    def observe_size(self, name, size):
+        """Record the size of a candidate set (users scored, products merged)."""
+        histogram = self.sizes.get(name)
+        if histogram is None:
+            histogram = self.sizes[name] = Histogram()
+        histogram.record(size)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.counters.clear()
+        self.latencies.clear()
+        self.sizes.clear()
+
+    def snapshot(self):
+        """Get everything recorded as a JSON-serializable dict.
+
+        Returns:
+            {"counters": {...}, "latency_ms": {operation: summary},
+             "sizes": {name: summary}}
+        """
+        return {
+            "counters": dict(self.counters),
+            "latency_ms": {name: histogram.summary(1000) for name, histogram in self.latencies.items()},
+            "sizes": {name: histogram.summary() for name, histogram in self.sizes.items()},
+        }
+
+
+def instrumented(operation):
+    """Decorate a RecommendationSystem method to time it into self.metrics.
+
+    With metrics disabled the wrapper costs one attribute check and a call.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.observe_latency(operation, time.perf_counter() - start)
+        return wrapper
+    return decorate
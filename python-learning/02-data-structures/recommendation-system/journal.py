@@ -0,0 +1,164 @@
+"""
+Purchase Journal
+Append-only write-ahead log of mutations, compacted into the data file
+"""
+
+import json
+import logging
+import os
+
+# Quiet unless the application configures logging (main() does)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FLUSH_MODES = ("always", "batch", "none")
+
+
+class PurchaseJournal:
+    """Append-only log of add_user / add_product / add_purchase calls.
+
+    Every mutation is appended as one JSON line, so recording a purchase
+    costs a short write instead of rewriting the whole data file. On load
+    the journal is replayed on top of the data file, and once it grows
+    past compact_every records the data file is rewritten and the journal
+    emptied. If that rewrite fails, the next attempt waits for another
+    compact_every records instead of retrying on every write.
+    """
+
+    def __init__(self, filename, data_filename, flush="batch", flush_every=100,
+                 compact_every=10_000):
+        """Open (or create) a journal.
+
+        Args:
+            filename: Path of the journal file
+            data_filename: JSON data file the journal is compacted into
+            flush: "always" fsyncs every record (safest), "batch" fsyncs
+                every flush_every records, "none" leaves it to the OS
+            flush_every: Records per fsync in "batch" mode
+            compact_every: Records after which the journal is compacted
+        """
+        if flush not in FLUSH_MODES:
+            raise ValueError(f"Unknown flush mode: {flush}")
+        self.filename = filename
+        self.data_filename = data_filename
+        self.flush_mode = flush
+        self.flush_every = flush_every
+        self.compact_every = compact_every
+        self.compact_at = compact_every
+        self.drop_torn_record()
+        self.records = self.count_records()
+        self.unflushed = 0
+        self.file = open(filename, "a", encoding="utf-8")
+
+    def drop_torn_record(self):
+        """Cut a half-written last line (from a crash mid-write) off the file.
+
+        Otherwise the next record would be appended to it and the merged
+        line would be unreadable on replay.
+        """
+        try:
+            with open(self.filename, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return
+                # Scan back block by block for the end of the last whole record
+                end = size
+                while end > 0:
+                    start = max(end - 4096, 0)
+                    f.seek(start)
+                    newline = f.read(end - start).rfind(b"\n")
+                    if newline != -1:
+                        end = start + newline + 1
+                        break
+                    end = start
+                f.truncate(end)
+                logger.warning("Warning: dropped a torn record at the end of %s", self.filename)
+        except FileNotFoundError:
+            pass
+
+    def count_records(self):
+        """Count records already in the journal file."""
+        try:
+            with open(self.filename, "rb") as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def append(self, operation, *args):
+        """Append one mutation, flushing according to the flush mode."""
+        self.file.write(json.dumps([operation, *args]) + "\n")
+        self.records += 1
+        self.unflushed += 1
+        if self.flush_mode == "always" or (
+                self.flush_mode == "batch" and self.unflushed >= self.flush_every):
+            self.flush()
+
+    def flush(self):
+        """Force buffered records to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+
+    def needs_compaction(self):
+        """Check whether the journal has grown past compact_every records."""
+        return self.records >= self.compact_at
+
+    def replay(self, rec_sys):
+        """Apply every journaled mutation to a recommendation system.
+
+        A torn final line (from a crash mid-write) is ignored, and so is a
+        purchase whose user or product is unknown, with a warning.
+
+        Returns:
+            Number of records replayed
+        """
+        self.file.flush()
+        replayed = 0
+        journal, rec_sys.journal = rec_sys.journal, None
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        operation, *args = json.loads(line)
+                    except ValueError:
+                        continue
+                    if operation == "add_user":
+                        rec_sys.record_user(*args)
+                    elif operation == "add_product":
+                        rec_sys.record_product(*args)
+                    elif operation == "add_purchase":
+                        user_id, product_id = args
+                        if user_id not in rec_sys.users or product_id not in rec_sys.products:
+                            logger.warning("Warning: skipped journaled purchase of %s by unknown %s",
+                                           product_id, user_id)
+                            continue
+                        rec_sys.record_purchase(user_id, product_id)
+                    replayed += 1
+        finally:
+            rec_sys.journal = journal
+        return replayed
+
+    def truncate(self):
+        """Empty the journal once its records are safely in the data file."""
+        self.file.close()
+        self.file = open(self.filename, "w", encoding="utf-8")
+        self.flush()
+        self.records = 0
+        self.compact_at = self.compact_every
+
+    def compact(self, rec_sys):
+        """Rewrite the data file from memory and empty the journal."""
+        from recommendation_system import save_system
+        save_system(rec_sys, self.data_filename)
+        if self.records:
+            # The save failed (save_system logged why); retry after more records
+            self.compact_at = self.records + self.compact_every
+
+    def close(self):
+        """Flush and close the journal file."""
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
@@ -0,0 +1,199 @@
+"""
+MinHash / LSH Index
+Approximate nearest neighbours for Jaccard similarity
+"""
+
+import random
+import time
+import zlib
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+class MinHashLSH:
+    """MinHash signatures grouped into bands of an LSH index.
+
+    Each user's basket is summarised by bands × rows MinHash values. Two
+    users land in the same bucket of a band when all rows of that band
+    agree, which happens with probability close to their Jaccard
+    similarity raised to the number of rows. Users sharing any bucket are
+    the candidates for a similarity query.
+    """
+
+    def __init__(self, bands=16, rows=4, seed=1):
+        """Create an empty index.
+
+        Args:
+            bands: Number of bands (more bands -> higher recall)
+            rows: MinHash values per band (more rows -> fewer false candidates)
+            seed: Seed for the hash functions, fixed so signatures are stable
+        """
+        self.bands = bands
+        self.rows = rows
+        self.num_hashes = bands * rows
+
+        rng = random.Random(seed)
+        self.hash_params = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(self.num_hashes)
+        ]
+
+        self.product_hashes = {}  # {product_id: tuple of hash values}
+        self.signatures = {}  # {user_id: list of MinHash values}
+        self.buckets = [{} for _ in range(bands)]  # [{band key: set of user_ids}]
+
+    def hashes_for(self, product_id):
+        """Get (and cache) the hash values of one product."""
+        hashes = self.product_hashes.get(product_id)
+        if hashes is None:
+            # crc32 rather than hash() so signatures survive restarts
+            base = zlib.crc32(str(product_id).encode("utf-8"))
+            hashes = tuple(
+                ((a * base + b) % MERSENNE_PRIME) & MAX_HASH
+                for a, b in self.hash_params
+            )
+            self.product_hashes[product_id] = hashes
+        return hashes
+
+    def band_key(self, signature, band):
+        """Get the bucket key of one band of a signature."""
+        start = band * self.rows
+        return tuple(signature[start:start + self.rows])
+
+    def add_purchase(self, user_id, product_id):
+        """Fold one new purchase into a user's signature.
+
+        Only the bands whose MinHash values dropped are moved to a new
+        bucket, so an update costs O(bands × rows) regardless of how many
+        users are indexed.
+        """
+        hashes = self.hashes_for(product_id)
+        signature = self.signatures.get(user_id)
+        if signature is None:
+            self.signatures[user_id] = list(hashes)
+            for band in range(self.bands):
+                self.buckets[band].setdefault(self.band_key(hashes, band), set()).add(user_id)
+            return
+
+        for band in range(self.bands):
+            start = band * self.rows
+            changed = False
+            old_key = tuple(signature[start:start + self.rows])
+            for i in range(start, start + self.rows):
+                if hashes[i] < signature[i]:
+                    signature[i] = hashes[i]
+                    changed = True
+            if changed:
+                bucket = self.buckets[band][old_key]
+                bucket.discard(user_id)
+                if not bucket:
+                    del self.buckets[band][old_key]
+                self.buckets[band].setdefault(self.band_key(signature, band), set()).add(user_id)
+
+    def build(self, users):
+        """Index every basket from scratch.
+
+        Args:
+            users: Dictionary of {user_id: set of product_ids}
+        """
+        self.signatures = {}
+        self.buckets = [{} for _ in range(self.bands)]
+        for user_id, products in users.items():
+            for product_id in products:
+                self.add_purchase(user_id, product_id)
+
+    def candidates(self, user_id):
+        """Get every user sharing at least one bucket with the given user."""
+        signature = self.signatures.get(user_id)
+        if signature is None:
+            return set()
+
+        found = set()
+        for band in range(self.bands):
+            found.update(self.buckets[band].get(self.band_key(signature, band), ()))
+        found.discard(user_id)
+        return found
+
+
+def recall_report(rec_sys, configs, top_n=5, sample_size=200, seed=0):
+    """Compare approximate neighbours against the exact Jaccard path.
+
+    Args:
+        rec_sys: A populated RecommendationSystem
+        configs: List of (bands, rows) pairs to try
+        top_n: Neighbours requested per query
+        sample_size: Number of users to query
+        seed: Seed for picking the sample
+
+    Returns:
+        List of dictionaries, one per configuration, with recall and
+        mean latency (ms) of both paths
+    """
+    rng = random.Random(seed)
+    active_users = [user_id for user_id, products in rec_sys.users.items() if products]
+    sample = rng.sample(active_users, min(sample_size, len(active_users)))
+
+    # Exact answers only count neighbours that share something
+    exact = {}
+    start = time.perf_counter()
+    for user_id in sample:
+        exact[user_id] = rec_sys.find_similar_users(user_id, top_n=top_n)
+    exact_ms = (time.perf_counter() - start) * 1000 / max(len(sample), 1)
+
+    results = []
+    for bands, rows in configs:
+        rec_sys.build_lsh_index(bands=bands, rows=rows)
+        found = 0
+        relevant = 0
+        candidates = 0
+        start = time.perf_counter()
+        approximate = {
+            user_id: rec_sys.find_similar_users(user_id, top_n=top_n, mode="approximate")
+            for user_id in sample
+        }
+        approx_ms = (time.perf_counter() - start) * 1000 / max(len(sample), 1)
+
+        for user_id in sample:
+            expected = {other for other, score in exact[user_id] if score > 0}
+            returned = {other for other, _ in approximate[user_id]}
+            relevant += len(expected)
+            found += len(expected & returned)
+            candidates += len(rec_sys.lsh_index.candidates(user_id))
+
+        results.append({
+            "bands": bands,
+            "rows": rows,
+            "recall": found / relevant if relevant else 1.0,
+            "avg_candidates": candidates / max(len(sample), 1),
+            "exact_ms": exact_ms,
+            "approx_ms": approx_ms,
+        })
+    return results
+
+
+def main():
+    """Print a recall-vs-latency table on a random power-law dataset."""
+    from recommendation_system import RecommendationSystem
+
+    rng = random.Random(42)
+    rec_sys = RecommendationSystem()
+    n_users, n_products = 5000, 2000
+    rec_sys.users = {f"U{u}": set() for u in range(n_users)}
+    rec_sys.products = {f"P{p}": f"Product {p}" for p in range(n_products)}
+    for user_id, products in rec_sys.users.items():
+        for _ in range(rng.randint(1, 20)):
+            product_id = f"P{min(int(rng.paretovariate(0.8)) - 1, n_products - 1)}"
+            products.add(product_id)
+            rec_sys.product_users[product_id].add(user_id)
+    rec_sys.rebuild_indexes()
+
+    configs = [(8, 2), (16, 2), (16, 4), (32, 4), (32, 8), (64, 4)]
+    print(f"{'bands':>5} {'rows':>4} {'recall':>7} {'cands':>8} {'exact ms':>9} {'approx ms':>9}")
+    for row in recall_report(rec_sys, configs):
+        print(f"{row['bands']:>5} {row['rows']:>4} {row['recall']:>7.1%} "
+              f"{row['avg_candidates']:>8.1f} {row['exact_ms']:>9.3f} {row['approx_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
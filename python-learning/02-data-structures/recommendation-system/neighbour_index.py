@@ -0,0 +1,147 @@
+"""
+Neighbour Index
+Top-K most similar users per user, maintained as purchases arrive
+"""
+
+import random
+from bisect import insort
+
+
+class NeighbourIndex:
+    """Bounded top-K neighbour list for every user.
+
+    Lists hold only users with positive similarity, as (-similarity,
+    insertion position, user_id) tuples so plain sorting gives the same
+    order as find_similar_users. A purchase only changes similarities
+    between the buyer and users sharing one of the buyer's products, so
+    just those lists are touched.
+    """
+
+    def __init__(self, rec_sys, k=10):
+        """Create the index (call rebuild() to fill it).
+
+        Args:
+            rec_sys: The RecommendationSystem to index
+            k: Neighbours kept per user; queries for more fall back to a search
+        """
+        self.rec_sys = rec_sys
+        self.k = k
+        self.neighbours = {}  # {user_id: sorted list of (-similarity, order, user_id)}
+        self.rescored = 0  # full rescoring passes since the last rebuild
+
+    def score_user(self, user_id):
+        """Compute a user's top-K positive neighbours from scratch."""
+        rec_sys = self.rec_sys
+        ranked = rec_sys.rank_similar_users(user_id, rec_sys.users[user_id], self.k)
+        return [(-similarity, rec_sys.user_order[other_user_id], other_user_id)
+                for other_user_id, similarity in ranked if similarity > 0]
+
+    def rebuild(self, block_size=256):
+        """Recompute every list, e.g. offline after a bulk load.
+
+        Uses the system's matrix backend, when it has one, to score users
+        in vectorized blocks.
+        """
+        rec_sys = self.rec_sys
+        self.neighbours = {}
+        self.rescored = 0
+        backend = rec_sys.backend
+        user_ids = list(rec_sys.users)
+        if backend is None:
+            for user_id in user_ids:
+                self.neighbours[user_id] = self.score_user(user_id)
+            return
+
+        for start in range(0, len(user_ids), block_size):
+            block = user_ids[start:start + block_size]
+            for user_id, ranked in zip(block, backend.similar_users_block(block, self.k)):
+                self.neighbours[user_id] = [
+                    (-similarity, rec_sys.user_order[other_user_id], other_user_id)
+                    for other_user_id, similarity in ranked if similarity > 0
+                ]
+
+    def add_user(self, user_id):
+        """Start an empty list for a new user."""
+        self.neighbours[user_id] = []
+
+    def purchase_recorded(self, user_id, product_id):
+        """Update lists after user_id's basket gained product_id."""
+        rec_sys = self.rec_sys
+        basket = rec_sys.users[user_id]
+        self.neighbours[user_id] = self.score_user(user_id)
+
+        # Only co-purchasers' similarity to the buyer changed
+        order = rec_sys.user_order[user_id]
+        shared_counts = rec_sys.count_shared_products(user_id, basket)
+        for other_user_id, shared in shared_counts.items():
+            union = len(basket) + len(rec_sys.users[other_user_id]) - shared
+            self.update_entry(other_user_id, user_id, order, shared / union)
+
+    def update_entry(self, owner_id, user_id, order, similarity):
+        """Move one user within another user's list after a score change."""
+        entries = self.neighbours.setdefault(owner_id, [])
+        was_full = len(entries) >= self.k
+        old_similarity = 0.0
+        for i, (negative, _, other_user_id) in enumerate(entries):
+            if other_user_id == user_id:
+                old_similarity = -negative
+                del entries[i]
+                break
+
+        if similarity > 0:
+            insort(entries, (-similarity, order, user_id))
+            del entries[self.k:]
+
+        # A user who slipped to the bottom of a full list may now rank
+        # below someone who was never stored, so recompute that list
+        if was_full and 0 < old_similarity and similarity < old_similarity:
+            if similarity == 0 or entries[-1][2] == user_id:
+                self.neighbours[owner_id] = self.score_user(owner_id)
+                self.rescored += 1
+
+    def similar_users(self, user_id, top_n):
+        """Read a neighbour list, padded like find_similar_users.
+
+        Args:
+            user_id: The user to look up
+            top_n: Number of users to return (at most k)
+
+        Returns:
+            List of (user_id, similarity_score) tuples
+        """
+        entries = self.neighbours.get(user_id)
+        if entries is None:
+            entries = self.neighbours[user_id] = self.score_user(user_id)
+        similar_users = [(other_user_id, -negative) for negative, _, other_user_id in entries[:top_n]]
+
+        # A short list holds every positive neighbour, so the rest score 0
+        if len(similar_users) < top_n:
+            listed = {other_user_id for _, _, other_user_id in entries}
+            for other_user_id in self.rec_sys.users:
+                if len(similar_users) >= top_n:
+                    break
+                if other_user_id != user_id and other_user_id not in listed:
+                    similar_users.append((other_user_id, 0.0))
+        return similar_users
+
+    def check_consistency(self, sample_size=None, seed=0):
+        """Compare stored lists against the exact computation.
+
+        Args:
+            sample_size: Users to check (default: all)
+            seed: Seed for picking the sample
+
+        Returns:
+            List of user IDs whose stored list is wrong (empty when consistent)
+        """
+        rec_sys = self.rec_sys
+        user_ids = list(rec_sys.users)
+        if sample_size is not None and sample_size < len(user_ids):
+            user_ids = random.Random(seed).sample(user_ids, sample_size)
+
+        mismatched = []
+        for user_id in user_ids:
+            expected = rec_sys.rank_similar_users(user_id, rec_sys.users[user_id], self.k)
+            if self.similar_users(user_id, self.k) != expected:
+                mismatched.append(user_id)
+        return mismatched
@@ -0,0 +1,182 @@
+"""
+Popularity Index
+Incrementally maintained bestseller rankings for cold-start recommendations
+"""
+
+
+class PopularityRanking:
+    """Products kept sorted by buyer count with O(1) updates.
+
+    The ranked list is ordered by count, highest first, and products with
+    the same count sit in one contiguous block. A purchase only swaps the
+    product to the front of its block and moves the block boundary, so
+    the top N is always just ranked[:N].
+
+    Readers only ever look at a prefix of the ranking, so top() records
+    how deep it has read and increment() reports whether that prefix
+    changed. Caches can then keep results that read popular products
+    until a purchase actually reorders what they saw.
+    """
+
+    __slots__ = ("ranked", "position", "counts", "block_start", "block_size", "read_depth")
+
+    def __init__(self):
+        """Create an empty ranking."""
+        self.ranked = []  # product_ids, most bought first
+        self.position = {}  # {product_id: index in ranked}
+        self.counts = {}  # {product_id: buyers}
+        self.block_start = {}  # {count: index of the first product with it}
+        self.block_size = {}  # {count: products with it}
+        self.read_depth = -1  # last index top() looked at since the last reported change
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def add_product(self, product_id):
+        """Start tracking a product with zero buyers (at the end)."""
+        if product_id in self.position:
+            return
+        self.position[product_id] = len(self.ranked)
+        self.ranked.append(product_id)
+        self.counts[product_id] = 0
+        self.block_start.setdefault(0, len(self.ranked) - 1)
+        self.block_size[0] = self.block_size.get(0, 0) + 1
+
+    def increment(self, product_id):
+        """Count one more buyer of a product.
+
+        Returns:
+            True if the part of the ranking read by top() changed
+        """
+        if product_id not in self.position:
+            self.add_product(product_id)
+        count = self.counts[product_id]
+        ranked, position = self.ranked, self.position
+
+        # Swap the product to the front of its block, then move it across
+        # the boundary into the block above
+        first = self.block_start[count]
+        other_product_id = ranked[first]
+        index = position[product_id]
+        ranked[first], ranked[index] = product_id, other_product_id
+        position[product_id], position[other_product_id] = first, index
+
+        self.block_size[count] -= 1
+        if self.block_size[count]:
+            self.block_start[count] = first + 1
+        else:
+            del self.block_size[count], self.block_start[count]
+        self.block_start.setdefault(count + 1, first)
+        self.block_size[count + 1] = self.block_size.get(count + 1, 0) + 1
+        self.counts[product_id] = count + 1
+
+        # The product moved to index first; top() also hides zero counts
+        changed = first <= self.read_depth and (first != index or count == 0)
+        if changed:
+            self.read_depth = -1
+        return changed
+
+    def top(self, top_n, exclude=(), skip=()):
+        """Read the most bought products.
+
+        Args:
+            top_n: Number of products to return
+            exclude: Products to leave out (e.g. the user's basket)
+            skip: More products to leave out (e.g. ones already picked)
+
+        Returns:
+            List of product IDs; only products with buyers are returned
+        """
+        result = []
+        for index, product_id in enumerate(self.ranked):
+            if len(result) >= top_n:
+                break
+            self.read_depth = max(self.read_depth, index)
+            if self.counts[product_id] == 0:
+                break
+            if product_id not in exclude and product_id not in skip:
+                result.append(product_id)
+        return result
+
+
+class PopularityIndex:
+    """Global and per-segment bestseller rankings for a system.
+
+    Used by recommend_products once built: users with fewer than
+    min_basket purchases are answered straight from the rankings without
+    a similarity search, and similarity results that come up short of
+    top_n are topped up with popular products. Segments are the optional
+    labels given to add_user (e.g. a region or customer tier); a user's
+    own segment is preferred before the global ranking.
+    """
+
+    def __init__(self, rec_sys, min_basket=1):
+        """Create the index (call rebuild() to fill it).
+
+        Args:
+            rec_sys: The RecommendationSystem to rank
+            min_basket: Users with fewer purchases get popularity only
+        """
+        self.rec_sys = rec_sys
+        self.min_basket = min_basket
+        self.overall = PopularityRanking()
+        self.segments = {}  # {segment: PopularityRanking}
+
+    def rebuild(self):
+        """Recount every ranking from the purchase data."""
+        rec_sys = self.rec_sys
+        self.overall = PopularityRanking()
+        self.segments = {}
+        # Products in order of buyers, so the rankings are built sorted
+        buyers = sorted(((len(rec_sys.product_users.get(product_id, ())), product_id)
+                         for product_id in rec_sys.products), key=lambda x: -x[0])
+        for count, product_id in buyers:
+            self.overall.add_product(product_id)
+            for _ in range(count):
+                self.overall.increment(product_id)
+        for user_id, segment in rec_sys.user_segments.items():
+            if segment is not None:
+                ranking = self.segments.setdefault(segment, PopularityRanking())
+                for product_id in rec_sys.users.get(user_id, ()):
+                    ranking.increment(product_id)
+
+    def add_product(self, product_id):
+        """Track a new product."""
+        self.overall.add_product(product_id)
+
+    def purchase_recorded(self, user_id, product_id):
+        """Count a new purchase globally and in the buyer's segment.
+
+        Returns:
+            List of rankings whose read part changed: None for the overall
+            ranking, otherwise the segment
+        """
+        changed = []
+        if self.overall.increment(product_id):
+            changed.append(None)
+        segment = self.rec_sys.user_segments.get(user_id)
+        if segment is not None:
+            if self.segments.setdefault(segment, PopularityRanking()).increment(product_id):
+                changed.append(segment)
+        return changed
+
+    def popular_products(self, top_n, segment=None, exclude=(), skip=()):
+        """Most bought products, from the segment first, then overall.
+
+        Costs O(top_n) plus the excluded products passed over.
+
+        Returns:
+            List of product IDs
+        """
+        result = []
+        ranking = self.segments.get(segment) if segment is not None else None
+        if ranking is not None:
+            result = ranking.top(top_n, exclude, skip)
+        if len(result) < top_n:
+            picked = set(result).union(skip)
+            result.extend(self.overall.top(top_n - len(result), exclude, picked))
+        return result
+
+    def is_cold(self, user_id):
+        """Check whether a user has too few purchases for similarity."""
+        return len(self.rec_sys.users[user_id]) < self.min_basket
@@ -0,0 +1,300 @@
+"""
+Recommendation Server
+asyncio HTTP/JSON endpoint that micro-batches concurrent requests
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from instrumentation import percentile
+from recommendation_system import RecommendationSystem, load_system
+from snapshot import load_snapshot
+
+# Quiet unless the application configures logging (main() does)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+
+class RecommendationServer:
+    """Serve recommend_products and get_products_bought_together over HTTP.
+
+    Requests are queued and a single batcher task drains the queue: once
+    the first request arrives it waits up to batch_window seconds (or
+    until max_batch requests) and answers the whole batch with one call
+    to recommend_products_batch. The computation runs on one worker
+    thread, so the event loop keeps accepting connections meanwhile and
+    the recommendation system is only ever touched by that thread.
+
+    Endpoints:
+        GET /recommend?user_id=U1&top_n=3
+        GET /bought_together?product_id=P1&top_n=3
+        GET /metrics
+    """
+
+    def __init__(self, rec_sys, batch_window=0.002, max_batch=256, latency_samples=10_000):
+        """Create a server around a loaded recommendation system.
+
+        Args:
+            rec_sys: The RecommendationSystem to serve
+            batch_window: Seconds to wait for more requests after the first
+            max_batch: Most requests answered in one batch
+            latency_samples: Recent request latencies kept for percentiles
+        """
+        self.rec_sys = rec_sys
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.latencies = deque(maxlen=latency_samples)
+        self.requests = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_queue_depth = 0
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """Start listening; returns the asyncio server."""
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self.run_batcher())
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def stop(self):
+        """Stop the batcher task and the worker thread."""
+        self.batcher.cancel()
+        try:
+            await self.batcher
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, kind, item_id, top_n):
+        """Queue one query and wait for its batched answer."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((kind, item_id, top_n, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def run_batcher(self):
+        """Collect requests into micro-batches and answer them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.batched_requests += len(batch)
+            try:
+                answers = await loop.run_in_executor(self.executor, self.answer_batch, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), answer in zip(batch, answers):
+                if not future.done():
+                    future.set_result(answer)
+
+    def answer_batch(self, batch):
+        """Compute every answer of a batch (runs on the worker thread)."""
+        rec_sys = self.rec_sys
+
+        # One vectorized neighbour search per distinct top_n
+        by_top_n = {}
+        for kind, item_id, top_n, _ in batch:
+            if kind == "recommend":
+                by_top_n.setdefault(top_n, []).append(item_id)
+        recommendations = {
+            top_n: rec_sys.recommend_products_batch(user_ids, top_n=top_n)
+            for top_n, user_ids in by_top_n.items()
+        }
+
+        answers = []
+        for kind, item_id, top_n, _ in batch:
+            if kind == "recommend":
+                answers.append(recommendations[top_n][item_id])
+            elif item_id in rec_sys.products:
+                answers.append(rec_sys.get_products_bought_together(item_id, top_n=top_n))
+            else:
+                answers.append([])
+        return answers
+
+    def metrics(self):
+        """Latency percentiles (ms), queue depth and batching counters."""
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "system": self.rec_sys.metrics.snapshot() if self.rec_sys.metrics is not None else None,
+        }
+
+    async def route(self, method, target):
+        """Turn one request into (status, JSON-serializable body).
+
+        An unexpected error becomes a 500 response instead of a dropped
+        connection.
+        """
+        try:
+            return await self.dispatch(method, target)
+        except Exception:
+            logger.exception("Error handling %s %s", method, target)
+            return 500, {"error": "internal server error"}
+
+    async def dispatch(self, method, target):
+        """Answer a request (route() turns its errors into 500s)."""
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/metrics":
+            return 200, self.metrics()
+        if url.path not in ("/recommend", "/bought_together"):
+            return 404, {"error": f"unknown path {url.path}"}
+
+        try:
+            top_n = int(params.get("top_n", 3))
+        except ValueError:
+            return 400, {"error": "top_n must be an integer"}
+        if top_n < 1:
+            return 400, {"error": "top_n must be at least 1"}
+
+        if url.path == "/recommend":
+            user_id = params.get("user_id")
+            if user_id is None:
+                return 400, {"error": "user_id is required"}
+            if user_id not in self.rec_sys.users:
+                return 404, {"error": f"user {user_id} not found"}
+            products = await self.submit("recommend", user_id, top_n)
+            return 200, {"user_id": user_id, "recommendations": products}
+
+        product_id = params.get("product_id")
+        if product_id is None:
+            return 400, {"error": "product_id is required"}
+        if product_id not in self.rec_sys.products:
+            return 404, {"error": f"product {product_id} not found"}
+        together = await self.submit("together", product_id, top_n)
+        return 200, {
+            "product_id": product_id,
+            "bought_together": [{"product_id": p, "count": count} for p, count in together],
+        }
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive aware)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                # Consume any body so its bytes are not read as the next request
+                try:
+                    body_length = int(headers.get("content-length", 0))
+                except ValueError:
+                    body_length = -1
+                parts = request_line.decode("latin-1").split()
+                if body_length < 0 or "transfer-encoding" in headers:
+                    # Where the next request starts is unknown, so close after answering
+                    status, body = 400, {"error": "only bodies with a valid Content-Length are supported"}
+                    keep_alive = False
+                else:
+                    await reader.readexactly(body_length)
+                    if len(parts) != 3:
+                        status, body = 400, {"error": "malformed request line"}
+                    else:
+                        status, body = await self.route(parts[0], parts[1])
+
+                try:
+                    payload = json.dumps(body).encode("utf-8")
+                except (TypeError, ValueError):
+                    logger.exception("Error encoding the response to %s", request_line.decode("latin-1").strip())
+                    status, payload = 500, b'{"error": "internal server error"}'
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(rec_sys, host, port, batch_window, max_batch):
+    """Run the server until interrupted."""
+    server = RecommendationServer(rec_sys, batch_window=batch_window, max_batch=max_batch)
+    listener = await server.start(host, port)
+    print(f"✓ Serving on http://{host}:{port} (window {batch_window * 1000:.1f} ms, batch {max_batch})")
+    async with listener:
+        try:
+            await listener.serve_forever()
+        finally:
+            await server.stop()
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve recommendations over HTTP/JSON")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--snapshot", help="Binary snapshot to memory-map")
+    source.add_argument("--data", default="rec_system_data.json", help="JSON data file")
+    parser.add_argument("--backend", choices=["sparse", "bitset"], default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window-ms", type=float, default=2.0, help="Micro-batching window")
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    rec_sys = RecommendationSystem(backend=args.backend)
+    if args.snapshot:
+        load_snapshot(rec_sys, args.snapshot)
+    else:
+        load_system(rec_sys, args.data)
+    rec_sys.enable_metrics()
+
+    try:
+        asyncio.run(serve(rec_sys, args.host, args.port, args.window_ms / 1000, args.max_batch))
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+
+
+if __name__ == "__main__":
+    main()
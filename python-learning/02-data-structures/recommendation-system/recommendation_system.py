@@ -3,55 +3,378 @@ Simple Recommendation System
 Demonstrates collaborative filtering and similarity metrics
 """
 
+import csv
 import json
-from collections import defaultdict
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from instrumentation import Metrics, instrumented
+from journal import PurchaseJournal
+
+# Quiet unless the application configures logging (main() does)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 class RecommendationSystem:
     """A simple recommendation system based on user purchase history."""
     
-    def __init__(self):
-        """Initialize the recommendation system."""
-        self.users = {}  # {user_id: set of product_ids}
+    def __init__(self, backend=None, storage="sets"):
+        """Initialize the recommendation system.
+        
+        Args:
+            backend: None for the dict-of-sets path, "sparse" to compute
+                similarities on a NumPy/SciPy sparse matrix, or "bitset" to
+                use packed purchase bitsets (catalogs up to ~100k products)
+            storage: "sets" keeps Python sets of string IDs, "compact" keeps
+                interned integer IDs in sorted arrays behind the same API
+        """
+        if storage not in ("sets", "compact"):
+            raise ValueError(f"Unknown storage: {storage}")
+        self.storage = storage
         self.products = {}  # {product_id: product_name}
-        self.product_users = defaultdict(set)  # {product_id: set of user_ids who bought it}
+        self.clear_purchases()
+        self.co_purchases = defaultdict(Counter)  # {product_id: Counter of co-bought product_ids}
+        self.lsh_index = None  # MinHashLSH for approximate neighbour search
+        self.journal = None  # PurchaseJournal that logs every mutation
+        self.cache = None  # ResultCache for neighbour lists and recommendations
+        self.neighbour_index = None  # NeighbourIndex of stored top-K neighbours
+        self.metrics = None  # Metrics of call counts, latencies and candidate sizes
+        self.popularity = None  # PopularityIndex for cold-start and short results
+        
+        if backend is None:
+            self.backend = None
+        elif backend == "sparse":
+            from similarity_backends import SparseBackend
+            self.backend = SparseBackend(self)
+        elif backend == "bitset":
+            from similarity_backends import BitsetBackend
+            self.backend = BitsetBackend(self)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
     
-    def add_user(self, user_id, username):
-        """Add a new user to the system."""
-        if user_id not in self.users:
-            self.users[user_id] = set()
-            print(f"✓ Added user: {username} (ID: {user_id})")
+    def clear_purchases(self):
+        """Reset users and purchases, keeping the configured storage."""
+        if self.storage == "compact":
+            from compact_store import CompactPostings, IdInterner
+            user_ids = IdInterner()
+            product_ids = IdInterner()
+            self.users = CompactPostings(user_ids, product_ids)  # {user_id: PostingSet}
+            self.product_users = CompactPostings(product_ids, user_ids, create_missing=True)
+            # Interned user numbers already follow insertion order
+            self.user_order = user_ids.index
+        else:
+            self.users = {}  # {user_id: set of product_ids}
+            self.product_users = defaultdict(set)  # {product_id: set of user_ids who bought it}
+            self.user_order = {}  # {user_id: position added}, breaks similarity ties
+        self.user_segments = {}  # {user_id: segment label given to add_user}
+    
+    def rebuild_indexes(self, co_purchases=True):
+        """Recompute derived lookups after users were replaced wholesale.
+        
+        Args:
+            co_purchases: Also recount the co-purchase table (skip when it
+                was loaded alongside the users)
+        """
+        # Interned storage (compact or a mapped snapshot) already numbers
+        # users in insertion order
+        interner = getattr(self.users, "keys_interner", None)
+        if interner is not None:
+            self.user_order = interner.index
+        else:
+            self.user_order = {user_id: i for i, user_id in enumerate(self.users)}
+        if co_purchases:
+            self.co_purchases = defaultdict(Counter)
+            for products in self.users.values():
+                for product_id in products:
+                    counts = self.co_purchases[product_id]
+                    for other_product_id in products:
+                        if other_product_id != product_id:
+                            counts[other_product_id] += 1
+        if self.backend is not None:
+            self.backend.mark_dirty()
+        if self.lsh_index is not None:
+            self.lsh_index.build(self.users)
+        if self.neighbour_index is not None:
+            self.neighbour_index.rebuild()
+        if self.popularity is not None:
+            self.popularity.rebuild()
+        if self.cache is not None:
+            self.cache.clear()
+    
+    def build_neighbour_index(self, k=10):
+        """Store each user's top-K neighbours and keep them updated.
+        
+        find_similar_users (and so recommend_products) then reads the
+        stored lists for top_n <= k, and add_purchase rescores only the
+        users sharing a product with the buyer.
+        
+        Args:
+            k: Neighbours kept per user
+        
+        Returns:
+            The NeighbourIndex (see its rebuild and check_consistency)
+        """
+        from neighbour_index import NeighbourIndex
+        self.neighbour_index = NeighbourIndex(self, k=k)
+        self.neighbour_index.rebuild()
+        return self.neighbour_index
+    
+    def build_popularity_index(self, min_basket=1):
+        """Keep bestseller rankings and use them for low-signal users.
+        
+        Once built, recommend_products answers users with fewer than
+        min_basket purchases from the rankings in O(top_n), ignores
+        zero-similarity neighbours, and tops up results shorter than
+        top_n with popular products (from the user's segment first).
+        Without it, results stay purely similarity-based.
+        
+        Args:
+            min_basket: Users with fewer purchases skip the similarity search
+        
+        Returns:
+            The PopularityIndex
+        """
+        from popularity import PopularityIndex
+        self.popularity = PopularityIndex(self, min_basket=min_basket)
+        self.popularity.rebuild()
+        if self.cache is not None:
+            self.cache.clear()
+        return self.popularity
+    
+    def enable_cache(self, max_entries=10_000, ttl=None):
+        """Cache neighbour lists and recommendations between calls.
+        
+        Entries are invalidated precisely by add_purchase and add_user;
+        see ResultCache.stats() for hit/miss/eviction counters.
+        
+        Args:
+            max_entries: Entries kept before LRU eviction
+            ttl: Optional lifetime of an entry in seconds
+        
+        Returns:
+            The ResultCache
+        """
+        from result_cache import ResultCache
+        self.cache = ResultCache(max_entries=max_entries, ttl=ttl)
+        return self.cache
+    
+    def enable_metrics(self):
+        """Start counting calls and recording latencies and candidate sizes.
+        
+        Set the metrics attribute back to None to stop; disabled hooks
+        cost a single attribute check.
+        
+        Returns:
+            The Metrics (see its snapshot)
+        """
+        self.metrics = Metrics()
+        return self.metrics
+    
+    def build_lsh_index(self, bands=16, rows=4):
+        """Build the MinHash/LSH index used by approximate similarity search.
+        
+        Once built, the index is kept up to date by add_purchase.
+        
+        Args:
+            bands: Number of LSH bands
+            rows: MinHash values per band
+        """
+        from lsh_index import MinHashLSH
+        self.lsh_index = MinHashLSH(bands=bands, rows=rows)
+        self.lsh_index.build(self.users)
+        if self.cache is not None:
+            self.cache.clear()
+    
+    def add_user(self, user_id, username, segment=None):
+        """Add a new user to the system.
+        
+        Args:
+            user_id: Unique user ID
+            username: Display name
+            segment: Optional label (e.g. region) for segment popularity
+        """
+        if self.record_user(user_id, segment):
+            logger.info("✓ Added user: %s (ID: %s)", username, user_id)
         else:
-            print(f"User {user_id} already exists!")
+            logger.warning("User %s already exists!", user_id)
+    
+    @instrumented("record_user")
+    def record_user(self, user_id, segment=None):
+        """Add a user without validation or output.
+        
+        Returns:
+            True if the user was new
+        """
+        if user_id in self.users:
+            return False
+        self.users[user_id] = set()
+        self.user_order.setdefault(user_id, len(self.user_order))
+        if segment is not None:
+            self.user_segments[user_id] = segment
+        if self.backend is not None:
+            self.backend.add_user(user_id)
+        if self.neighbour_index is not None:
+            self.neighbour_index.add_user(user_id)
+        if self.cache is not None:
+            self.cache.bump("users")
+        if self.journal is not None:
+            if segment is None:
+                self.log_mutation("add_user", user_id)
+            else:
+                self.log_mutation("add_user", user_id, segment)
+        return True
     
     def add_product(self, product_id, product_name):
         """Add a new product to the system."""
+        self.record_product(product_id, product_name)
+        logger.info("✓ Added product: %s (ID: %s)", product_name, product_id)
+    
+    @instrumented("record_product")
+    def record_product(self, product_id, product_name):
+        """Add or rename a product without output."""
         self.products[product_id] = product_name
-        print(f"✓ Added product: {product_name} (ID: {product_id})")
+        if self.popularity is not None:
+            self.popularity.add_product(product_id)
+        if self.journal is not None:
+            self.log_mutation("add_product", product_id, product_name)
+    
+    def log_mutation(self, operation, *args):
+        """Append a mutation to the journal, compacting it when it is full."""
+        self.journal.append(operation, *args)
+        if self.journal.needs_compaction():
+            self.journal.compact(self)
     
     def add_purchase(self, user_id, product_id):
         """Record a user purchase."""
         if user_id not in self.users:
-            print(f"Error: User {user_id} not found!")
+            logger.error("Error: User %s not found!", user_id)
             return
         if product_id not in self.products:
-            print(f"Error: Product {product_id} not found!")
+            logger.error("Error: Product %s not found!", product_id)
             return
         
-        self.users[user_id].add(product_id)
+        self.record_purchase(user_id, product_id)
+        logger.info("✓ Purchase recorded: User %s bought %s", user_id, self.products[product_id])
+    
+    @instrumented("record_purchase")
+    def record_purchase(self, user_id, product_id):
+        """Record a purchase of known IDs without validation or output.
+        
+        Returns:
+            True if the user had not bought the product before
+        """
+        user_purchases = self.users[user_id]
+        if product_id in user_purchases:
+            return False
+        
+        # Only the pairs formed with the new item change
+        new_counts = self.co_purchases[product_id]
+        for other_product_id in user_purchases:
+            new_counts[other_product_id] += 1
+            self.co_purchases[other_product_id][product_id] += 1
+        
+        user_purchases.add(product_id)
         self.product_users[product_id].add(user_id)
-        print(f"✓ Purchase recorded: User {user_id} bought {self.products[product_id]}")
+        if self.backend is not None:
+            self.backend.add_purchase(user_id, product_id)
+        if self.lsh_index is not None:
+            self.lsh_index.add_purchase(user_id, product_id)
+        if self.neighbour_index is not None:
+            self.neighbour_index.purchase_recorded(user_id, product_id)
+        rankings_changed = ()
+        if self.popularity is not None:
+            rankings_changed = self.popularity.purchase_recorded(user_id, product_id)
+        if self.cache is not None:
+            self.cache.purchase_recorded(self, user_id, product_id, rankings_changed)
+        if self.journal is not None:
+            self.log_mutation("add_purchase", user_id, product_id)
+        return True
     
+    @instrumented("bulk_add_purchases")
+    def bulk_add_purchases(self, purchases, batch_size=100_000, create_missing=True):
+        """Ingest many (user_id, product_id) pairs quietly.
+        
+        The input is consumed in batches, so an iterator over a huge file
+        only ever holds one batch in memory. Repeats within a batch are
+        dropped before touching the indexes, and nothing is printed.
+        
+        With a journal attached, rows are not journaled one by one; the
+        data file is compacted once at the end instead, so an interrupted
+        load should simply be re-run.
+        
+        Args:
+            purchases: Iterable of (user_id, product_id) pairs, or the name
+                of a CSV/JSONL file (see read_purchases)
+            batch_size: Pairs processed per batch
+            create_missing: Add unknown users and products (named after
+                their ID) instead of rejecting the row
+        
+        Returns:
+            Dictionary summarising rows read, purchases added, duplicates,
+            rejected rows, new users/products and elapsed seconds
+        """
+        if isinstance(purchases, str):
+            purchases = read_purchases(purchases)
+        
+        summary = {"rows": 0, "added": 0, "duplicates": 0, "rejected": 0,
+                   "new_users": 0, "new_products": 0}
+        start = time.perf_counter()
+        pairs = iter(purchases)
+        journal, self.journal = self.journal, None
+        
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            summary["rows"] += len(batch)
+            
+            # dict.fromkeys drops repeats but keeps the file order
+            unique = dict.fromkeys(batch)
+            summary["duplicates"] += len(batch) - len(unique)
+            
+            for user_id, product_id in unique:
+                if user_id not in self.users:
+                    if not create_missing:
+                        summary["rejected"] += 1
+                        continue
+                    self.record_user(user_id)
+                    summary["new_users"] += 1
+                if product_id not in self.products:
+                    if not create_missing:
+                        summary["rejected"] += 1
+                        continue
+                    self.record_product(product_id, product_id)
+                    summary["new_products"] += 1
+                
+                if self.record_purchase(user_id, product_id):
+                    summary["added"] += 1
+                else:
+                    summary["duplicates"] += 1
+        
+        self.journal = journal
+        if journal is not None and summary["added"]:
+            journal.compact(self)
+        
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+    
+    @instrumented("get_user_purchases")
     def get_user_purchases(self, user_id):
         """Get list of products purchased by a user."""
         if user_id not in self.users:
-            print(f"User {user_id} not found!")
+            logger.warning("User %s not found!", user_id)
             return []
         
         purchases = self.users[user_id]
-        print(f"\nUser {user_id} purchases:")
-        for product_id in purchases:
-            print(f"  - {self.products[product_id]}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("\nUser %s purchases:", user_id)
+            for product_id in purchases:
+                logger.info("  - %s", self.products[product_id])
         return purchases
     
     def jaccard_similarity(self, set1, set2):
@@ -75,73 +398,249 @@ class RecommendationSystem:
         
         return intersection / union if union > 0 else 0.0
     
-    def find_similar_users(self, user_id, top_n=3):
+    @instrumented("find_similar_users")
+    def find_similar_users(self, user_id, top_n=3, mode="exact"):
         """Find users most similar to the given user.
         
         Args:
             user_id: The user to find similarities for
             top_n: Number of similar users to return
+            mode: "exact" scores every co-purchaser, "approximate" only
+                scores the candidates found by the LSH index
         
         Returns:
             List of (user_id, similarity_score) tuples
         """
         if user_id not in self.users:
-            print(f"User {user_id} not found!")
+            logger.warning("User %s not found!", user_id)
             return []
         
+        if mode not in ("exact", "approximate"):
+            raise ValueError(f"Unknown mode: {mode}")
+        
+        if self.cache is not None:
+            key = ("similar", user_id, top_n, mode)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return list(cached)
+        
+        if mode == "approximate":
+            similar_users = self.approximate_similar_users(user_id, top_n)
+        elif self.neighbour_index is not None and top_n <= self.neighbour_index.k:
+            similar_users = self.neighbour_index.similar_users(user_id, top_n)
+        elif self.backend is not None:
+            similar_users = self.backend.similar_users(user_id, top_n)
+        else:
+            similar_users = self.rank_similar_users(user_id, self.users[user_id], top_n)
+        
+        if self.cache is not None:
+            # A listed neighbour's purchase can reorder the list; anyone
+            # else's can only lift the users who bought the same product
+            tags = [self.cache.tag("neighbourhood", user_id)]
+            tags.extend(self.cache.tag("basket", other_user_id) for other_user_id, _ in similar_users)
+            # A short list would also pick up users added later
+            if len(similar_users) < top_n:
+                tags.append(self.cache.tag("users"))
+            self.cache.put(key, tuple(similar_users), tags)
+        return similar_users
+    
+    def approximate_similar_users(self, user_id, top_n):
+        """Rank only the LSH candidates of a user by exact Jaccard similarity.
+        
+        Users the index did not surface are never scored, so some true
+        neighbours can be missed, and no zero-similarity padding is added.
+        """
+        if self.lsh_index is None:
+            self.build_lsh_index()
+        
         user_purchases = self.users[user_id]
         similarities = []
-        
-        # Calculate similarity with all other users
-        for other_user_id in self.users:
-            if other_user_id != user_id:
-                other_purchases = self.users[other_user_id]
-                similarity = self.jaccard_similarity(user_purchases, other_purchases)
+        candidates = self.lsh_index.candidates(user_id)
+        if self.metrics is not None:
+            self.metrics.observe_size("approximate_candidates", len(candidates))
+        for other_user_id in candidates:
+            similarity = self.jaccard_similarity(user_purchases, self.users[other_user_id])
+            if similarity > 0:
                 similarities.append((other_user_id, similarity))
         
-        # Sort by similarity (highest first) and return top N
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        similarities.sort(key=lambda x: (-x[1], self.user_order[x[0]]))
         return similarities[:top_n]
     
-    def recommend_products(self, user_id, top_n=3):
+    def count_shared_products(self, user_id, purchases):
+        """Count shared products with every user who co-purchased an item.
+        
+        Walks the inverted index (product_users) once, so only users who
+        bought at least one of the same products are ever touched.
+        
+        Args:
+            user_id: The user to leave out of the counts
+            purchases: Set of product_ids to compare against
+        
+        Returns:
+            Dictionary of {other_user_id: number of shared products}
+        """
+        shared_counts = defaultdict(int)
+        for product_id in purchases:
+            for other_user_id in self.product_users.get(product_id, ()):
+                shared_counts[other_user_id] += 1
+        shared_counts.pop(user_id, None)
+        return shared_counts
+    
+    def rank_similar_users(self, user_id, purchases, top_n):
+        """Rank users by Jaccard similarity to a set of purchases.
+        
+        Gives exactly the ranking of scoring every user and sorting by
+        similarity, but only users sharing a product are scored. Ties keep
+        the order users were added, and any remaining slots are filled with
+        zero-similarity users in that same order.
+        
+        Args:
+            user_id: The user being compared (never returned)
+            purchases: Set of product_ids bought by that user
+            top_n: Number of similar users to return
+        
+        Returns:
+            List of (user_id, similarity_score) tuples
+        """
+        shared_counts = self.count_shared_products(user_id, purchases)
+        if self.metrics is not None:
+            self.metrics.observe_size("similar_user_candidates", len(shared_counts))
+        
+        # |A ∪ B| = |A| + |B| - |A ∩ B|, so no temporary sets are needed
+        similarities = []
+        for other_user_id, shared in shared_counts.items():
+            union = len(purchases) + len(self.users[other_user_id]) - shared
+            similarities.append((other_user_id, shared / union))
+        
+        # Sort by similarity (highest first), oldest user first on ties
+        similarities.sort(key=lambda x: (-x[1], self.user_order[x[0]]))
+        similarities = similarities[:top_n]
+        
+        # Pad with users who share nothing, just like a full scan would
+        if len(similarities) < top_n:
+            for other_user_id in self.users:
+                if len(similarities) >= top_n:
+                    break
+                if other_user_id != user_id and other_user_id not in shared_counts:
+                    similarities.append((other_user_id, 0.0))
+        
+        return similarities
+    
+    @instrumented("recommend_products")
+    def recommend_products(self, user_id, top_n=3, mode="exact", neighbours=5):
         """Recommend products to a user based on similar users' purchases.
         
         Args:
             user_id: The user to make recommendations for
             top_n: Number of products to recommend
+            mode: Neighbour search mode, "exact" or "approximate"
+            neighbours: Number of similar users whose purchases are merged
         
         Returns:
             List of recommended product IDs
         """
         if user_id not in self.users:
-            print(f"User {user_id} not found!")
+            logger.warning("User %s not found!", user_id)
             return []
         
-        user_purchases = self.users[user_id]
-        recommendations = defaultdict(float)
+        # Too little history for similarity to say anything: use bestsellers
+        popularity = self.popularity
+        if popularity is not None and popularity.is_cold(user_id):
+            if self.metrics is not None:
+                self.metrics.count("popularity_cold_start")
+            return popularity.popular_products(
+                top_n, self.user_segments.get(user_id), exclude=self.users[user_id])
+        
+        if self.cache is not None:
+            key = ("recommend", user_id, top_n, mode, neighbours)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return list(cached)
         
         # Find similar users
-        similar_users = self.find_similar_users(user_id, top_n=5)
+        similar_users = self.find_similar_users(user_id, top_n=neighbours, mode=mode)
+        topped_up = False
+        if popularity is None:
+            recommended = self.merge_recommendations(user_id, similar_users, top_n)
+        else:
+            # Zero-similarity neighbours only add noise; bestsellers fill the gap
+            positive = [(other_user_id, similarity) for other_user_id, similarity in similar_users
+                        if similarity > 0]
+            recommended = self.merge_recommendations(user_id, positive, top_n)
+            if len(recommended) < top_n:
+                if self.metrics is not None:
+                    self.metrics.count("popularity_blended")
+                recommended.extend(popularity.popular_products(
+                    top_n - len(recommended), self.user_segments.get(user_id),
+                    exclude=self.users[user_id], skip=recommended))
+                topped_up = True
+        
+        if self.cache is not None:
+            # Valid while the neighbourhood and the neighbours' baskets stand
+            tags = [self.cache.tag("neighbourhood", user_id), self.cache.tag("basket", user_id)]
+            tags.extend(self.cache.tag("basket", other_user_id) for other_user_id, _ in similar_users)
+            if len(similar_users) < neighbours:
+                tags.append(self.cache.tag("users"))
+            if topped_up:
+                # The segment ranking is read first, then the overall one
+                segment = self.user_segments.get(user_id)
+                tags.append(self.cache.tag("popularity"))
+                if segment is not None:
+                    tags.append(self.cache.tag("popularity", segment))
+            self.cache.put(key, tuple(recommended), tags)
+        return recommended
+    
+    def merge_recommendations(self, user_id, similar_users, top_n):
+        """Score the products a user's neighbours bought that the user has not.
         
-        # Collect products from similar users
-        for similar_user_id, similarity in similar_users:
-            similar_user_purchases = self.users[similar_user_id]
-            
-            # Add products that the target user hasn't bought yet
-            for product_id in similar_user_purchases:
-                if product_id not in user_purchases:
-                    # Weight by similarity score
-                    recommendations[product_id] += similarity
-        
-        # Sort by recommendation score
-        sorted_recommendations = sorted(
-            recommendations.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        Args:
+            user_id: The user to make recommendations for
+            similar_users: List of (user_id, similarity_score) neighbours
+            top_n: Number of products to recommend
+        
+        Returns:
+            List of recommended product IDs
+        """
+        neighbours = [(self.users[similar_user_id], similarity)
+                      for similar_user_id, similarity in similar_users]
+        sorted_recommendations = score_recommendations(self.users[user_id], neighbours)
+        if self.metrics is not None:
+            self.metrics.observe_size("recommendation_candidates", len(sorted_recommendations))
         
         return [product_id for product_id, score in sorted_recommendations[:top_n]]
     
+    @instrumented("recommend_products_batch")
+    def recommend_products_batch(self, user_ids, top_n=3, neighbours=5):
+        """Recommend products for many users in one call.
+        
+        With a matrix backend, the neighbours of every distinct user come
+        from a single vectorized similarity block. A cache or neighbour
+        index already answers each user cheaply, and the popularity
+        fallback decides per user, so then (and without a backend) users
+        are simply looked up one by one.
+        
+        Args:
+            user_ids: List of user IDs (repeats are computed once)
+            top_n: Number of products per user
+            neighbours: Number of similar users merged per user
+        
+        Returns:
+            Dictionary of {user_id: list of product IDs}; unknown users get []
+        """
+        known = [user_id for user_id in dict.fromkeys(user_ids) if user_id in self.users]
+        results = {user_id: [] for user_id in user_ids}
+        
+        if (self.backend is None or self.cache is not None or self.neighbour_index is not None
+                or self.popularity is not None):
+            for user_id in known:
+                results[user_id] = self.recommend_products(user_id, top_n=top_n, neighbours=neighbours)
+            return results
+        
+        for user_id, similar_users in zip(known, self.backend.similar_users_block(known, neighbours)):
+            results[user_id] = self.merge_recommendations(user_id, similar_users, top_n)
+        return results
+    
+    @instrumented("get_products_bought_together")
     def get_products_bought_together(self, product_id, top_n=3):
         """Find products frequently bought with the given product.
         
@@ -153,32 +652,73 @@ class RecommendationSystem:
             List of (product_id, co-occurrence_count) tuples
         """
         if product_id not in self.products:
-            print(f"Product {product_id} not found!")
+            logger.warning("Product %s not found!", product_id)
             return []
         
-        # Get users who bought this product
-        users_who_bought = self.product_users[product_id]
-        
-        # Count co-occurrences with other products
-        co_occurrences = defaultdict(int)
-        
-        for user_id in users_who_bought:
-            user_purchases = self.users[user_id]
-            for other_product_id in user_purchases:
-                if other_product_id != product_id:
-                    co_occurrences[other_product_id] += 1
+        if self.cache is not None:
+            key = ("together", product_id, top_n)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return list(cached)
         
-        # Sort by frequency
-        sorted_products = sorted(
-            co_occurrences.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Counts are kept up to date by add_purchase, so this is a top-N read
+        co_occurrences = self.co_purchases.get(product_id)
+        together = co_occurrences.most_common(top_n) if co_occurrences else []
         
-        return sorted_products[:top_n]
+        if self.cache is not None:
+            self.cache.put(key, tuple(together), [self.cache.tag("product", product_id)])
+        return together
 
 
 
+def score_recommendations(user_purchases, neighbours):
+    """Weight the products neighbours bought that the user has not.
+    
+    Args:
+        user_purchases: Set of product_ids the user already bought
+        neighbours: Iterable of (basket, similarity_score) pairs
+    
+    Returns:
+        List of (product_id, score) tuples, highest score first
+    """
+    recommendations = defaultdict(float)
+    
+    # Collect products from similar users
+    for similar_user_purchases, similarity in neighbours:
+        # Add products that the target user hasn't bought yet
+        for product_id in similar_user_purchases:
+            if product_id not in user_purchases:
+                # Weight by similarity score
+                recommendations[product_id] += similarity
+    
+    # Sort by recommendation score
+    return sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+
+
+def read_purchases(filename):
+    """Stream (user_id, product_id) pairs from a CSV or JSONL file.
+    
+    CSV files need a header with user_id and product_id columns; JSONL
+    files hold one {"user_id": ..., "product_id": ...} object per line.
+    Rows are yielded one at a time, so the file is never fully loaded.
+    
+    Args:
+        filename: Path ending in .csv, .jsonl or .json
+    
+    Yields:
+        (user_id, product_id) tuples
+    """
+    with open(filename, "r", newline="") as f:
+        if str(filename).endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield str(row["user_id"]), str(row["product_id"])
+        else:
+            for row in csv.DictReader(f):
+                yield row["user_id"], row["product_id"]
+
+
 def display_menu():
     """Display the main menu."""
     print("\n" + "="*50)
@@ -204,15 +744,29 @@ def save_system(rec_sys, filename="rec_system_data.json"):
     data = {
         "users": {user_id: list(products) for user_id, products in rec_sys.users.items()},
         "products": rec_sys.products,
-        "product_users": {prod_id: list(users) for prod_id, users in rec_sys.product_users.items()}
+        "product_users": {prod_id: list(users) for prod_id, users in rec_sys.product_users.items()},
+        "co_purchases": {prod_id: dict(counts.most_common()) for prod_id, counts in rec_sys.co_purchases.items()}
     }
+    if rec_sys.user_segments:
+        data["user_segments"] = rec_sys.user_segments
     
     try:
-        with open(filename, "w") as f:
+        # Write to a temporary file first so a crash never leaves half a file
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "w") as f:
             json.dump(data, f, indent=4)
-        print(f"✓ Data saved to {filename}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+        logger.info("✓ Data saved to %s", filename)
     except Exception as e:
-        print(f"Error saving data: {e}")
+        logger.error("Error saving data: %s", e)
+        return
+    
+    # Everything journaled is now in the data file
+    journal = rec_sys.journal
+    if journal is not None and os.path.abspath(journal.data_filename) == os.path.abspath(filename):
+        journal.truncate()
 
 
 def load_system(rec_sys, filename="rec_system_data.json"):
@@ -221,25 +775,47 @@ def load_system(rec_sys, filename="rec_system_data.json"):
         with open(filename, "r") as f:
             data = json.load(f)
         
-        rec_sys.users = {user_id: set(products) for user_id, products in data["users"].items()}
+        rec_sys.clear_purchases()
+        for user_id, products in data["users"].items():
+            rec_sys.users[user_id] = set(products)
         rec_sys.products = data["products"]
-        rec_sys.product_users = defaultdict(set, {
-            prod_id: set(users) for prod_id, users in data["product_users"].items()
-        })
-        
-        print(f"✓ Data loaded from {filename}")
-        print(f"  Users: {len(rec_sys.users)}, Products: {len(rec_sys.products)}")
+        for prod_id, users in data["product_users"].items():
+            rec_sys.product_users[prod_id] = set(users)
+        rec_sys.user_segments = data.get("user_segments", {})
+        # Older files have no co-purchase table, so it is recounted for them
+        if "co_purchases" in data:
+            rec_sys.co_purchases = defaultdict(Counter, {
+                prod_id: Counter(counts) for prod_id, counts in data["co_purchases"].items()
+            })
+        rec_sys.rebuild_indexes(co_purchases="co_purchases" not in data)
+        
+        logger.info("✓ Data loaded from %s", filename)
+        logger.info("  Users: %d, Products: %d", len(rec_sys.users), len(rec_sys.products))
     except FileNotFoundError:
-        print(f"No saved data found. Starting fresh!")
+        logger.info("No saved data found. Starting fresh!")
     except Exception as e:
-        print(f"Error loading data: {e}")
+        logger.error("Error loading data: %s", e)
+        return
+    
+    # Re-apply mutations made since the data file was last written
+    journal = rec_sys.journal
+    if journal is not None and os.path.abspath(journal.data_filename) == os.path.abspath(filename):
+        try:
+            replayed = journal.replay(rec_sys)
+        except Exception as e:
+            logger.error("Error replaying journal: %s", e)
+            return
+        if replayed:
+            logger.info("  Replayed %d journaled changes", replayed)
 
 
 def main():
     """Main function to run the recommendation system."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     print("Welcome to the Recommendation System!")
     
     rec_sys = RecommendationSystem()
+    rec_sys.journal = PurchaseJournal("rec_system_data.journal", "rec_system_data.json", flush="always")
     load_system(rec_sys)
     
     while True:
@@ -339,6 +915,7 @@ def main():
         elif choice == "12":
             # Exit
             save_system(rec_sys)
+            rec_sys.journal.close()
             print("\nThank you for using Recommendation System!")
             print("Goodbye! 🎯")
             break
@@ -0,0 +1,131 @@
+"""
+Result Cache
+LRU/TTL cache for neighbour lists and recommendations with versioned invalidation
+"""
+
+import time
+from collections import OrderedDict, defaultdict
+
+
+class ResultCache:
+    """LRU cache whose entries are tagged with version counters.
+
+    Each entry remembers the versions of the things it was computed from,
+    for example a user's neighbourhood and the baskets of the neighbours
+    it used. A purchase bumps only the versions it can affect, so stale
+    entries are detected on read and everything else keeps hitting.
+
+    Version kinds:
+        "neighbourhood": a user's similarity to someone may have risen
+        "basket": a user's own purchases changed (so did every similarity
+            to them; neighbour lists that include them are tagged with it)
+        "product": a product's co-purchase counts changed
+        "users": a user was added (only matters to short neighbour lists)
+        "popularity": the part of a bestseller ranking that results read
+            changed (id None for overall, else the segment)
+    """
+
+    def __init__(self, max_entries=10_000, ttl=None):
+        """Create an empty cache.
+
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl: Seconds an entry stays valid (None for no expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # {key: (value, tags, created)}
+        self.versions = defaultdict(int)  # {(kind, id): version}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def bump(self, kind, item_id=None):
+        """Advance a version counter, invalidating entries tagged with it."""
+        self.versions[(kind, item_id)] += 1
+
+    def tag(self, kind, item_id=None):
+        """Build a tag recording the current version of one item."""
+        return (kind, item_id, self.versions.get((kind, item_id), 0))
+
+    def get(self, key):
+        """Get a cached value, or None if missing, expired or stale."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, tags, created = entry
+        if self.ttl is not None and time.monotonic() - created > self.ttl:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        for kind, item_id, version in tags:
+            if self.versions.get((kind, item_id), 0) != version:
+                del self.entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, tags):
+        """Store a value with the version tags it depends on."""
+        self.entries[key] = (value, tuple(tags), time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def purchase_recorded(self, rec_sys, user_id, product_id, rankings_changed=()):
+        """Bump the versions a new purchase can affect.
+
+        The buyer's basket changed, so every product in it has a new
+        co-purchase count and every similarity to the buyer moved. Only
+        the other buyers of the new product grew closer to the buyer;
+        everyone else sharing a product with them moved away, which can
+        only change neighbour lists that already contain the buyer, and
+        those are tagged with the buyer's basket. So the cost is
+        O(basket + buyers of product_id) rather than the buyers of every
+        product in the basket. Bestseller rankings are only bumped when
+        the popularity index reports that their read part changed, so
+        most purchases leave popularity-blended results valid.
+
+        Args:
+            rec_sys: The RecommendationSystem that recorded the purchase
+            user_id: The buyer
+            product_id: The product bought
+            rankings_changed: Rankings reported by PopularityIndex.purchase_recorded
+        """
+        self.bump("basket", user_id)
+        for segment in rankings_changed:
+            self.bump("popularity", segment)
+        for other_product_id in rec_sys.users[user_id]:
+            self.bump("product", other_product_id)
+        # Includes the buyer, whose own neighbour list changed too
+        for other_user_id in rec_sys.product_users.get(product_id, ()):
+            self.bump("neighbourhood", other_user_id)
+
+    def clear(self):
+        """Drop every entry (after the data was replaced wholesale)."""
+        self.entries.clear()
+        self.versions.clear()
+
+    def stats(self):
+        """Get counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
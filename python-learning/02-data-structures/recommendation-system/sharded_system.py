@@ -0,0 +1,334 @@
+"""
+Sharded Recommendation System
+Users hash-partitioned across worker processes, queried by scatter/gather
+"""
+
+import logging
+import multiprocessing
+import zlib
+from collections import Counter
+from itertools import islice
+
+from recommendation_system import RecommendationSystem, score_recommendations
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def shard_for(user_id, n_shards):
+    """Pick the shard owning a user (stable across runs and processes)."""
+    return zlib.crc32(user_id.encode("utf-8")) % n_shards
+
+
+def shard_worker(connection):
+    """Serve one shard's commands from the coordinator until told to stop.
+
+    The shard is an ordinary RecommendationSystem holding only its own
+    users, so its product_users lists only those users' purchases. Every
+    user's position in user_order is the global sequence number sent by
+    the coordinator, which keeps tie-breaking identical to a single
+    process that saw the same calls.
+    """
+    rec_sys = RecommendationSystem()
+
+    def add_user(user_id, order):
+        if user_id not in rec_sys.users:
+            rec_sys.user_order[user_id] = order
+        return rec_sys.record_user(user_id)
+
+    def add_products(products):
+        for product_id, product_name in products:
+            if product_id not in rec_sys.products:
+                rec_sys.record_product(product_id, product_name)
+        return len(products)
+
+    def add_purchases(rows):
+        new_users = 0
+        for user_id, _, order in rows:
+            if user_id not in rec_sys.users:
+                rec_sys.user_order[user_id] = order
+                rec_sys.record_user(user_id)
+                new_users += 1
+        new_products = [product_id for product_id in dict.fromkeys(p for _, p, _ in rows)
+                        if product_id not in rec_sys.products]
+        summary = rec_sys.bulk_add_purchases([(u, p) for u, p, _ in rows])
+        summary["new_users"] = new_users
+        summary["new_products"] = new_products
+        return summary
+
+    def similar(user_id, basket, top_n, with_baskets):
+        ranked = rec_sys.rank_similar_users(user_id, set(basket), top_n)
+        if with_baskets:
+            return [(other_user_id, similarity, rec_sys.user_order[other_user_id],
+                     list(rec_sys.users[other_user_id])) for other_user_id, similarity in ranked]
+        return [(other_user_id, similarity, rec_sys.user_order[other_user_id])
+                for other_user_id, similarity in ranked]
+
+    def basket(user_id):
+        products = rec_sys.users.get(user_id)
+        return None if products is None else list(products)
+
+    def knows(user_id, product_id):
+        # The product name (None if unknown) lets the coordinator log it
+        return user_id in rec_sys.users, rec_sys.products.get(product_id)
+
+    def together(product_id):
+        if product_id not in rec_sys.products:
+            return None
+        return dict(rec_sys.co_purchases.get(product_id, {}))
+
+    def stats():
+        return {"users": len(rec_sys.users),
+                "purchases": sum(len(products) for products in rec_sys.users.values())}
+
+    commands = {
+        "add_user": add_user,
+        "add_product": rec_sys.record_product,
+        "add_products": add_products,
+        "add_purchase": rec_sys.record_purchase,
+        "add_purchases": add_purchases,
+        "basket": basket,
+        "knows": knows,
+        "similar": similar,
+        "together": together,
+        "stats": stats,
+    }
+    while True:
+        command, args = connection.recv()
+        if command == "stop":
+            break
+        try:
+            connection.send(("ok", commands[command](*args)))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class ShardedRecommendationSystem:
+    """Coordinator for a RecommendationSystem split across local processes.
+
+    Users are assigned to shards by a hash of their ID and each shard
+    process holds only their baskets and the matching slice of
+    product_users; the small product catalog is replicated to every
+    shard. Queries are scattered over pipes to all shards at once, each
+    shard ranks its own users against the query basket, and the partial
+    top-N lists are merged here. Results match a single
+    RecommendationSystem fed the same calls.
+
+    Use as a context manager, or call close(), to stop the workers.
+    """
+
+    def __init__(self, n_shards=4):
+        """Start the shard processes.
+
+        Args:
+            n_shards: Number of worker processes
+        """
+        self.n_shards = n_shards
+        self.next_order = 0  # global insertion sequence handed to shards
+        self.connections = []
+        self.processes = []
+        for _ in range(n_shards):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shard_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop every shard process."""
+        for connection in self.connections:
+            try:
+                connection.send(("stop", ()))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections = []
+        self.processes = []
+
+    def receive(self, shard):
+        """Wait for one shard's reply, raising its error if it failed."""
+        status, result = self.connections[shard].recv()
+        if status == "error":
+            raise RuntimeError(f"Shard {shard} failed: {result}")
+        return result
+
+    def call(self, shard, command, *args):
+        """Run a command on one shard."""
+        self.connections[shard].send((command, args))
+        return self.receive(shard)
+
+    def scatter(self, command, *args, shards=None):
+        """Run a command on several shards in parallel.
+
+        Every request is sent before any reply is read, so the shards
+        work at the same time.
+
+        Returns:
+            List of results, one per shard
+        """
+        shards = range(self.n_shards) if shards is None else shards
+        for shard in shards:
+            self.connections[shard].send((command, args))
+        return [self.receive(shard) for shard in shards]
+
+    def shard_for(self, user_id):
+        """Pick the shard owning a user."""
+        return shard_for(user_id, self.n_shards)
+
+    def add_user(self, user_id, username):
+        """Add a new user to its shard."""
+        self.next_order += 1
+        if self.call(self.shard_for(user_id), "add_user", user_id, self.next_order):
+            logger.info("✓ Added user: %s (ID: %s)", username, user_id)
+        else:
+            logger.warning("User %s already exists!", user_id)
+
+    def add_product(self, product_id, product_name):
+        """Add a product to the catalog of every shard."""
+        self.scatter("add_product", product_id, product_name)
+        logger.info("✓ Added product: %s (ID: %s)", product_name, product_id)
+
+    def add_purchase(self, user_id, product_id):
+        """Record a purchase on the buyer's shard."""
+        shard = self.shard_for(user_id)
+        user_known, product_name = self.call(shard, "knows", user_id, product_id)
+        if not user_known:
+            logger.error("Error: User %s not found!", user_id)
+            return
+        if product_name is None:
+            logger.error("Error: Product %s not found!", product_id)
+            return
+        self.call(shard, "add_purchase", user_id, product_id)
+        logger.info("✓ Purchase recorded: User %s bought %s", user_id, product_name)
+
+    def bulk_add_purchases(self, purchases, batch_size=100_000):
+        """Ingest many (user_id, product_id) pairs, creating missing IDs.
+
+        Each batch is split by owning shard and the shards load their
+        parts in parallel. Products first seen by one shard (named after
+        their ID) are then copied to the others so the catalog stays
+        replicated.
+
+        Args:
+            purchases: Iterable of (user_id, product_id) pairs, or the name
+                of a CSV/JSONL file (see read_purchases)
+            batch_size: Pairs routed per batch
+
+        Returns:
+            Dictionary summed over shards, as from bulk_add_purchases
+        """
+        if isinstance(purchases, str):
+            from recommendation_system import read_purchases
+            purchases = read_purchases(purchases)
+
+        totals = Counter()
+        new_products = 0
+        pairs = iter(purchases)
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            parts = [[] for _ in range(self.n_shards)]
+            for user_id, product_id in batch:
+                self.next_order += 1
+                parts[self.shard_for(user_id)].append((user_id, product_id, self.next_order))
+            created = {}
+            for summary in self.scatter_parts("add_purchases", parts):
+                created.update(dict.fromkeys(summary.pop("new_products")))
+                totals.update(summary)
+            if created:
+                self.scatter("add_products", [(product_id, product_id) for product_id in created])
+                new_products += len(created)
+
+        totals["new_products"] = new_products
+        return dict(totals)
+
+    def scatter_parts(self, command, parts):
+        """Send each shard its own argument, skipping empty parts."""
+        shards = [shard for shard, part in enumerate(parts) if part]
+        for shard in shards:
+            self.connections[shard].send((command, (parts[shard],)))
+        return [self.receive(shard) for shard in shards]
+
+    def get_user_purchases(self, user_id):
+        """Get the set of products purchased by a user."""
+        basket = self.call(self.shard_for(user_id), "basket", user_id)
+        if basket is None:
+            logger.warning("User %s not found!", user_id)
+            return []
+        return set(basket)
+
+    def gather_similar(self, user_id, top_n, with_baskets=False):
+        """Scatter a neighbour search and merge the shards' top-N lists.
+
+        Each shard returns its users in the global order (similarity,
+        then insertion sequence), so the first top_n of the merge are the
+        global top_n.
+
+        Returns:
+            (basket, merged entries), or (None, None) for an unknown user
+        """
+        basket = self.call(self.shard_for(user_id), "basket", user_id)
+        if basket is None:
+            return None, None
+        partials = self.scatter("similar", user_id, basket, top_n, with_baskets)
+        merged = sorted((entry for partial in partials for entry in partial),
+                        key=lambda entry: (-entry[1], entry[2]))
+        return basket, merged[:top_n]
+
+    def find_similar_users(self, user_id, top_n=3):
+        """Find users most similar to the given user across all shards.
+
+        Returns:
+            List of (user_id, similarity_score) tuples
+        """
+        _, merged = self.gather_similar(user_id, top_n)
+        if merged is None:
+            logger.warning("User %s not found!", user_id)
+            return []
+        return [(other_user_id, similarity) for other_user_id, similarity, *_ in merged]
+
+    def recommend_products(self, user_id, top_n=3):
+        """Recommend products from the user's neighbours across all shards.
+
+        Shards send the baskets of their candidate neighbours along with
+        the scores, so this needs no second round trip.
+
+        Returns:
+            List of recommended product IDs
+        """
+        basket, merged = self.gather_similar(user_id, 5, with_baskets=True)
+        if merged is None:
+            logger.warning("User %s not found!", user_id)
+            return []
+        neighbours = [(other_basket, similarity) for _, similarity, _, other_basket in merged]
+        return [product_id for product_id, _ in score_recommendations(set(basket), neighbours)[:top_n]]
+
+    def get_products_bought_together(self, product_id, top_n=3):
+        """Sum every shard's co-purchase counts for a product.
+
+        Returns:
+            List of (product_id, co-occurrence_count) tuples
+        """
+        rows = [row for row in self.scatter("together", product_id) if row is not None]
+        if not rows:
+            logger.warning("Product %s not found!", product_id)
+            return []
+        counts = Counter()
+        for row in rows:
+            counts.update(row)
+        return counts.most_common(top_n)
+
+    def stats(self):
+        """Get users and purchases held by each shard."""
+        return self.scatter("stats")
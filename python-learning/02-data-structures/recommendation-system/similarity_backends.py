@@ -0,0 +1,469 @@
+"""
+Similarity Backends
+Vectorized alternatives to the dict-of-sets similarity loops
+"""
+
+import random
+import time
+
+import numpy as np
+
+try:
+    import scipy.sparse as sparse
+except ImportError:  # SciPy is optional, plain NumPy works too
+    sparse = None
+
+
+def gather_rows(indptr, indices, rows):
+    """Concatenate the postings of several rows of a CSR layout.
+
+    Args:
+        indptr: Row offsets into indices
+        indices: Column indices of every stored entry
+        rows: Array of row numbers to gather
+
+    Returns:
+        1-D array with the column indices of all requested rows
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+
+    # Shift a running 0..total range so each row lands on its own slice
+    row_offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - row_offsets, lengths) + np.arange(total)
+    return indices[positions]
+
+
+def top_entries(scores, top_n, exclude=None):
+    """Pick the top N entries, breaking ties by lowest index.
+
+    Uses a partial sort, then keeps every entry above the N-th score plus
+    the lowest-index entries equal to it, so the result matches a full
+    stable sort exactly.
+
+    Args:
+        scores: 1-D array of scores
+        top_n: Number of entries to return
+        exclude: Optional index that must never be returned
+
+    Returns:
+        Array of indices ordered by (score descending, index ascending)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+
+    available = len(scores) - (1 if exclude is not None else 0)
+    k = min(top_n, available)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > threshold)
+    equal = np.flatnonzero(scores == threshold)[:k - len(above)]
+    chosen = np.concatenate([above, equal])
+    return chosen[np.lexsort((chosen, -scores[chosen]))]
+
+
+BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """Count set bits in every element of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    # NumPy < 2.0: count bits byte by byte with a lookup table
+    as_bytes = words.view(np.uint8).reshape(words.shape + (8,))
+    return BYTE_POPCOUNT[as_bytes].sum(axis=-1)
+
+
+def bitset_jaccard(bits1, bits2):
+    """Jaccard similarity of two purchase bitsets (Python ints).
+
+    Same result as jaccard_similarity on sets, using AND/OR plus popcount
+    so no temporary sets are allocated.
+    """
+    union = (bits1 | bits2).bit_count()
+    if union == 0:
+        return 0.0
+    return (bits1 & bits2).bit_count() / union
+
+
+class MatrixBackend:
+    """Shared plumbing for backends that score users as matrix rows.
+
+    Rows follow the order users were added, so ranking by (similarity,
+    row) breaks ties exactly like the dict-of-sets path. Subclasses
+    provide build() and intersection_counts().
+    """
+
+    def __init__(self, rec_sys):
+        """Attach the backend to a recommendation system.
+
+        Args:
+            rec_sys: The RecommendationSystem whose purchases are indexed
+        """
+        self.rec_sys = rec_sys
+        self.dirty = True
+
+    def mark_dirty(self):
+        """Flag the matrix as stale after purchases changed."""
+        self.dirty = True
+
+    def add_user(self, user_id):
+        """Called by add_user; the default is a lazy rebuild."""
+        self.dirty = True
+
+    def add_purchase(self, user_id, product_id):
+        """Called by add_purchase; the default is a lazy rebuild."""
+        self.dirty = True
+
+    def ensure_built(self):
+        """Rebuild the matrix if purchases changed since the last build."""
+        if self.dirty:
+            self.build()
+
+    def index_ids(self):
+        """Number users (insertion order) and products (catalog order)."""
+        rec_sys = self.rec_sys
+        self.user_ids = list(rec_sys.users)
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.product_ids = list(rec_sys.products)
+        for products in rec_sys.users.values():
+            for product_id in products:
+                if product_id not in rec_sys.products:
+                    self.product_ids.append(product_id)
+        self.product_ids = list(dict.fromkeys(self.product_ids))
+        self.product_index = {product_id: i for i, product_id in enumerate(self.product_ids)}
+
+    def similarity_block(self, user_ids):
+        """Jaccard similarity of a block of users against every user.
+
+        Args:
+            user_ids: List of user IDs (rows of the result)
+
+        Returns:
+            Array of shape (len(user_ids), number of users); columns
+            follow the order users were added
+        """
+        self.ensure_built()
+        rows = np.array([self.user_index[user_id] for user_id in user_ids], dtype=np.int64)
+        intersections = self.intersection_counts(rows)
+        unions = self.sizes[rows][:, None] + self.sizes[None, :] - intersections
+
+        similarities = np.zeros(intersections.shape, dtype=np.float64)
+        np.divide(intersections, unions, out=similarities, where=unions > 0)
+        return similarities
+
+    def similar_users_block(self, user_ids, top_n):
+        """Find the most similar users for each user in a block.
+
+        Args:
+            user_ids: List of user IDs
+            top_n: Number of similar users per user
+
+        Returns:
+            List of [(user_id, similarity_score), ...] lists, one per user
+        """
+        similarities = self.similarity_block(user_ids)
+        results = []
+        for user_id, row in zip(user_ids, similarities):
+            best = top_entries(row, top_n, exclude=self.user_index[user_id])
+            results.append([(self.user_ids[i], float(row[i])) for i in best])
+        return results
+
+    def similar_users(self, user_id, top_n):
+        """Find the users most similar to one user."""
+        return self.similar_users_block([user_id], top_n)[0]
+
+
+class SparseBackend(MatrixBackend):
+    """User × product purchase matrix stored in CSR and CSC form.
+
+    Jaccard similarity of one user (or a block of users) against everyone
+    is computed with sparse products instead of one Python call per pair.
+
+    Building the arrays walks every purchase in Python, so it costs
+    O(purchases) and is never done per write. add_user and add_purchase
+    append to a small delta instead (new rows, and pending purchases
+    indexed by user and by product) that queries merge into the matrix
+    counts. The delta is folded into a fresh build once it holds more
+    than compact_fraction of the stored purchases (at least min_delta),
+    so the rebuild cost is amortized over many writes; compact() forces
+    it. rebuild_indexes and bulk loads still mark the matrix dirty, and
+    the next query rebuilds it.
+    """
+
+    def __init__(self, rec_sys, use_scipy=None, compact_fraction=0.1, min_delta=1000):
+        """Attach the backend to a recommendation system.
+
+        Args:
+            rec_sys: The RecommendationSystem whose purchases are indexed
+            use_scipy: Use scipy.sparse matrices (default: when installed)
+            compact_fraction: Pending purchases, as a share of the built
+                ones, that trigger a rebuild
+            min_delta: Pending purchases always allowed before a rebuild
+        """
+        if use_scipy and sparse is None:
+            raise ImportError("use_scipy=True needs SciPy installed")
+        super().__init__(rec_sys)
+        self.use_scipy = sparse is not None if use_scipy is None else use_scipy
+        self.compact_fraction = compact_fraction
+        self.min_delta = min_delta
+
+    def build(self):
+        """Rebuild the CSR (users) and CSC (products) arrays."""
+        rec_sys = self.rec_sys
+        self.index_ids()
+
+        # Users -> products (CSR)
+        self.sizes = np.fromiter(
+            (len(rec_sys.users[user_id]) for user_id in self.user_ids),
+            dtype=np.int64, count=len(self.user_ids)
+        )
+        self.user_indptr = np.zeros(len(self.user_ids) + 1, dtype=np.int64)
+        np.cumsum(self.sizes, out=self.user_indptr[1:])
+        self.user_indices = np.fromiter(
+            (self.product_index[product_id]
+             for user_id in self.user_ids
+             for product_id in sorted(rec_sys.users[user_id], key=self.product_index.get)),
+            dtype=np.int64, count=int(self.user_indptr[-1])
+        )
+
+        # Products -> users (CSC), derived from the CSR arrays
+        order = np.argsort(self.user_indices, kind="stable")
+        rows = np.repeat(np.arange(len(self.user_ids)), self.sizes)
+        self.product_users = rows[order]
+        counts = np.bincount(self.user_indices, minlength=len(self.product_ids))
+        self.product_indptr = np.zeros(len(self.product_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.product_indptr[1:])
+
+        if self.use_scipy:
+            shape = (len(self.user_ids), len(self.product_ids))
+            ones = np.ones(len(self.user_indices), dtype=np.int64)
+            self.matrix = sparse.csr_matrix((ones, self.user_indices, self.user_indptr), shape=shape)
+            self.matrix_t = self.matrix.T.tocsr()
+
+        # Writes after this build go to the delta
+        self.n_built_users = len(self.user_ids)
+        self.n_built_products = len(self.product_ids)
+        self.size_buffer = self.sizes
+        self.pending = 0
+        self.pending_by_user = {}  # {row: [columns bought since the build]}
+        self.pending_by_product = {}  # {column: [rows that bought it since the build]}
+        self.dirty = False
+
+    def compact(self):
+        """Fold the pending writes into freshly built arrays."""
+        self.build()
+
+    def add_user(self, user_id):
+        """Append an empty row to the delta."""
+        if self.dirty:
+            return
+        row = len(self.user_ids)
+        if row == len(self.size_buffer):
+            self.size_buffer = np.concatenate([self.size_buffer, np.zeros(max(row, 1), dtype=np.int64)])
+        self.user_ids.append(user_id)
+        self.user_index[user_id] = row
+        self.sizes = self.size_buffer[:row + 1]
+
+    def add_purchase(self, user_id, product_id):
+        """Record one purchase in the delta, rebuilding once it grows large."""
+        if self.dirty:
+            return
+        column = self.product_index.get(product_id)
+        if column is None:
+            column = self.product_index[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+        row = self.user_index[user_id]
+        self.pending_by_user.setdefault(row, []).append(column)
+        self.pending_by_product.setdefault(column, []).append(row)
+        self.size_buffer[row] += 1
+        self.pending += 1
+        if self.pending > max(self.min_delta, self.compact_fraction * len(self.user_indices)):
+            self.dirty = True
+
+    def intersection_counts(self, rows):
+        """Count shared products between the given users and everyone.
+
+        Args:
+            rows: Array of user row numbers
+
+        Returns:
+            Array of shape (len(rows), number of users)
+        """
+        n_built = self.n_built_users
+        counts = np.zeros((len(rows), len(self.user_ids)), dtype=np.int64)
+        built = np.flatnonzero(rows < n_built)
+        if len(built) and self.use_scipy:
+            counts[built, :n_built] = (self.matrix[rows[built]] @ self.matrix_t).toarray()
+        elif len(built):
+            for i in built:
+                row = rows[i]
+                products = self.user_indices[self.user_indptr[row]:self.user_indptr[row + 1]]
+                buyers = gather_rows(self.product_indptr, self.product_users, products)
+                counts[i, :n_built] = np.bincount(buyers, minlength=n_built)
+        if self.pending:
+            self.add_pending_counts(rows, counts)
+        return counts
+
+    def add_pending_counts(self, rows, counts):
+        """Add the products shared through purchases made since the build.
+
+        A pending purchase (user, product) is shared with every other
+        buyer of the product, built or pending, so for each query row
+        this adds its own pending products' buyers, and the pending
+        buyers of its built products.
+        """
+        for i, row in enumerate(rows):
+            for column in self.pending_by_user.get(row, ()):
+                if column < self.n_built_products:
+                    start, end = self.product_indptr[column], self.product_indptr[column + 1]
+                    counts[i, self.product_users[start:end]] += 1
+                counts[i, self.pending_by_product[column]] += 1
+            if row < self.n_built_users:
+                for column in self.user_indices[self.user_indptr[row]:self.user_indptr[row + 1]].tolist():
+                    buyers = self.pending_by_product.get(column)
+                    if buyers:
+                        counts[i, buyers] += 1
+
+
+class BitsetBackend(MatrixBackend):
+    """Each user's purchases packed into a row of uint64 words.
+
+    Meant for mid-sized catalogs (up to ~100k products), where a row is a
+    few kilobytes. Intersections are AND plus popcount over only the words
+    the query user has bits in, and purchases set bits in place instead of
+    forcing a rebuild.
+    """
+
+    def build(self):
+        """Pack every basket into the bit matrix."""
+        rec_sys = self.rec_sys
+        self.index_ids()
+        n_users = len(self.user_ids)
+        self.n_words = max((len(self.product_ids) + 63) // 64, 1)
+        self.bits = np.zeros((max(n_users, 1), self.n_words), dtype=np.uint64)
+        self.size_buffer = np.zeros(max(n_users, 1), dtype=np.int64)
+
+        rows = []
+        columns = []
+        for row, user_id in enumerate(self.user_ids):
+            for product_id in rec_sys.users[user_id]:
+                rows.append(row)
+                columns.append(self.product_index[product_id])
+        rows = np.array(rows, dtype=np.int64)
+        columns = np.array(columns, dtype=np.int64)
+        masks = np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64))
+        np.bitwise_or.at(self.bits, (rows, columns // 64), masks)
+        np.add.at(self.size_buffer, rows, 1)
+
+        self.sizes = self.size_buffer[:n_users]
+        self.dirty = False
+
+    def add_user(self, user_id):
+        """Append an empty row, growing the matrix geometrically."""
+        if self.dirty:
+            return
+        row = len(self.user_ids)
+        if row == len(self.bits):
+            self.bits = np.concatenate([self.bits, np.zeros_like(self.bits)])
+            self.size_buffer = np.concatenate([self.size_buffer, np.zeros_like(self.size_buffer)])
+        self.user_ids.append(user_id)
+        self.user_index[user_id] = row
+        self.sizes = self.size_buffer[:row + 1]
+
+    def add_purchase(self, user_id, product_id):
+        """Set one bit, widening rows if the product is new to the matrix."""
+        if self.dirty:
+            return
+        column = self.product_index.get(product_id)
+        if column is None:
+            column = self.product_index[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+            if column // 64 >= self.n_words:
+                extra = np.zeros_like(self.bits)
+                self.bits = np.concatenate([self.bits, extra], axis=1)
+                self.n_words *= 2
+
+        row = self.user_index[user_id]
+        mask = np.uint64(1) << np.uint64(column % 64)
+        if not self.bits[row, column // 64] & mask:
+            self.bits[row, column // 64] |= mask
+            self.size_buffer[row] += 1
+
+    def intersection_counts(self, rows):
+        """Count shared products via AND + popcount on the non-zero words."""
+        n_users = len(self.user_ids)
+        counts = np.zeros((len(rows), n_users), dtype=np.int64)
+        for i, row in enumerate(rows):
+            query = self.bits[row]
+            words = np.flatnonzero(query)
+            if len(words):
+                shared = popcount(self.bits[:n_users, words] & query[words])
+                counts[i] = shared.sum(axis=1, dtype=np.int64)
+        return counts
+
+    def user_bits(self, user_id):
+        """Get one user's purchases as a Python int bitset."""
+        self.ensure_built()
+        row = self.bits[self.user_index[user_id]]
+        return int.from_bytes(row.astype("<u8").tobytes(), "little")
+
+
+def benchmark(n_users=20000, n_products=5000, basket_size=20, queries=200, seed=0):
+    """Time find_similar_users on each backend with the same random data.
+
+    Args:
+        n_users: Number of users to generate
+        n_products: Catalog size
+        basket_size: Maximum purchases per user
+        queries: Number of timed queries per backend
+        seed: Seed for the generated data
+
+    Returns:
+        Dictionary of {backend name: mean milliseconds per query}
+    """
+    from recommendation_system import RecommendationSystem
+
+    rng = random.Random(seed)
+    baskets = {
+        f"U{u}": {f"P{min(int(rng.paretovariate(0.7)) - 1, n_products - 1)}"
+                  for _ in range(rng.randint(1, basket_size))}
+        for u in range(n_users)
+    }
+    sample = rng.sample(list(baskets), queries)
+
+    results = {}
+    for name in ("sets", "sparse", "bitset"):
+        rec_sys = RecommendationSystem(backend=None if name == "sets" else name)
+        rec_sys.products = {f"P{p}": f"Product {p}" for p in range(n_products)}
+        for user_id, products in baskets.items():
+            rec_sys.users[user_id] = set(products)
+            for product_id in products:
+                rec_sys.product_users[product_id].add(user_id)
+        rec_sys.rebuild_indexes(co_purchases=False)
+        if rec_sys.backend is not None:
+            rec_sys.backend.ensure_built()
+
+        start = time.perf_counter()
+        for user_id in sample:
+            rec_sys.find_similar_users(user_id, top_n=5)
+        results[name] = (time.perf_counter() - start) * 1000 / queries
+    return results
+
+
+def main():
+    """Print the backend benchmark."""
+    print("find_similar_users, mean ms per query:")
+    for name, ms in benchmark().items():
+        print(f"  {name:>7}: {ms:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
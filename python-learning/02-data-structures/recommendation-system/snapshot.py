@@ -0,0 +1,318 @@
+"""
+Binary Snapshots
+Compact on-disk format for the recommendation store, loaded via mmap
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from compact_store import IdInterner, PostingSet
+
+MAGIC = b"RECSNAP1"
+VERSION = 2  # 2 added the user_segments section
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def write_snapshot(rec_sys, filename):
+    """Write a recommendation system to a binary snapshot.
+
+    Layout: magic, a JSON header describing each section, then 8-byte
+    aligned sections. ID tables are JSON string lists; purchases are
+    offset/postings arrays in both directions (users -> products and
+    products -> users); the co-purchase table is stored per product
+    already sorted by count, so top-N reads are a slice; user segments
+    are a JSON object. The file is written next to the target and
+    renamed into place.
+
+    Args:
+        rec_sys: The RecommendationSystem to save
+        filename: Destination path
+    """
+    # Users keep insertion order, which is also the similarity tie-break
+    user_index = IdInterner(rec_sys.users)
+    product_index = IdInterner(rec_sys.products)
+    for products in rec_sys.users.values():
+        for product_id in products:
+            product_index.intern(product_id)
+
+    user_indptr = array("Q", [0])
+    user_postings = array("I")
+    for user_id in user_index.ids:
+        user_postings.extend(sorted(product_index.index[p] for p in rec_sys.users[user_id]))
+        user_indptr.append(len(user_postings))
+
+    # Walking users in order keeps each product's buyer list sorted
+    buyers = [array("I") for _ in range(len(product_index))]
+    for number in range(len(user_index)):
+        for product_number in user_postings[user_indptr[number]:user_indptr[number + 1]]:
+            buyers[product_number].append(number)
+    product_indptr = array("Q", [0])
+    product_postings = array("I")
+    for postings in buyers:
+        product_postings.extend(postings)
+        product_indptr.append(len(product_postings))
+    del buyers
+
+    co_indptr = array("Q", [0])
+    co_products = array("I")
+    co_counts = array("I")
+    for product_id in product_index.ids:
+        counts = rec_sys.co_purchases.get(product_id)
+        if counts:
+            for other_product_id, count in counts.most_common():
+                co_products.append(product_index.intern(other_product_id))
+                co_counts.append(count)
+        co_indptr.append(len(co_products))
+
+    names = [rec_sys.products.get(product_id, product_id) for product_id in product_index.ids]
+    sections = [
+        ("user_ids", json.dumps(user_index.ids).encode("utf-8"), "B"),
+        ("product_ids", json.dumps(product_index.ids).encode("utf-8"), "B"),
+        ("product_names", json.dumps(names).encode("utf-8"), "B"),
+        ("user_segments", json.dumps(rec_sys.user_segments).encode("utf-8"), "B"),
+        ("user_indptr", user_indptr.tobytes(), "Q"),
+        ("user_postings", user_postings.tobytes(), "I"),
+        ("product_indptr", product_indptr.tobytes(), "Q"),
+        ("product_postings", product_postings.tobytes(), "I"),
+        ("co_indptr", co_indptr.tobytes(), "Q"),
+        ("co_products", co_products.tobytes(), "I"),
+        ("co_counts", co_counts.tobytes(), "I"),
+    ]
+
+    # Offsets are relative to the end of the header, so it can be sized last
+    header = {"version": VERSION, "byteorder": sys.byteorder, "sections": {}}
+    offset = 0
+    for name, data, typecode in sections:
+        header["sections"][name] = [offset, len(data), typecode]
+        offset += len(data) + (-len(data) % 8)
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(MAGIC) + 8 + len(header_bytes)
+    data_start += -data_start % 8
+
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", data_start))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for _, data, _ in sections:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+class MappedPostings(Mapping):
+    """Read-only {external_id: PostingSet} view over mapped offset/postings arrays.
+
+    Nothing is decoded up front: each lookup slices the memory map, so
+    pages are only read from disk when a posting list is actually used.
+    """
+
+    def __init__(self, keys, members, indptr, postings):
+        self.keys_interner = keys
+        self.members_interner = members
+        self.indptr = indptr
+        self.postings = postings
+
+    def __getitem__(self, key):
+        number = self.keys_interner.index.get(key)
+        if number is None:
+            raise KeyError(key)
+        start, end = self.indptr[number], self.indptr[number + 1]
+        return PostingSet(self.postings[start:end], self.members_interner)
+
+    def __iter__(self):
+        return iter(self.keys_interner.ids)
+
+    def __len__(self):
+        return len(self.keys_interner)
+
+
+class MappedCoPurchaseRow(Mapping):
+    """One product's co-purchase counts, stored sorted by count.
+
+    Offers the parts of Counter the recommender uses: most_common() is a
+    slice, and the Mapping interface allows dict(row) for exports.
+    """
+
+    def __init__(self, product_ids, products, counts):
+        self.product_ids = product_ids
+        self.products = products
+        self.counts = counts
+
+    def most_common(self, n=None):
+        end = len(self.counts) if n is None else min(n, len(self.counts))
+        return [(self.product_ids[self.products[i]], self.counts[i]) for i in range(end)]
+
+    def __getitem__(self, product_id):
+        for other_product_id, count in self.most_common():
+            if other_product_id == product_id:
+                return count
+        raise KeyError(product_id)
+
+    def __iter__(self):
+        for number in self.products:
+            yield self.product_ids[number]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class MappedCoPurchases(Mapping):
+    """Read-only {product_id: MappedCoPurchaseRow} view of the co-purchase table."""
+
+    def __init__(self, product_index, indptr, products, counts):
+        self.product_index = product_index
+        self.indptr = indptr
+        self.products = products
+        self.counts = counts
+
+    def __getitem__(self, product_id):
+        number = self.product_index.index.get(product_id)
+        if number is None:
+            raise KeyError(product_id)
+        start, end = self.indptr[number], self.indptr[number + 1]
+        return MappedCoPurchaseRow(self.product_index.ids, self.products[start:end], self.counts[start:end])
+
+    def __iter__(self):
+        return iter(self.product_index.ids)
+
+    def __len__(self):
+        return len(self.product_index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        # Products nobody co-bought compare equal to missing entries
+        mine = {p: dict(row.most_common()) for p, row in self.items() if row}
+        theirs = {p: dict(row) for p, row in other.items() if row}
+        return mine == theirs
+
+
+class MappedSnapshot:
+    """A binary snapshot opened with mmap.
+
+    Only the ID tables are decoded when the file is opened; every posting
+    list and co-purchase row is a zero-copy memoryview into the map, so
+    the operating system pages data in as queries touch it and processes
+    mapping the same file share those pages.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a recommendation snapshot")
+
+        (data_start,) = struct.unpack_from("<Q", self.map, len(MAGIC))
+        header = json.loads(self.map[len(MAGIC) + 8:data_start].rstrip(b"\0"))
+        if header["version"] != VERSION or header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"Unsupported snapshot format in {filename}")
+
+        view = memoryview(self.map)
+        self.sections = {}
+        for name, (offset, length, typecode) in header["sections"].items():
+            start = data_start + offset
+            self.sections[name] = view[start:start + length].cast(typecode)
+
+        self.user_ids = IdInterner(json.loads(bytes(self.sections["user_ids"])))
+        self.product_ids = IdInterner(json.loads(bytes(self.sections["product_ids"])))
+        names = json.loads(bytes(self.sections["product_names"]))
+        self.products = dict(zip(self.product_ids.ids, names))
+        self.user_segments = json.loads(bytes(self.sections["user_segments"]))
+
+        self.users = MappedPostings(self.user_ids, self.product_ids,
+                                    self.sections["user_indptr"], self.sections["user_postings"])
+        self.product_users = MappedPostings(self.product_ids, self.user_ids,
+                                            self.sections["product_indptr"], self.sections["product_postings"])
+        self.co_purchases = MappedCoPurchases(self.product_ids, self.sections["co_indptr"],
+                                              self.sections["co_products"], self.sections["co_counts"])
+
+    def close(self):
+        """Release the memory map and the file handle."""
+        self.sections = {}
+        self.users = self.product_users = self.co_purchases = None
+        try:
+            self.map.close()
+        except BufferError:
+            # Views handed out to callers keep the map alive until dropped
+            pass
+        self.file.close()
+
+
+def save_snapshot(rec_sys, filename="rec_system_data.snap"):
+    """Save the recommendation system as a binary snapshot."""
+    try:
+        write_snapshot(rec_sys, filename)
+        logger.info("✓ Snapshot saved to %s", filename)
+    except Exception as e:
+        logger.error("Error saving snapshot: %s", e)
+
+
+def attach_snapshot(rec_sys, snapshot):
+    """Point a recommendation system at an open snapshot, without output."""
+    rec_sys.users = snapshot.users
+    rec_sys.product_users = snapshot.product_users
+    rec_sys.products = snapshot.products
+    rec_sys.co_purchases = snapshot.co_purchases
+    rec_sys.user_segments = dict(snapshot.user_segments)
+    rec_sys.rebuild_indexes(co_purchases=False)
+
+
+def load_snapshot(rec_sys, filename="rec_system_data.snap"):
+    """Serve a recommendation system straight from a memory-mapped snapshot.
+
+    Queries work immediately; posting lists are read lazily from the map.
+    The mapped data is read-only, so use load_system on the JSON export
+    for a system that still needs to record purchases.
+
+    Returns:
+        The MappedSnapshot, which stays open while rec_sys uses it
+    """
+    snapshot = MappedSnapshot(filename)
+    attach_snapshot(rec_sys, snapshot)
+    logger.info("✓ Snapshot mapped from %s", filename)
+    logger.info("  Users: %d, Products: %d", len(rec_sys.users), len(rec_sys.products))
+    return snapshot
+
+
+def main():
+    """Convert between the JSON data file and binary snapshots."""
+    from recommendation_system import RecommendationSystem, load_system, save_system
+
+    parser = argparse.ArgumentParser(description="Recommendation snapshot tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_snapshot = commands.add_parser("export", help="JSON data file -> binary snapshot")
+    to_snapshot.add_argument("json_file")
+    to_snapshot.add_argument("snapshot_file")
+    to_json = commands.add_parser("import", help="binary snapshot -> JSON data file")
+    to_json.add_argument("snapshot_file")
+    to_json.add_argument("json_file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
+    rec_sys = RecommendationSystem()
+    if args.command == "export":
+        load_system(rec_sys, args.json_file)
+        save_snapshot(rec_sys, args.snapshot_file)
+    else:
+        load_snapshot(rec_sys, args.snapshot_file)
+        save_system(rec_sys, args.json_file)
+
+
+if __name__ == "__main__":
+    main()
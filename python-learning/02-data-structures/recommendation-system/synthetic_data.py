@@ -0,0 +1,123 @@
+"""
+Synthetic Data
+Power-law user/product/purchase datasets for benchmarking
+"""
+
+import argparse
+import csv
+import random
+
+
+def power_law_rank(rng, n, exponent):
+    """Draw a rank in [0, n) where rank r has weight about 1 / (r + 1) ** exponent.
+
+    Uses the inverse CDF of a bounded continuous power law, so it needs
+    no per-rank table and works for catalogs of any size.
+    """
+    u = rng.random()
+    if exponent == 1:
+        x = n ** u
+    else:
+        power = 1 - exponent
+        x = ((n ** power - 1) * u + 1) ** (1 / power)
+    return min(int(x) - 1, n - 1)
+
+
+def generate_purchases(n_purchases, n_users=None, n_products=None,
+                       basket_alpha=1.5, product_exponent=1.0, max_basket=None,
+                       block_users=1000, seed=0):
+    """Stream power-law (user_id, product_id) pairs.
+
+    Basket sizes follow a Pareto distribution (most users buy little, a
+    few buy a lot) and products follow Zipf popularity (a few bestsellers,
+    a long tail), which is what the similarity and co-purchase code has to
+    cope with in practice. Rows are generated lazily, a block of users at
+    a time with the block shuffled so users interleave as in a real order
+    log; even 100M rows never sit in memory. Repeated pairs can occur
+    (bulk_add_purchases drops them).
+
+    Args:
+        n_purchases: Number of rows to generate
+        n_users: Number of users (default: one per 10 purchases); once all
+            have a basket, further rows go to existing users again
+        n_products: Number of products (default: one per 50 purchases)
+        basket_alpha: Pareto shape of basket sizes (smaller is more skewed)
+        product_exponent: Zipf exponent of product popularity (0 is uniform)
+        max_basket: Largest basket (default: 100x the mean, at most n_products)
+        block_users: Users generated and shuffled together
+        seed: Seed so the same arguments give the same data
+
+    Yields:
+        (user_id, product_id) tuples such as ("U12", "P3")
+    """
+    n_users = n_users or max(n_purchases // 10, 1)
+    n_products = n_products or max(n_purchases // 50, 1)
+    rng = random.Random(seed)
+    mean_basket = n_purchases / n_users
+    max_basket = min(max_basket or max(int(mean_basket * 100), 1), n_products)
+    # Pareto(alpha) has mean alpha / (alpha - 1), so scale it to mean_basket
+    scale = mean_basket * (basket_alpha - 1) / basket_alpha if basket_alpha > 1 else mean_basket
+
+    produced = 0
+    user = 0
+    while produced < n_purchases:
+        block = []
+        for _ in range(block_users):
+            remaining = n_purchases - produced - len(block)
+            if remaining <= 0:
+                break
+            size = min(max(int(rng.paretovariate(basket_alpha) * scale), 1), max_basket, remaining)
+            user_id = f"U{user % n_users}"
+            block.extend((user_id, f"P{power_law_rank(rng, n_products, product_exponent)}")
+                         for _ in range(size))
+            user += 1
+        rng.shuffle(block)
+        produced += len(block)
+        yield from block
+
+
+def write_purchases(filename, purchases):
+    """Write pairs to a CSV file that read_purchases can stream back.
+
+    Returns:
+        Number of rows written
+    """
+    rows = 0
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "product_id"])
+        for user_id, product_id in purchases:
+            writer.writerow([user_id, product_id])
+            rows += 1
+    return rows
+
+
+def parse_size(value):
+    """Parse sizes such as "5000", "10k", "1m" or "100M"."""
+    value = value.strip().lower().replace("_", "")
+    multipliers = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def main():
+    """Write a synthetic purchase file from the command line."""
+    parser = argparse.ArgumentParser(description="Generate power-law purchase data")
+    parser.add_argument("purchases", type=parse_size, help='Rows to generate, e.g. "1m"')
+    parser.add_argument("output", help="Destination CSV file")
+    parser.add_argument("--users", type=parse_size, default=None)
+    parser.add_argument("--products", type=parse_size, default=None)
+    parser.add_argument("--basket-alpha", type=float, default=1.5)
+    parser.add_argument("--product-exponent", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = write_purchases(args.output, generate_purchases(
+        args.purchases, args.users, args.products,
+        basket_alpha=args.basket_alpha, product_exponent=args.product_exponent, seed=args.seed))
+    print(f"✓ Wrote {rows:,} purchases to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
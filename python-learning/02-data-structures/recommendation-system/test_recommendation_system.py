@@ -0,0 +1,892 @@
+"""
+Unit tests for recommendation_system.py
+
+Run tests with: pytest test_recommendation_system.py
+or just: pytest
+"""
+
+import os
+import random
+from collections import Counter
+
+import pytest
+from recommendation_system import RecommendationSystem
+
+
+def build_system(n_users=60, n_products=40, n_purchases=300, seed=7):
+    """Build a random system with a few empty users to exercise ties."""
+    rng = random.Random(seed)
+    rec_sys = RecommendationSystem()
+    for p in range(n_products):
+        rec_sys.add_product(f"P{p}", f"Product {p}")
+    for u in range(n_users):
+        rec_sys.add_user(f"U{u}", f"user{u}")
+    for _ in range(n_purchases):
+        user_id = f"U{rng.randrange(n_users - 5)}"
+        product_id = f"P{min(int(rng.paretovariate(1.2)) - 1, n_products - 1)}"
+        rec_sys.add_purchase(user_id, product_id)
+    return rec_sys
+
+
+def full_scan_similar_users(rec_sys, user_id, top_n):
+    """Reference ranking: score every user, then stable sort."""
+    similarities = []
+    for other_user_id in rec_sys.users:
+        if other_user_id != user_id:
+            similarity = rec_sys.jaccard_similarity(
+                rec_sys.users[user_id], rec_sys.users[other_user_id]
+            )
+            similarities.append((other_user_id, similarity))
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return similarities[:top_n]
+
+
+@pytest.fixture
+def rec_sys():
+    return build_system()
+
+
+# Test candidate generation
+@pytest.mark.parametrize("top_n", [1, 3, 5, 100])
+def test_find_similar_users_matches_full_scan(rec_sys, top_n):
+    """Test that the inverted-index ranking equals the full scan exactly."""
+    for user_id in rec_sys.users:
+        expected = full_scan_similar_users(rec_sys, user_id, top_n)
+        assert rec_sys.find_similar_users(user_id, top_n=top_n) == expected
+
+
+def test_find_similar_users_pads_with_zero_similarity():
+    """Test that users sharing nothing fill remaining slots in added order."""
+    rec_sys = RecommendationSystem()
+    for user_id in ["A", "B", "C", "D"]:
+        rec_sys.add_user(user_id, user_id)
+    rec_sys.add_product("X", "X")
+    rec_sys.add_product("Y", "Y")
+    rec_sys.add_purchase("A", "X")
+    rec_sys.add_purchase("D", "X")
+    rec_sys.add_purchase("C", "Y")
+    assert rec_sys.find_similar_users("A", top_n=3) == [("D", 1.0), ("B", 0.0), ("C", 0.0)]
+
+
+def test_find_similar_users_unknown_user(rec_sys):
+    """Test that an unknown user gets no similar users."""
+    assert rec_sys.find_similar_users("nobody") == []
+
+
+# Test the sparse-matrix and bitset backends
+@pytest.fixture(params=["numpy", "scipy", "bitset"])
+def sparse_sys(request):
+    pytest.importorskip("numpy")
+    if request.param == "scipy":
+        pytest.importorskip("scipy")
+    rec_sys = RecommendationSystem(backend="bitset" if request.param == "bitset" else "sparse")
+    if request.param != "bitset":
+        rec_sys.backend.use_scipy = request.param == "scipy"
+    reference = build_system()
+    rec_sys.users = {user_id: set(products) for user_id, products in reference.users.items()}
+    rec_sys.products = dict(reference.products)
+    rec_sys.product_users = reference.product_users
+    rec_sys.rebuild_indexes()
+    return rec_sys, reference
+
+
+def test_sparse_backend_matches_dict_backend(sparse_sys):
+    """Test that both backends rank similar users and recommend the same products."""
+    rec_sys, reference = sparse_sys
+    for user_id in reference.users:
+        for top_n in (1, 5, 100):
+            assert rec_sys.find_similar_users(user_id, top_n) == reference.find_similar_users(user_id, top_n)
+        # Equal-score products come out in set order, so compare contents
+        assert set(rec_sys.recommend_products(user_id, 100)) == set(reference.recommend_products(user_id, 100))
+
+
+def test_sparse_backend_sees_new_purchases(sparse_sys):
+    """Test that the matrix follows add_user and add_purchase."""
+    rec_sys, reference = sparse_sys
+    rec_sys.find_similar_users("U0")
+    for system in (rec_sys, reference):
+        system.add_product("P99", "Product 99")
+        system.add_user("new", "new")
+        system.add_purchase("new", "P0")
+        system.add_purchase("new", "P99")
+        system.add_purchase("U1", "P99")
+    for user_id in ("new", "U1", "U2"):
+        assert rec_sys.find_similar_users(user_id, 5) == reference.find_similar_users(user_id, 5)
+
+
+def test_matrix_backends_merge_writes_without_rebuilding(sparse_sys):
+    """Test that interleaved writes and reads match the dict path without rebuilds."""
+    rec_sys, reference = sparse_sys
+    rec_sys.find_similar_users("U0")
+    rng = random.Random(9)
+    for step in range(150):
+        user_id = f"W{step % 7}" if step % 3 else rng.choice(list(reference.users))
+        product_id = f"P{rng.randrange(45)}"
+        for system in (rec_sys, reference):
+            if user_id not in system.users:
+                system.add_user(user_id, user_id)
+            system.add_purchase(user_id, product_id)
+        assert not rec_sys.backend.dirty
+        if step % 10 == 0:
+            for query in (user_id, "U3", "W1"):
+                if query in reference.users:
+                    assert rec_sys.find_similar_users(query, 5) == reference.find_similar_users(query, 5)
+
+    # Folding the delta into the arrays changes nothing
+    backend = rec_sys.backend
+    if hasattr(backend, "compact"):
+        assert backend.pending > 0
+        backend.compact()
+        assert backend.pending == 0
+    for user_id in list(reference.users)[::5] + ["W0", "W6"]:
+        assert rec_sys.find_similar_users(user_id, 5) == reference.find_similar_users(user_id, 5)
+
+
+def test_bitset_jaccard_matches_sets(sparse_sys):
+    """Test that popcount Jaccard on int bitsets equals the set version."""
+    from similarity_backends import BitsetBackend, bitset_jaccard
+
+    _, reference = sparse_sys
+    backend = BitsetBackend(reference)
+    for user_id in ["U0", "U1", "U2", "U58"]:
+        expected = reference.jaccard_similarity(reference.users["U3"], reference.users[user_id])
+        assert bitset_jaccard(backend.user_bits("U3"), backend.user_bits(user_id)) == expected
+
+
+# Test approximate neighbours
+def test_approximate_mode_finds_identical_baskets(rec_sys):
+    """Test that users with identical baskets are always LSH candidates."""
+    rec_sys.add_user("twin", "twin")
+    for product_id in rec_sys.users["U0"]:
+        rec_sys.add_purchase("twin", product_id)
+    rec_sys.build_lsh_index(bands=8, rows=4)
+    similar = rec_sys.find_similar_users("twin", top_n=1, mode="approximate")
+    assert similar[0][1] == 1.0
+
+
+def test_lsh_index_updates_incrementally(rec_sys):
+    """Test that add_purchase keeps signatures equal to a fresh build."""
+    from lsh_index import MinHashLSH
+
+    rec_sys.build_lsh_index(bands=4, rows=2)
+    rec_sys.add_purchase("U1", "P39")
+    rec_sys.add_purchase("U55", "P3")
+    fresh = MinHashLSH(bands=4, rows=2)
+    fresh.build(rec_sys.users)
+    assert rec_sys.lsh_index.signatures == fresh.signatures
+    for user_id in fresh.signatures:
+        assert rec_sys.lsh_index.candidates(user_id) == fresh.candidates(user_id)
+
+
+def test_approximate_scores_are_exact(rec_sys):
+    """Test that every approximate neighbour carries its true similarity."""
+    for user_id in list(rec_sys.users)[:10]:
+        for other_user_id, score in rec_sys.find_similar_users(user_id, 5, mode="approximate"):
+            assert score == rec_sys.jaccard_similarity(rec_sys.users[user_id], rec_sys.users[other_user_id])
+
+
+# Test the co-purchase table
+def scan_bought_together(rec_sys, product_id):
+    """Reference counts: walk every buyer's basket."""
+    counts = {}
+    for user_id in rec_sys.product_users[product_id]:
+        for other_product_id in rec_sys.users[user_id]:
+            if other_product_id != product_id:
+                counts[other_product_id] = counts.get(other_product_id, 0) + 1
+    return counts
+
+
+def test_co_purchases_match_basket_scan(rec_sys):
+    """Test that incremental counts equal a scan, with repeat purchases ignored."""
+    rec_sys.add_purchase("U3", "P0")
+    rec_sys.add_purchase("U3", "P0")
+    for product_id in rec_sys.products:
+        expected = scan_bought_together(rec_sys, product_id)
+        result = rec_sys.get_products_bought_together(product_id, top_n=100)
+        assert dict(result) == expected
+        assert [count for _, count in result] == sorted(expected.values(), reverse=True)
+
+
+def test_co_purchases_survive_save_and_load(rec_sys, tmp_path):
+    """Test that the table is saved and reloaded with the rest of the data."""
+    from recommendation_system import load_system, save_system
+
+    filename = tmp_path / "data.json"
+    save_system(rec_sys, filename)
+    loaded = RecommendationSystem()
+    load_system(loaded, filename)
+    assert loaded.co_purchases == rec_sys.co_purchases
+
+
+# Test the compact interned storage
+def test_compact_storage_matches_sets(rec_sys, tmp_path):
+    """Test that the string-ID API gives the same answers on compact storage."""
+    from recommendation_system import load_system, save_system
+
+    filename = tmp_path / "data.json"
+    save_system(rec_sys, filename)
+    compact = RecommendationSystem(storage="compact")
+    load_system(compact, filename)
+
+    compact.add_purchase("U2", "P30")
+    rec_sys.add_purchase("U2", "P30")
+    for user_id in rec_sys.users:
+        assert set(compact.users[user_id]) == rec_sys.users[user_id]
+        assert compact.find_similar_users(user_id, 5) == rec_sys.find_similar_users(user_id, 5)
+    for product_id in rec_sys.products:
+        assert set(compact.product_users[product_id]) == rec_sys.product_users[product_id]
+    assert compact.co_purchases == rec_sys.co_purchases
+
+
+def test_posting_set_stays_sorted():
+    """Test that PostingSet keeps unique, sorted integer postings."""
+    from array import array
+    from compact_store import IdInterner, PostingSet
+
+    interner = IdInterner(["a", "b", "c"])
+    postings = PostingSet(array("I"), interner)
+    for member in ["c", "a", "c", "d"]:
+        postings.add(member)
+    assert list(postings.postings) == [0, 2, 3]
+    assert "d" in postings and "b" not in postings
+    assert postings.intersection({"a", "b"}) == {"a"}
+
+
+# Test bulk ingestion
+def test_bulk_add_matches_single_calls(rec_sys):
+    """Test that bulk ingestion builds the same state as add_purchase."""
+    pairs = [(user_id, product_id)
+             for user_id, products in rec_sys.users.items()
+             for product_id in products]
+    bulk = RecommendationSystem()
+    summary = bulk.bulk_add_purchases(pairs + pairs[:10], batch_size=50)
+    assert summary["added"] == len(pairs)
+    assert summary["duplicates"] == 10
+    assert bulk.product_users == {p: u for p, u in rec_sys.product_users.items() if u}
+    assert bulk.co_purchases == rec_sys.co_purchases
+
+
+def test_bulk_add_reads_files(tmp_path, capsys):
+    """Test CSV and JSONL input, rejection of unknown IDs and silence."""
+    csv_file = tmp_path / "purchases.csv"
+    csv_file.write_text("user_id,product_id\nu1,p1\nu1,p2\nu2,p1\nu1,p1\n")
+    jsonl_file = tmp_path / "purchases.jsonl"
+    jsonl_file.write_text('{"user_id": "u2", "product_id": "p2"}\n{"user_id": "u3", "product_id": "p1"}\n')
+
+    rec_sys = RecommendationSystem()
+    summary = rec_sys.bulk_add_purchases(str(csv_file))
+    assert (summary["added"], summary["new_users"], summary["new_products"]) == (3, 2, 2)
+    summary = rec_sys.bulk_add_purchases(str(jsonl_file), create_missing=False)
+    assert (summary["added"], summary["rejected"]) == (1, 1)
+    assert rec_sys.users == {"u1": {"p1", "p2"}, "u2": {"p1", "p2"}}
+    assert capsys.readouterr().out == ""
+
+
+# Test binary snapshots
+def test_snapshot_round_trip(rec_sys, tmp_path):
+    """Test that a mapped snapshot answers queries like the live system."""
+    from recommendation_system import load_system, save_system
+    from snapshot import load_snapshot, save_snapshot
+
+    filename = tmp_path / "data.snap"
+    save_snapshot(rec_sys, filename)
+    mapped = RecommendationSystem()
+    snapshot = load_snapshot(mapped, filename)
+
+    for user_id in rec_sys.users:
+        assert set(mapped.users[user_id]) == rec_sys.users[user_id]
+        assert mapped.find_similar_users(user_id, 5) == rec_sys.find_similar_users(user_id, 5)
+    for product_id in rec_sys.products:
+        assert (mapped.get_products_bought_together(product_id, 5)
+                == rec_sys.get_products_bought_together(product_id, 5))
+    assert mapped.co_purchases == rec_sys.co_purchases
+
+    # The JSON format still works as an export of a mapped system
+    save_system(mapped, tmp_path / "export.json")
+    reloaded = RecommendationSystem()
+    load_system(reloaded, tmp_path / "export.json")
+    assert reloaded.users == rec_sys.users
+    snapshot.close()
+
+
+def test_snapshot_keeps_user_segments(rec_sys, tmp_path):
+    """Test that segmented popularity survives a snapshot round trip."""
+    from recommendation_system import load_system, save_system
+    from snapshot import load_snapshot, save_snapshot
+
+    rec_sys.add_user("V1", "vip", segment="vip")
+    rec_sys.add_user("V2", "vip", segment="vip")
+    rec_sys.add_purchase("V1", "P39")
+    save_snapshot(rec_sys, tmp_path / "data.snap")
+
+    mapped = RecommendationSystem()
+    snapshot = load_snapshot(mapped, tmp_path / "data.snap")
+    assert mapped.user_segments == {"V1": "vip", "V2": "vip"}
+    mapped.build_popularity_index()
+    assert mapped.recommend_products("V2", top_n=2)[0] == "P39"
+
+    save_system(mapped, tmp_path / "export.json")
+    reloaded = RecommendationSystem()
+    load_system(reloaded, tmp_path / "export.json")
+    assert reloaded.user_segments == rec_sys.user_segments
+    snapshot.close()
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    """Test that a file without the snapshot magic is refused."""
+    from snapshot import MappedSnapshot
+
+    filename = tmp_path / "data.json"
+    filename.write_text("{}" * 10)
+    with pytest.raises(ValueError):
+        MappedSnapshot(filename)
+
+
+# Test the purchase journal
+def test_journal_replays_after_crash(rec_sys, tmp_path):
+    """Test that mutations made after the last save survive a crash."""
+    from journal import PurchaseJournal
+    from recommendation_system import load_system, save_system
+
+    data_file = str(tmp_path / "data.json")
+    journal_file = str(tmp_path / "data.journal")
+    rec_sys.journal = PurchaseJournal(journal_file, data_file, flush="always")
+    save_system(rec_sys, data_file)
+    rec_sys.add_user("late", "late")
+    rec_sys.add_product("P99", "Product 99")
+    rec_sys.add_purchase("late", "P99")
+    rec_sys.add_purchase("U0", "P99")
+    # No save and no close: the process "crashes" here
+
+    recovered = RecommendationSystem()
+    recovered.journal = PurchaseJournal(journal_file, data_file)
+    load_system(recovered, data_file)
+    assert recovered.users == rec_sys.users
+    assert recovered.products == rec_sys.products
+    assert recovered.co_purchases == rec_sys.co_purchases
+
+
+def test_journal_recovers_from_torn_record(tmp_path):
+    """Test that a record torn by a crash does not swallow the next one."""
+    from journal import PurchaseJournal
+    from recommendation_system import load_system
+
+    data_file = str(tmp_path / "data.json")
+    journal_file = tmp_path / "data.journal"
+    journal_file.write_text('["add_product", "P", "P"]\n["add_user", "U1"]\n["add_purchase", "U1"')
+
+    rec_sys = RecommendationSystem()
+    rec_sys.journal = PurchaseJournal(str(journal_file), data_file, flush="always")
+    assert rec_sys.journal.records == 2
+    load_system(rec_sys, data_file)
+    rec_sys.add_user("U2", "U2")
+    rec_sys.add_purchase("U2", "P")
+    # A purchase whose user record was lost is skipped, not fatal
+    rec_sys.journal.append("add_purchase", "lost", "P")
+
+    recovered = RecommendationSystem()
+    recovered.journal = PurchaseJournal(str(journal_file), data_file)
+    load_system(recovered, data_file)
+    assert recovered.users == {"U1": set(), "U2": {"P"}}
+
+
+def test_journal_backs_off_after_failed_compaction(tmp_path):
+    """Test that a failing save is not retried on every write."""
+    from journal import PurchaseJournal
+
+    data_file = str(tmp_path / "missing" / "data.json")
+    journal = PurchaseJournal(str(tmp_path / "data.journal"), data_file, compact_every=3)
+    rec_sys = RecommendationSystem()
+    rec_sys.journal = journal
+    for user_id in ["a", "b", "c", "d", "e"]:
+        rec_sys.add_user(user_id, user_id)
+    assert journal.records == 5 and not journal.needs_compaction()
+    rec_sys.add_user("f", "f")
+    assert journal.records == 6 and journal.compact_at == 9
+    journal.close()
+
+
+def test_journal_compacts_into_data_file(tmp_path):
+    """Test that a full journal is folded into the data file and emptied."""
+    from journal import PurchaseJournal
+    from recommendation_system import load_system
+
+    data_file = str(tmp_path / "data.json")
+    journal = PurchaseJournal(str(tmp_path / "data.journal"), data_file, compact_every=5)
+    rec_sys = RecommendationSystem()
+    rec_sys.journal = journal
+    rec_sys.add_product("P", "P")
+    for user_id in ["a", "b", "c"]:
+        rec_sys.add_user(user_id, user_id)
+    assert journal.records == 4
+    rec_sys.add_purchase("a", "P")
+    assert journal.records == 0
+    journal.close()
+
+    reloaded = RecommendationSystem()
+    load_system(reloaded, data_file)
+    assert reloaded.users == {"a": {"P"}, "b": set(), "c": set()}
+
+
+# Test the result cache
+def test_cache_stays_exact_under_purchases(rec_sys):
+    """Test that cached answers always equal an uncached system's answers."""
+    reference = build_system()
+    cache = rec_sys.enable_cache(max_entries=500)
+    rng = random.Random(3)
+    user_ids = list(rec_sys.users)
+    for step in range(300):
+        user_id = rng.choice(user_ids)
+        if step % 10 == 0:
+            product_id = f"P{rng.randrange(40)}"
+            rec_sys.add_purchase(user_id, product_id)
+            reference.add_purchase(user_id, product_id)
+        if step % 50 == 0:
+            for system in (rec_sys, reference):
+                system.add_user(f"new{step}", "new")
+            user_ids.append(f"new{step}")
+        assert rec_sys.find_similar_users(user_id, 5) == reference.find_similar_users(user_id, 5)
+        assert set(rec_sys.recommend_products(user_id, 50)) == set(reference.recommend_products(user_id, 50))
+        product_id = f"P{rng.randrange(40)}"
+        assert (dict(rec_sys.get_products_bought_together(product_id, 50))
+                == dict(reference.get_products_bought_together(product_id, 50)))
+    stats = cache.stats()
+    assert stats["hits"] > 0 and stats["invalidations"] > 0
+
+
+@pytest.mark.parametrize("backend, mode", [(None, "exact"), ("sparse", "exact"), (None, "approximate")])
+def test_cache_invalidates_only_new_product_buyers(backend, mode):
+    """Test that neighbour lists stay exact while most neighbourhoods survive a purchase."""
+    rec_sys = RecommendationSystem(backend=backend)
+    reference = RecommendationSystem(backend=backend)
+    for system in (rec_sys, reference):
+        base = build_system()
+        for product_id, name in base.products.items():
+            system.add_product(product_id, name)
+        for user_id in base.users:
+            system.add_user(user_id, user_id)
+        system.bulk_add_purchases(
+            (user_id, product_id) for user_id, products in base.users.items() for product_id in sorted(products))
+        if mode == "approximate":
+            system.build_lsh_index(bands=8, rows=2)
+    cache = rec_sys.enable_cache(max_entries=10_000)
+    rng = random.Random(8)
+    user_ids = list(rec_sys.users)
+    for step in range(60):
+        for user_id in user_ids:
+            assert rec_sys.find_similar_users(user_id, 4, mode=mode) == \
+                reference.find_similar_users(user_id, 4, mode=mode)
+        buyer, product_id = rng.choice(user_ids), f"P{rng.randrange(40)}"
+        before = dict(cache.versions)
+        rec_sys.add_purchase(buyer, product_id)
+        reference.add_purchase(buyer, product_id)
+        bumped = {item_id for (kind, item_id), version in cache.versions.items()
+                  if kind == "neighbourhood" and before.get((kind, item_id), 0) != version}
+        assert bumped <= set(rec_sys.product_users[product_id])
+    assert cache.stats()["hits"] > cache.stats()["invalidations"]
+
+
+def test_cache_evicts_least_recently_used():
+    """Test LRU eviction and the exposed counters."""
+    from result_cache import ResultCache
+
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1, [])
+    cache.put("b", 2, [])
+    cache.get("a")
+    cache.put("c", 3, [])
+    assert cache.get("b") is None and cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+# Test parallel batch recommendations
+def test_batch_recommend_matches_single_process(rec_sys, tmp_path):
+    """Test that pooled results equal recommend_products on the same snapshot."""
+    import json
+    from batch_recommend import batch_recommend
+    from snapshot import load_snapshot, save_snapshot
+
+    snapshot_file = str(tmp_path / "data.snap")
+    save_snapshot(rec_sys, snapshot_file)
+    output = tmp_path / "recs.jsonl"
+    summary = batch_recommend(snapshot_file, "all", output, top_n=4, workers=2, shard_size=7)
+    assert summary["users"] == len(rec_sys.users)
+
+    mapped = RecommendationSystem()
+    load_snapshot(mapped, snapshot_file)
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row["user_id"] for row in rows] == list(rec_sys.users)
+    for row in rows:
+        assert row["recommendations"] == mapped.recommend_products(row["user_id"], top_n=4)
+
+
+@pytest.mark.parametrize("backend, mode", [("sparse", "exact"), (None, "approximate")])
+def test_batch_recommend_builds_indexes_before_forking(rec_sys, tmp_path, monkeypatch, backend, mode):
+    """Test that forked workers reuse the matrix or LSH index the parent built."""
+    import json
+    import batch_recommend as batch
+    from lsh_index import MinHashLSH
+    from similarity_backends import SparseBackend
+    from snapshot import load_snapshot, save_snapshot
+
+    snapshot_file = str(tmp_path / "data.snap")
+    save_snapshot(rec_sys, snapshot_file)
+    parent = os.getpid()
+    builds = []
+
+    def counting(build):
+        def counting_build(self, *args):
+            # Raised inside a worker, this fails the batch through imap
+            assert os.getpid() == parent, "worker rebuilt an index"
+            builds.append(type(self).__name__)
+            return build(self, *args)
+        return counting_build
+
+    monkeypatch.setattr(SparseBackend, "build", counting(SparseBackend.build))
+    monkeypatch.setattr(MinHashLSH, "build", counting(MinHashLSH.build))
+    output = tmp_path / "recs.jsonl"
+    batch.batch_recommend(snapshot_file, "all", output, top_n=4, workers=2, shard_size=7,
+                          backend=backend, mode=mode)
+
+    assert builds == ["SparseBackend" if backend else "MinHashLSH"] and batch.worker_system is None
+
+    mapped = RecommendationSystem(backend=backend)
+    load_snapshot(mapped, snapshot_file)
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    for row in rows:
+        assert row["recommendations"] == mapped.recommend_products(row["user_id"], top_n=4, mode=mode)
+
+
+# Test the stored top-K neighbour lists
+@pytest.mark.parametrize("k", [2, 5])
+def test_neighbour_index_stays_consistent(k):
+    """Test that incremental updates match the exact search after every purchase."""
+    rec_sys = build_system(n_purchases=120)
+    reference = build_system(n_purchases=120)
+    index = rec_sys.build_neighbour_index(k=k)
+    rng = random.Random(11)
+    for step in range(150):
+        user_id = f"U{rng.randrange(60)}"
+        product_id = f"P{rng.randrange(40)}"
+        rec_sys.add_purchase(user_id, product_id)
+        reference.add_purchase(user_id, product_id)
+        assert index.check_consistency(sample_size=15, seed=step) == []
+    for user_id in rec_sys.users:
+        assert rec_sys.find_similar_users(user_id, k) == reference.find_similar_users(user_id, k)
+
+
+def test_neighbour_index_rebuild_with_backend():
+    """Test that an offline rebuild through the sparse backend is exact."""
+    pytest.importorskip("numpy")
+    rec_sys = RecommendationSystem(backend="sparse")
+    rec_sys.bulk_add_purchases(
+        (user_id, product_id)
+        for user_id, products in build_system().users.items()
+        for product_id in products
+    )
+    index = rec_sys.build_neighbour_index(k=5)
+    assert index.check_consistency() == []
+
+
+# Test the micro-batching HTTP server
+def test_server_batches_concurrent_requests():
+    """Test that concurrent HTTP requests are answered correctly in batches."""
+    import asyncio
+    import json
+    from rec_server import RecommendationServer
+
+    pytest.importorskip("numpy")
+    rec_sys = RecommendationSystem(backend="sparse")
+    reference = build_system()
+    rec_sys.bulk_add_purchases(
+        (user_id, product_id) for user_id, products in reference.users.items() for product_id in products
+    )
+
+    async def fetch(port, target):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def scenario():
+        server = RecommendationServer(rec_sys, batch_window=0.05)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        user_ids = [u for u in rec_sys.users][:20]
+        responses = await asyncio.gather(
+            *(fetch(port, f"/recommend?user_id={u}&top_n=50") for u in user_ids),
+            fetch(port, "/bought_together?product_id=P0&top_n=2"),
+            fetch(port, "/recommend?user_id=nobody"),
+        )
+        metrics = (await fetch(port, "/metrics"))[1]
+        listener.close()
+        await listener.wait_closed()
+        await server.stop()
+        return user_ids, responses, metrics
+
+    user_ids, responses, metrics = asyncio.run(scenario())
+    for user_id, (status, body) in zip(user_ids, responses):
+        assert status == 200
+        assert set(body["recommendations"]) == set(reference.recommend_products(user_id, 50))
+    status, body = responses[-2]
+    assert [row["count"] for row in body["bought_together"]] == [
+        count for _, count in reference.get_products_bought_together("P0", 2)]
+    assert responses[-1][0] == 404
+    assert metrics["batches"] < 21 and metrics["p99_ms"] >= metrics["p50_ms"]
+
+
+def test_server_answers_errors_and_skips_request_bodies():
+    """Test 500s for failures, 400 for bad top_n and bodies on keep-alive connections."""
+    import asyncio
+    import json
+    from rec_server import RecommendationServer
+
+    rec_sys = build_system()
+
+    async def read_response(reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        return int(head.split()[1]), json.loads(await reader.readexactly(length))
+
+    async def scenario():
+        server = RecommendationServer(rec_sys, batch_window=0.001)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = b'GET /recommend?user_id=U1 HTTP/1.1\r\n\r\n'
+        writer.write(b"POST /recommend HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        writer.write(b"GET /recommend?user_id=U1&top_n=0 HTTP/1.1\r\n\r\n")
+
+        async def fail(*args):
+            raise RuntimeError("boom")
+        server.submit = fail
+        writer.write(b"GET /recommend?user_id=U1 HTTP/1.1\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        responses = [await read_response(reader) for _ in range(3)]
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        await server.stop()
+        return responses
+
+    statuses = [status for status, _ in asyncio.run(scenario())]
+    assert statuses == [405, 400, 500]
+
+
+# Test the synthetic data generator and benchmark suite
+def test_generate_purchases_is_deterministic_and_skewed():
+    """Test that generated data repeats per seed and follows a power law."""
+    from synthetic_data import generate_purchases, parse_size
+
+    rows = list(generate_purchases(20_000, seed=3))
+    assert len(rows) == 20_000
+    assert rows == list(generate_purchases(20_000, seed=3))
+    popularity = Counter(product_id for _, product_id in rows)
+    assert popularity.most_common(1)[0][1] > 20 * len(rows) / len(popularity)
+    assert parse_size("10k") == 10_000 and parse_size("1.5M") == 1_500_000
+
+
+def test_benchmark_suite_writes_report(tmp_path):
+    """Test that the suite covers every operation and flags regressions."""
+    import json
+    from benchmark_suite import compare_reports, run_benchmarks
+
+    output = tmp_path / "results.json"
+    report = run_benchmarks([500], output=str(output), queries=10)
+    saved = json.loads(output.read_text())
+    operations = [row["operation"] for row in saved["results"]]
+    assert operations == ["ingest", "save_system", "load_system", "find_similar_users",
+                          "recommend_products", "get_products_bought_together"]
+    assert all(row["peak_mb"] is not None for row in saved["results"])
+
+    slower = json.loads(json.dumps(report))
+    slower["results"][3]["mean_ms"] = report["results"][3]["mean_ms"] * 2 + 1
+    assert compare_reports(report, report) == []
+    assert [r[1] for r in compare_reports(report, slower)] == ["find_similar_users"]
+
+
+# Test logging and metrics
+def test_messages_go_to_logging(capsys, caplog):
+    """Test that the library logs instead of printing."""
+    rec_sys = RecommendationSystem()
+    with caplog.at_level("INFO", logger="recommendation_system"):
+        rec_sys.add_user("U1", "Alice")
+        rec_sys.add_purchase("U1", "missing")
+        rec_sys.find_similar_users("nobody")
+    assert capsys.readouterr().out == ""
+    levels = [(record.levelname, record.getMessage()) for record in caplog.records]
+    assert levels == [("INFO", "✓ Added user: Alice (ID: U1)"),
+                      ("ERROR", "Error: Product missing not found!"),
+                      ("WARNING", "User nobody not found!")]
+
+
+def test_metrics_record_calls_latencies_and_candidates(rec_sys):
+    """Test that enabled metrics count calls and record candidate sizes."""
+    assert rec_sys.metrics is None
+    metrics = rec_sys.enable_metrics()
+    user_ids = list(rec_sys.users)[:10]
+    for user_id in user_ids:
+        rec_sys.recommend_products(user_id)
+    rec_sys.get_products_bought_together("P0")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["recommend_products"] == 10
+    assert snapshot["counters"]["find_similar_users"] == 10
+    assert snapshot["counters"]["get_products_bought_together"] == 1
+    latency = snapshot["latency_ms"]["recommend_products"]
+    assert 0 < latency["p50"] <= latency["p99"] <= latency["max"]
+    candidates = snapshot["sizes"]["similar_user_candidates"]
+    assert candidates["count"] == 10
+    assert candidates["max"] == max(len(rec_sys.count_shared_products(u, rec_sys.users[u])) for u in user_ids)
+
+
+# Test the sharded deployment mode
+def test_sharded_system_matches_single_process(rec_sys, caplog):
+    """Test that scatter/gather over shards gives the single-process answers."""
+    from sharded_system import ShardedRecommendationSystem
+
+    with ShardedRecommendationSystem(n_shards=3) as sharded:
+        for product_id, name in rec_sys.products.items():
+            sharded.add_product(product_id, name)
+        for user_id in rec_sys.users:
+            sharded.add_user(user_id, user_id)
+        sharded.bulk_add_purchases(
+            (user_id, product_id) for user_id, products in rec_sys.users.items() for product_id in sorted(products)
+        )
+        with caplog.at_level("INFO"):
+            sharded.add_purchase("U1", "P39")
+            rec_sys.add_purchase("U1", "P39")
+        sharded_message, single_message = [record.getMessage() for record in caplog.records]
+        assert sharded_message == single_message
+
+        assert sum(stats["users"] for stats in sharded.stats()) == len(rec_sys.users)
+        for user_id in list(rec_sys.users)[::5] + ["U59"]:
+            assert sharded.find_similar_users(user_id, 8) == rec_sys.find_similar_users(user_id, 8)
+            assert set(sharded.recommend_products(user_id, 100)) == set(rec_sys.recommend_products(user_id, 100))
+        for product_id in ("P0", "P3", "P39"):
+            expected = sorted(count for _, count in rec_sys.get_products_bought_together(product_id, 100))
+            actual = sorted(count for _, count in sharded.get_products_bought_together(product_id, 100))
+            assert actual == expected
+        assert sharded.find_similar_users("nobody") == []
+
+
+# Test the popularity fallback
+def test_popularity_ranking_stays_sorted():
+    """Test that O(1) increments keep the ranking ordered by count."""
+    from popularity import PopularityRanking
+
+    ranking = PopularityRanking()
+    rng = random.Random(5)
+    counts = Counter()
+    for _ in range(2000):
+        product_id = f"P{min(int(rng.paretovariate(1.0)), 50)}"
+        ranking.increment(product_id)
+        counts[product_id] += 1
+    assert [ranking.counts[p] for p in ranking.ranked] == sorted(counts.values(), reverse=True)
+    assert all(ranking.ranked[i] == p for p, i in ranking.position.items())
+    assert set(ranking.top(5)) <= {p for p, c in counts.items() if c >= sorted(counts.values())[-5]}
+
+
+def test_popularity_answers_cold_and_blends_short_results(rec_sys):
+    """Test cold-start answers, segment preference and blending."""
+    popularity = rec_sys.build_popularity_index()
+    bestsellers = sorted(rec_sys.products, key=lambda p: -len(rec_sys.product_users[p]))
+
+    # U59 has no purchases at all
+    top_count = len(rec_sys.product_users[bestsellers[0]])
+    cold = rec_sys.recommend_products("U59", top_n=3)
+    assert len(cold) == 3 and len(rec_sys.product_users[cold[0]]) == top_count
+
+    rec_sys.add_user("V1", "vip", segment="vip")
+    rec_sys.add_user("V2", "vip", segment="vip")
+    rec_sys.add_purchase("V1", "P39")
+    assert rec_sys.recommend_products("V2", top_n=2)[0] == "P39"
+
+    # V1 has one niche product, so neighbours alone cannot fill 20 slots
+    recommended = rec_sys.recommend_products("V1", top_n=20)
+    assert len(recommended) == 20 and "P39" not in recommended
+    assert len(set(recommended)) == 20
+    assert popularity.overall.counts["P39"] == len(rec_sys.product_users["P39"])
+
+
+def test_popularity_only_invalidates_results_that_read_a_changed_ranking(rec_sys):
+    """Test that purchases below the read part of a ranking keep cache hits."""
+    from popularity import PopularityRanking
+
+    ranking = PopularityRanking()
+    for product_id, buyers in (("a", 5), ("b", 4), ("c", 1), ("d", 1)):
+        for _ in range(buyers):
+            ranking.increment(product_id)
+    assert ranking.top(2) == ["a", "b"]
+    assert not ranking.increment("d")  # d passes c, but nobody read that far
+    assert not ranking.increment("a")  # a stays first
+    assert ranking.increment("b") is False and ranking.increment("b") is False
+    assert ranking.increment("b")  # b overtakes a
+    assert not ranking.increment("a")  # already reported; nothing read since
+
+    rec_sys.build_popularity_index()
+    cache = rec_sys.enable_cache()
+    rec_sys.add_user("V1", "vip", segment="vip")
+    rec_sys.add_purchase("V1", "P39")
+    blended = rec_sys.recommend_products("V1", top_n=20)
+    full = rec_sys.recommend_products("U1", top_n=1)
+
+    # A purchase that leaves the bestsellers in place keeps both results
+    tail_product = rec_sys.popularity.overall.ranked[-1]
+    rec_sys.add_user("W1", "w")
+    rec_sys.add_purchase("W1", tail_product)
+    hits = cache.hits
+    assert rec_sys.recommend_products("V1", top_n=20) == blended
+    assert rec_sys.recommend_products("U1", top_n=1) == full
+    assert cache.hits == hits + 2
+    assert cache.versions.get(("popularity", None), 0) == 0
+
+    # Pushing a product to the top invalidates the blended result
+    for index in range(60):
+        rec_sys.add_user(f"X{index}", "x")
+        rec_sys.add_purchase(f"X{index}", tail_product)
+    assert cache.versions[("popularity", None)] > 0
+    invalidations = cache.invalidations
+    assert tail_product in rec_sys.recommend_products("V1", top_n=20)
+    assert cache.invalidations == invalidations + 1
+
+
+# Test the offline evaluation harness
+def test_holdout_splits():
+    """Test that holdouts never leak test items into training."""
+    from evaluation import leave_one_out, time_split
+
+    rows = [("A", "p1"), ("A", "p2"), ("B", "p1"), ("A", "p3"), ("A", "p1"), ("C", "p4"), ("B", "p5")]
+    train, test = leave_one_out(rows)
+    assert test == {"A": {"p3"}, "B": {"p5"}}
+    assert ("A", "p3") not in train and ("C", "p4") in train
+
+    train, test = time_split(rows, test_fraction=0.3)
+    assert train == rows[:4]
+    assert test == {"B": {"p5"}}
+
+
+def test_evaluation_is_consistent_across_workers():
+    """Test that parallel evaluation matches a serial run."""
+    from evaluation import evaluate
+    from synthetic_data import generate_purchases
+
+    rows = list(generate_purchases(4000, seed=2))
+    variants = [{"name": "knn", "neighbours": 5}, {"name": "pop", "popularity": True, "min_basket": float("inf")}]
+    serial = evaluate(rows, variants, ks=(3, 10), workers=1, chunk_size=50, measure_memory=False)
+    parallel = evaluate(rows, variants, ks=(3, 10), workers=2, chunk_size=50, measure_memory=True)
+
+    assert [(r["variant"], r["k"]) for r in serial] == [("knn", 3), ("knn", 10), ("pop", 3), ("pop", 10)]
+    for a, b in zip(serial, parallel):
+        assert (a["precision"], a["recall"], a["coverage"]) == (b["precision"], b["recall"], b["coverage"])
+    assert all(0 <= r["precision"] <= 1 and 0 <= r["coverage"] <= 1 for r in serial)
+    assert serial[1]["recall"] >= serial[0]["recall"]
+    assert parallel[0]["memory_mb"] > 0
+    assert serial[0]["latency"] == "per_user" and serial[0]["p99_ms"] > 0
+
+    batched = evaluate(rows, variants[:1], ks=(3,), backend="sparse", max_users=50, workers=1,
+                       measure_memory=False)
+    assert batched[0]["latency"] == "chunk_mean"